@@ -1,13 +1,30 @@
 from .cli import cli
 from .constants import PDGID_ERROR_VAL
-from .read import read_DAT
+from .histogram import histogram_DAT
+from .read import read_DAT, read_DAT_iter, read_events, summarize_DAT
 from .run import CorsikaRunner
 from .version import __logo__, __version__
-from .weights import add_weight_prompt, add_weight_prompt_per_event, get_weights
+from .weights import (
+    add_weight_prompt,
+    add_weight_prompt_per_event,
+    broadcast_to_particles,
+    get_weights,
+    get_weights_ensemble,
+    get_weights_models,
+    particle_event_codes,
+)
 
 __all__ = (
     "read_DAT",
+    "read_DAT_iter",
+    "read_events",
+    "summarize_DAT",
+    "histogram_DAT",
     "get_weights",
+    "get_weights_models",
+    "get_weights_ensemble",
+    "particle_event_codes",
+    "broadcast_to_particles",
     "add_weight_prompt",
     "add_weight_prompt_per_event",
     "CorsikaRunner",
@@ -0,0 +1,157 @@
+"""
+The `panama` DataFrame accessor, to calculate the additional columns of `read_DAT`
+only when they are used.
+
+After `read_DAT(..., additional_columns=False, drop_non_particles=False)`, the
+columns are available as `df.panama.energy`, `df.panama.pdgid`, ...
+They are calculated from `particle_description`, `px`, `py` and `pz` on first access
+and cached, as long as the rows of the DataFrame stay the same.
+Filtered DataFrames get their own (empty) cache.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from . import particle_table
+
+# the additional columns of `read_DAT`, in the order they are added
+DERIVED_COLUMNS = [
+    "corsikaid",
+    "hadron_gen",
+    "n_obs_level",
+    "is_mother",
+    "pdgid",
+    "mass",
+    "energy",
+    "zenith",
+]
+
+# the raw columns, the derived columns are calculated from
+_SOURCE_COLUMNS = ["particle_description", "px", "py", "pz"]
+
+
+def derive_column(name: str, get: Callable[[str], NDArray[Any]]) -> NDArray[Any]:
+    """
+    Calculates the additional column `name` (one of `DERIVED_COLUMNS`),
+    `get` returns the array of another (raw or derived) column.
+    """
+    if name == "corsikaid":
+        return (np.abs(get("particle_description")) // 1000).astype(int)
+    if name == "hadron_gen":
+        return ((np.abs(get("particle_description")) % 1000) // 10).astype(int)
+    if name == "n_obs_level":
+        return (np.abs(get("particle_description")) % 10).astype(int)
+    if name == "is_mother":
+        return get("particle_description") < 0
+    if name in ("pdgid", "mass"):
+        return particle_table.from_corsikaid(get("corsikaid"), name)
+    if name == "energy":
+        return pd.eval(
+            "sqrt(mass**2+px**2+py**2+pz**2)",
+            local_dict={name: get(name) for name in ("mass", "px", "py", "pz")},
+        )
+    if name == "zenith":
+        return pd.eval(
+            "arccos(pz/sqrt(px**2+py**2+pz**2))",
+            local_dict={name: get(name) for name in ("px", "py", "pz")},
+        )
+
+    raise ValueError(f"Unknown column {name}, available are {DERIVED_COLUMNS}.")
+
+
+@pd.api.extensions.register_dataframe_accessor("panama")
+class PanamaAccessor:
+    """
+    Lazily calculated additional columns of a particle DataFrame.
+    Columns which are already in the DataFrame are returned as they are.
+    """
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self._cache: dict[str, NDArray[Any]] = {}
+        self._key: tuple[Any, ...] | None = None
+
+    def _cache_key(self) -> tuple[Any, ...]:
+        """
+        Identifies the rows and source columns, the cache is valid for.
+        In-place filtering (e.g. `drop(..., inplace=True)`) creates a new index
+        and reassigning a source column new data.
+        """
+        return (
+            id(self._df.index),
+            len(self._df),
+            *(
+                self._df[name].to_numpy(copy=False).__array_interface__["data"][0]
+                for name in _SOURCE_COLUMNS
+                if name in self._df
+            ),
+        )
+
+    def _get(self, name: str) -> NDArray[Any]:
+        if name in self._df.columns:
+            return self._df[name].to_numpy(copy=False)
+
+        if name not in self._cache:
+            self._cache[name] = derive_column(name, self._get)
+
+        return self._cache[name]
+
+    def get(self, name: str) -> pd.Series:
+        """
+        The column `name` (one of `DERIVED_COLUMNS`), calculated on first access.
+        """
+        if name in self._df.columns:
+            return self._df[name]
+
+        key = self._cache_key()
+        if key != self._key:
+            self._cache.clear()
+            self._key = key
+
+        return pd.Series(self._get(name), index=self._df.index, name=name, copy=False)
+
+    @property
+    def corsikaid(self) -> pd.Series:
+        """The CORSIKA7 id of the particles."""
+        return self.get("corsikaid")
+
+    @property
+    def hadron_gen(self) -> pd.Series:
+        """The hadronic generation of the particles."""
+        return self.get("hadron_gen")
+
+    @property
+    def n_obs_level(self) -> pd.Series:
+        """The number of the observation level."""
+        return self.get("n_obs_level")
+
+    @property
+    def is_mother(self) -> pd.Series:
+        """True for the mother and grandmother rows of the EHIST option."""
+        return self.get("is_mother")
+
+    @property
+    def pdgid(self) -> pd.Series:
+        """The PDG id of the particles, `PDGID_ERROR_VAL` if they are none."""
+        return self.get("pdgid")
+
+    @property
+    def mass(self) -> pd.Series:
+        """The mass of the particles in GeV."""
+        return self.get("mass")
+
+    @property
+    def energy(self) -> pd.Series:
+        """The total energy of the particles in GeV."""
+        return self.get("energy")
+
+    @property
+    def zenith(self) -> pd.Series:
+        """The zenith angle of the momentum of the particles."""
+        return self.get("zenith")
@@ -0,0 +1,135 @@
+"""
+The mother table, a normalized form of the mother columns of the EHIST option.
+
+With `read_DAT(..., mother_table=True)` the mother information is not added as
+columns to every particle, but returned as a fourth DataFrame, which only has a row
+for particles with a mother and only stores what can't be looked up in
+`panama.particle_table`. It is indexed like the particle DataFrame, so the
+mother columns can be joined on demand with `get_mother_columns`.
+"""
+
+from __future__ import annotations
+
+from math import inf
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from . import particle_table
+from .constants import PDGID_ERROR_VAL
+
+# the columns stored in the mother table
+MOTHER_TABLE_COLUMNS = [
+    "mother_hadr_gen",
+    "mother_pdgid",
+    "mother_energy",
+    "grandmother_pdgid",
+    "mother_pdgid_cleaned",
+]
+
+# all columns, which can be joined with `get_mother_columns`
+MOTHER_COLUMNS = [
+    "has_mother",
+    "mother_hadr_gen",
+    "mother_pdgid",
+    "mother_energy",
+    "mother_mass",
+    "grandmother_pdgid",
+    "mother_lifetimes",
+    "mother_is_resonance",
+    "mother_has_charm",
+    "mother_pdgid_cleaned",
+    "mother_lifetime_cleaned",
+    "mother_mass_cleaned",
+    "mother_energy_cleaned",
+]
+
+# the fill values of the stored columns for particles without mother
+_MISSING = {
+    "mother_hadr_gen": np.nan,
+    "mother_pdgid": PDGID_ERROR_VAL,
+    "mother_energy": np.nan,
+    "grandmother_pdgid": PDGID_ERROR_VAL,
+    "mother_pdgid_cleaned": PDGID_ERROR_VAL,
+}
+
+
+def get_mother_columns(
+    df_particles: pd.DataFrame,
+    df_mothers: pd.DataFrame,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Joins the mother table to the particles. The result has the same columns
+    as `add_mother_columns` (and `panama.prompt.add_cleaned_mother_cols`) would add,
+    but only the requested ones are calculated.
+
+    Parameters
+    ----------
+    df_particles: pd.DataFrame
+        The particle DataFrame as returned by `read_DAT`.
+    df_mothers: pd.DataFrame
+        The mother table of these particles, as returned by `read_DAT(..., mother_table=True)`.
+    columns: list[str] | None
+        The columns to calculate, out of `MOTHER_COLUMNS`.
+        If None, all of them are calculated. (default: None)
+
+    Returns
+    -------
+    A DataFrame with the index of `df_particles` and the requested columns.
+    Particles without mother get `PDGID_ERROR_VAL` as pdgids and NaN as mother
+    energy, mass and hadronic generation, like with `add_mother_columns`.
+    """
+    if columns is None:
+        columns = MOTHER_COLUMNS
+
+    unknown = [name for name in columns if name not in MOTHER_COLUMNS]
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown mother columns {unknown}, available are {MOTHER_COLUMNS}."
+        )
+
+    positions = df_mothers.index.get_indexer(df_particles.index)
+    has_mother = positions >= 0
+
+    cache: dict[str, NDArray[Any]] = {"has_mother": has_mother}
+    float_dtype = df_mothers["mother_energy"].dtype
+
+    def get(name: str) -> NDArray[Any]:
+        if name in cache:
+            return cache[name]
+
+        if name in _MISSING:
+            stored = df_mothers[name].to_numpy()
+            values = np.full(len(positions), _MISSING[name], dtype=stored.dtype)
+            values[has_mother] = stored[positions[has_mother]]
+        elif name == "mother_mass":
+            values = _lookup(get("mother_pdgid"), "mass", float_dtype)
+            values[~has_mother] = np.nan
+        elif name == "mother_lifetimes":
+            values = _lookup(get("mother_pdgid"), "lifetime", float_dtype)
+        elif name == "mother_is_resonance":
+            values = _lookup(get("mother_pdgid"), "is_resonance")
+        elif name == "mother_has_charm":
+            values = _lookup(get("mother_pdgid"), "has_charm")
+        elif name == "mother_lifetime_cleaned":
+            values = _lookup(get("mother_pdgid_cleaned"), "lifetime")
+        elif name == "mother_mass_cleaned":
+            values = _lookup(get("mother_pdgid_cleaned"), "mass")
+        elif name == "mother_energy_cleaned":
+            values = get("mother_energy").copy()
+            values[get("mother_pdgid_cleaned") == PDGID_ERROR_VAL] = inf
+
+        cache[name] = values
+        return values
+
+    return pd.DataFrame(
+        {name: get(name) for name in columns}, index=df_particles.index, copy=False
+    )
+
+
+def _lookup(pdgids: NDArray[Any], name: str, dtype: Any = None) -> NDArray[Any]:
+    values = particle_table.from_pdgid(pdgids, name)
+    return values if dtype is None else values.astype(dtype, copy=False)
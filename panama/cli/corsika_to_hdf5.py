@@ -43,6 +43,12 @@ from ..version import __distribution__, __logo__
     is_flag=True,
     help="Drop all rows which don't really represent a particle. (Like decay or additional information)",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    help="Number of processes used to read the input files in parallel.",
+)
 @click.option("--debug", "-d", default=False, is_flag=True, help="Enable debug output")
 def hdf5(
     input: list[Path],
@@ -52,6 +58,7 @@ def hdf5(
     mother: bool,
     dropmother: bool,
     dropnonparticles: bool,
+    jobs: int,
     debug: bool,
 ) -> None:
     """
@@ -94,6 +101,7 @@ def hdf5(
         mother_columns=mother,
         drop_mothers=dropmother,
         drop_non_particles=dropnonparticles,
+        n_workers=jobs,
     )
 
     run_header.to_hdf(output, key="run_header", complevel=comp)
@@ -39,6 +39,13 @@ DEFAULT_EVENT_HEADER_FEATURES = [
     "sybill_cross_section_flag",
     "explicit_charm_generation_flag",
 ]
+DEFAULT_INDEX_FEATURES = [
+    "particle_id",
+    "total_energy",
+    "first_interaction_height",
+    "zenith",
+    "azimuth",
+]
 CORSIKA_FIELD_BYTE_LEN = 4
 
 PDGID_ERROR_VAL = 0
@@ -0,0 +1,460 @@
+"""
+Vectorized access to the subblocks of CORSIKA7 DAT files.
+
+Instead of iterating over the events, like `pycorsikaio` does, the whole file
+is memory mapped and the subblocks are located with vectorized scans,
+so the Python overhead does not depend on the number of events.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from corsikaio.io import is_gzip, is_zstd, open_compressed
+from corsikaio.subblocks import (
+    event_header_types,
+    parse_run_header,
+    particle_data_dtype,
+)
+from numpy.typing import NDArray
+
+from .constants import CORSIKA_FIELD_BYTE_LEN, DEFAULT_INDEX_FEATURES
+
+#: number of 4 byte words in one subblock
+BLOCK_SIZE_WORDS = 273
+#: size of one subblock in bytes
+BLOCK_SIZE_BYTES = BLOCK_SIZE_WORDS * CORSIKA_FIELD_BYTE_LEN
+#: size of the fortran record markers in bytes
+RECORD_MARKER_BYTES = 4
+#: number of words of one particle in a particle data subblock
+PARTICLE_SIZE_WORDS = len(particle_data_dtype.names)
+#: number of particles in one particle data subblock
+PARTICLES_PER_BLOCK = BLOCK_SIZE_WORDS // PARTICLE_SIZE_WORDS
+
+RUNH, EVTH, EVTE, RUNE, LONG = np.frombuffer(b"RUNHEVTHEVTERUNELONG", dtype=np.uint32)
+
+
+class DATFile:
+    """
+    A CORSIKA7 DAT file, memory mapped as an array of subblocks.
+
+    Uncompressed files are memory mapped, so only the parts which are accessed are
+    actually read from disk. Compressed files are decompressed into memory.
+    The file can be written with or without the fortran record markers.
+
+    Attributes
+    ----------
+    path : Path
+        Path of the DAT file.
+    records : np.ndarray
+        float32 array of shape (n_records, blocks_per_record, 273),
+        a view on the subblocks of the file, without record markers.
+    run_header : np.void
+        The parsed run header, as returned by `pycorsikaio`.
+    version : float
+        The CORSIKA version of the file, truncated after the first digit,
+        like the keys of `corsikaio.subblocks.event_header_types`.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+
+        data = None
+        if is_gzip(self.path) or is_zstd(self.path):
+            with open_compressed(self.path) as f:
+                data = f.read()
+            start = data[:RECORD_MARKER_BYTES]
+        else:
+            with open(self.path, "rb") as f:
+                start = f.read(RECORD_MARKER_BYTES)
+
+        if start == b"RUNH":
+            # no fortran record markers
+            marker_bytes = 0
+            record_bytes = BLOCK_SIZE_BYTES
+        else:
+            marker_bytes = RECORD_MARKER_BYTES
+            record_bytes = int(np.frombuffer(start, dtype=np.int32)[0])
+
+        raw: NDArray[Any]
+        if data is None:
+            raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+        else:
+            raw = np.frombuffer(data, dtype=np.uint8)
+
+        record_size = record_bytes + 2 * marker_bytes
+        if record_bytes % BLOCK_SIZE_BYTES != 0 or raw.shape[0] % record_size != 0:
+            raise OSError(f"{self.path} seems to be truncated")
+
+        self._record_size = record_size
+        self._marker_bytes = marker_bytes
+        self.blocks_per_record = record_bytes // BLOCK_SIZE_BYTES
+
+        self.records = (
+            raw.reshape(-1, record_size)[:, marker_bytes : marker_bytes + record_bytes]
+            .view(np.float32)
+            .reshape(-1, self.blocks_per_record, BLOCK_SIZE_WORDS)
+        )
+
+        if self[0][:1].view(np.uint32)[0] != RUNH:
+            raise ValueError(f'{self.path} does not start with b"RUNH"')
+
+        self.run_header = parse_run_header(self[0].tobytes())[0]
+        self.version = float(str(self.run_header["version"])[:3])
+
+    def __len__(self) -> int:
+        return self.records.shape[0] * self.blocks_per_record
+
+    def __getitem__(self, idx: int | NDArray[Any]) -> NDArray[Any]:
+        """
+        Returns the subblock(s) with the (flat) block number(s) `idx`.
+        Only the requested blocks are read.
+        """
+        return self.records[idx // self.blocks_per_record, idx % self.blocks_per_record]
+
+    @property
+    def tags(self) -> NDArray[Any]:
+        """
+        The first word of each subblock, interpreted as uint32, which
+        can be compared to the `RUNH`, `EVTH`, `EVTE`, `RUNE` and `LONG` markers.
+        """
+        return self.records[:, :, 0].view(np.uint32).reshape(-1)
+
+    def byte_offsets(self, idx: int | NDArray[Any]) -> NDArray[Any]:
+        """
+        Returns the position(s) in bytes of the subblock(s) `idx` in the (uncompressed) file.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        return (
+            (idx // self.blocks_per_record) * self._record_size
+            + self._marker_bytes
+            + (idx % self.blocks_per_record) * BLOCK_SIZE_BYTES
+        )
+
+    def block_numbers(self, offsets: int | NDArray[Any]) -> NDArray[Any]:
+        """
+        Inverse of `byte_offsets`, returns the block number(s) at the given position(s) in bytes.
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        return (offsets // self._record_size) * self.blocks_per_record + (
+            offsets % self._record_size - self._marker_bytes
+        ) // BLOCK_SIZE_BYTES
+
+    def scan(self) -> tuple[NDArray[Any], NDArray[Any], NDArray[Any], NDArray[Any]]:
+        """
+        Locates the subblocks of all events with vectorized scans over the block tags.
+
+        Returns
+        -------
+        A tuple (evth, evte, particle_blocks, particle_block_event):
+            evth: np.ndarray
+                Block numbers of the event headers
+            evte: np.ndarray
+                Block numbers of the event ends
+            particle_blocks: np.ndarray
+                Block numbers of all particle data subblocks
+            particle_block_event: np.ndarray
+                The event (as position in `evth`) each particle data subblock belongs to
+        """
+        tags = self.tags
+
+        rune = np.flatnonzero(tags == RUNE)
+        if len(rune) == 0:
+            raise OSError(f"{self.path} seems to be truncated")
+        # everything after the run end is just padding
+        tags = tags[: rune[0]]
+
+        is_evth = tags == EVTH
+        is_evte = tags == EVTE
+
+        n_evth = np.cumsum(is_evth)
+        open_events = n_evth - np.cumsum(is_evte)
+        if np.any((open_events < 0) | (open_events > 1)) or open_events[-1] != 0:
+            raise OSError(f"{self.path}: Expected EVTE block after each EVTH")
+
+        particle_blocks = np.flatnonzero((open_events == 1) & ~is_evth & (tags != LONG))
+
+        return (
+            np.flatnonzero(is_evth),
+            np.flatnonzero(is_evte),
+            particle_blocks,
+            n_evth[particle_blocks] - 1,
+        )
+
+    def event_numbers(self, evth: NDArray[Any]) -> NDArray[Any]:
+        """
+        Returns the event numbers of the event headers in the blocks `evth`.
+        """
+        word = event_header_types[self.version].fields["event_number"][1]
+        return self[evth][:, word // CORSIKA_FIELD_BYTE_LEN].astype(int)
+
+    def read_particles(
+        self,
+        particle_blocks: NDArray[Any],
+        particle_block_event: NDArray[Any],
+    ) -> tuple[NDArray[Any], NDArray[Any], NDArray[Any]]:
+        """
+        Reads the particles of the given particle data subblocks, as returned by `scan`.
+        Empty rows (padding at the end of an event) are removed.
+
+        Returns
+        -------
+        A tuple (particles, particle_event, particle_number):
+            particles: np.ndarray
+                float32 array of shape (n_particles, 7),
+                use `.view(particle_data_dtype)` to get the named fields.
+            particle_event: np.ndarray
+                The event each particle belongs to, as given by `particle_block_event`.
+            particle_number: np.ndarray
+                The position of the particle in its event.
+        """
+        particles = self[particle_blocks].reshape(-1, PARTICLE_SIZE_WORDS)
+        particle_event = np.repeat(particle_block_event, PARTICLES_PER_BLOCK)
+
+        # position of each block in its event
+        is_first = np.ones(len(particle_block_event), dtype=bool)
+        is_first[1:] = particle_block_event[1:] != particle_block_event[:-1]
+        first = np.flatnonzero(is_first)
+        block_number = np.arange(len(particle_block_event)) - np.repeat(
+            first, np.diff(np.append(first, len(particle_block_event)))
+        )
+        particle_number = (
+            block_number[:, None] * PARTICLES_PER_BLOCK + np.arange(PARTICLES_PER_BLOCK)
+        ).reshape(-1)
+
+        not_empty = particles[:, 0] != 0
+        return (
+            particles[not_empty],
+            particle_event[not_empty],
+            particle_number[not_empty],
+        )
+
+
+def read_run_header(path: Path | str) -> np.void:
+    """
+    Reads only the run header of a DAT file, which is always the first subblock.
+
+    Parameters
+    ----------
+    path : Path | str
+        Path of the DAT file.
+
+    Returns
+    -------
+    The parsed run header, as returned by `pycorsikaio`.
+    """
+    with open_compressed(path) as f:
+        data = f.read(RECORD_MARKER_BYTES + BLOCK_SIZE_BYTES)
+
+    if data[:RECORD_MARKER_BYTES] != b"RUNH":
+        data = data[RECORD_MARKER_BYTES:]
+    else:
+        data = data[:BLOCK_SIZE_BYTES]
+
+    if data[:4] != b"RUNH":
+        raise ValueError(f'{path} does not start with b"RUNH"')
+
+    return parse_run_header(data)[0]
+
+
+def read_run_headers(
+    files: list[Path], n_threads: int = 8, catalog: Path | str | None = None
+) -> list[np.void]:
+    """
+    Reads the run headers of many DAT files concurrently, see `read_run_header`.
+
+    Parameters
+    ----------
+    files : list[Path]
+        The DAT files.
+    n_threads : int
+        Number of threads used to read the headers, since this is mostly
+        waiting for the filesystem. (default: 8)
+    catalog : Path | str | None
+        If given, the run headers are stored in this (npz) file,
+        together with the size and modification time of each DAT file.
+        If the catalog already exists, the headers of unchanged files are taken
+        from it and the DAT files are not opened at all.
+        (default: None)
+
+    Returns
+    -------
+    A list with the parsed run header of each file.
+    """
+    stats = [Path(file).stat() for file in files]
+    keys = [
+        (str(Path(file).absolute()), st.st_size, st.st_mtime_ns)
+        for file, st in zip(files, stats)
+    ]
+
+    cached: dict[tuple[str, int, int], NDArray[Any]] = {}
+    if catalog is not None and Path(catalog).exists():
+        with np.load(catalog) as stored:
+            cached = dict(
+                zip(
+                    zip(
+                        stored["paths"].tolist(),
+                        stored["sizes"].tolist(),
+                        stored["mtimes"].tolist(),
+                    ),
+                    stored["headers"],
+                )
+            )
+
+    missing = [idx for idx, key in enumerate(keys) if key not in cached]
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        for idx, run_header in zip(
+            missing, executor.map(read_run_header, [files[idx] for idx in missing])
+        ):
+            cached[keys[idx]] = np.frombuffer(run_header.tobytes(), dtype=np.float32)
+
+    if catalog is not None and len(missing) > 0:
+        with open(catalog, "wb") as f:
+            np.savez(
+                f,
+                paths=np.array([key[0] for key in cached]),
+                sizes=np.array([key[1] for key in cached], dtype=np.int64),
+                mtimes=np.array([key[2] for key in cached], dtype=np.int64),
+                headers=np.array(list(cached.values()), dtype=np.float32),
+            )
+
+    return [parse_run_header(cached[key].tobytes())[0] for key in keys]
+
+
+def index_path(path: Path | str) -> Path:
+    """
+    Returns the path of the sidecar index file of the DAT file `path`,
+    which is a hidden file next to it (so it is not matched by e.g. `DAT*`).
+    """
+    path = Path(path)
+    return path.parent / f".{path.name}.index.npz"
+
+
+def build_index(
+    path: Path | str, features: list[str] | None = None, save: bool = True
+) -> pd.DataFrame:
+    """
+    Builds the event index of a DAT file, with the positions (in bytes)
+    of the subblocks of every event and some fields of the event header.
+    If `save` is True, it is stored in the sidecar file `index_path(path)`.
+
+    Parameters
+    ----------
+    path : Path | str
+        Path of the DAT file.
+    features : list[str] | None
+        Names of the event header fields to store in the index,
+        corresponding to the naming of `pycorsikaio`.
+        If None, uses `DEFAULT_INDEX_FEATURES`.
+    save : bool
+        Whether to save the index in the sidecar file. (default: True)
+
+    Returns
+    -------
+    A DataFrame indexed by `run_number` and `event_number` with the columns
+        evth_offset: position of the event header
+        particles_offset: position of the first particle block
+        particles_end_offset: position after the last particle block
+        evte_offset: position of the event end
+    and the header `features`.
+    Events without particles have `particles_offset == particles_end_offset`.
+    """
+    if features is None:
+        features = DEFAULT_INDEX_FEATURES
+
+    dat = DATFile(path)
+    evth, evte, particle_blocks, particle_block_event = dat.scan()
+
+    # first and last+1 particle block of each event
+    block_starts = np.searchsorted(particle_block_event, np.arange(len(evth) + 1))
+    has_particles = np.diff(block_starts) > 0
+    first = evth + 1
+    end = evth + 1
+    first[has_particles] = particle_blocks[block_starts[:-1][has_particles]]
+    end[has_particles] = particle_blocks[block_starts[1:][has_particles] - 1] + 1
+
+    headers = dat[evth].view(event_header_types[dat.version])[:, 0]
+
+    columns = {
+        "run_number": np.full(len(evth), int(dat.run_header["run_number"])),
+        "event_number": dat.event_numbers(evth),
+        "evth_offset": dat.byte_offsets(evth),
+        "particles_offset": dat.byte_offsets(first),
+        "particles_end_offset": dat.byte_offsets(end),
+        "evte_offset": dat.byte_offsets(evte),
+    }
+    for feature in features:
+        columns[feature] = headers[feature]
+
+    if save:
+        stat = dat.path.stat()
+        with open(index_path(dat.path), "wb") as f:
+            np.savez(
+                f,
+                size=stat.st_size,
+                mtime=stat.st_mtime_ns,
+                **columns,
+            )
+
+    return pd.DataFrame(columns).set_index(["run_number", "event_number"])
+
+
+def read_index(
+    files: list[Path], features: list[str] | None = None, build: bool = True
+) -> pd.DataFrame:
+    """
+    Reads the event indices of the DAT files, see `build_index`.
+    Missing or outdated index files are built (and saved), if `build` is True.
+
+    Parameters
+    ----------
+    files : list[Path]
+        The DAT files.
+    features : list[str] | None
+        Header fields to include, see `build_index`.
+        An existing index without these fields is rebuilt.
+    build : bool
+        Whether to build missing indices, otherwise a FileNotFoundError is raised.
+        (default: True)
+
+    Returns
+    -------
+    The concatenated indices of all files, with an additional column `file`.
+    """
+    if features is None:
+        features = DEFAULT_INDEX_FEATURES
+
+    indices = []
+    for file in files:
+        stat = Path(file).stat()
+        sidecar = index_path(file)
+
+        index = None
+        if sidecar.exists():
+            with np.load(sidecar) as stored:
+                if (
+                    int(stored["size"]) == stat.st_size
+                    and int(stored["mtime"]) == stat.st_mtime_ns
+                    and all(feature in stored for feature in features)
+                ):
+                    index = pd.DataFrame(
+                        {
+                            key: stored[key]
+                            for key in stored.files
+                            if key not in ("size", "mtime")
+                        }
+                    ).set_index(["run_number", "event_number"])
+
+        if index is None:
+            if not build:
+                raise FileNotFoundError(f"No (valid) index found for {file}")
+            index = build_index(file, features=features)
+
+        index["file"] = str(file)
+        indices.append(index)
+
+    return pd.concat(indices)
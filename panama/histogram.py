@@ -0,0 +1,401 @@
+"""
+Weighted histograms of particle columns (e.g. the muon energy or zenith at
+observation level), filled chunk by chunk, so a whole production never has to be
+kept in memory.
+
+The weight of a shower (see `panama.weights.get_weights`) is divided by the number of
+simulated showers of its primary and energy range, which is only known after the
+last chunk. So the histograms are filled separately for each of these generation
+groups with the not yet normalized weights and only divided by the number of
+showers when combining them. This gives the same result as weighting all
+particles with `get_weights` at once, as long as the energy ranges of the runs
+of each primary don't overlap.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Tuple  # noqa: UP035
+
+import numpy as np
+import pandas as pd
+from fluxcomp import CosmicRayFlux
+from numpy.typing import ArrayLike, NDArray
+from particle import PDGID
+from tqdm import tqdm
+
+from . import particle_table, ragged
+from .read import _get_files, read_DAT_iter
+from .weights import DEFAULT_FLUX, _energy_norm, _model_flux
+
+
+class WeightedHistogram:
+    """
+    An N-dimensional histogram with the sum of weights and the sum of squared weights
+    of each bin. The bins of each dimension include their lower edge,
+    the last one also its upper edge, like `numpy.histogramdd`.
+    """
+
+    def __init__(self, bins: Mapping[str, ArrayLike]) -> None:
+        self.edges = {
+            column: np.asarray(edges, dtype=float) for column, edges in bins.items()
+        }
+        shape = tuple(len(edges) - 1 for edges in self.edges.values())
+        self.sumw = np.zeros(shape)
+        self.sumw2 = np.zeros(shape)
+
+    @property
+    def columns(self) -> list[str]:
+        """The columns of the dimensions."""
+        return list(self.edges)
+
+    @property
+    def errors(self) -> NDArray[Any]:
+        """The statistical uncertainty of each bin, sqrt(sumw2)."""
+        return np.sqrt(self.sumw2)
+
+    def _bin_numbers(self, columns: dict[str, NDArray[Any]]) -> NDArray[Any]:
+        """
+        The flat bin number of each row, -1 for rows outside of the histogram.
+        """
+        indices = []
+        inside = np.ones(len(next(iter(columns.values()))), dtype=bool)
+        for column, edges in self.edges.items():
+            values = columns[column]
+            index = np.searchsorted(edges, values, side="right") - 1
+            index[values == edges[-1]] = len(edges) - 2
+            valid = (index >= 0) & (index < len(edges) - 1)
+            inside &= valid
+            indices.append(np.where(valid, index, 0))
+
+        numbers = np.ravel_multi_index(indices, self.sumw.shape)
+        numbers[~inside] = -1
+        return numbers
+
+    def fill(self, columns: dict[str, ArrayLike], weights: ArrayLike) -> None:
+        """
+        Fills the rows of `columns` (a dict or DataFrame with the columns of the
+        histogram) with `weights`.
+        """
+        data = {column: np.asarray(columns[column]) for column in self.edges}
+        weights = np.asarray(weights, dtype=float)
+        numbers = self._bin_numbers(data)
+
+        inside = numbers >= 0
+        numbers = numbers[inside]
+        weights = weights[inside]
+        self.sumw += np.bincount(
+            numbers, weights=weights, minlength=self.sumw.size
+        ).reshape(self.sumw.shape)
+        self.sumw2 += np.bincount(
+            numbers, weights=weights**2, minlength=self.sumw.size
+        ).reshape(self.sumw.shape)
+
+    def __iadd__(self, other: WeightedHistogram) -> WeightedHistogram:
+        if self.columns != other.columns or not all(
+            np.array_equal(self.edges[column], other.edges[column])
+            for column in self.columns
+        ):
+            raise ValueError("Only histograms with the same bins can be added.")
+
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+        return self
+
+    def scaled(self, factor: float) -> WeightedHistogram:
+        """
+        A copy with all weights multiplied by `factor`.
+        """
+        result = WeightedHistogram(self.edges)
+        result.sumw = self.sumw * factor
+        result.sumw2 = self.sumw2 * factor**2
+        return result
+
+
+# primary particle_id, energy_min, energy_max and energy_spectrum_slope
+# (typing.Tuple, the alias is evaluated at runtime, also on python 3.8)
+_Group = Tuple[float, float, float, float]  # noqa: UP006
+
+
+class _GroupedHistograms:
+    """
+    The histograms of each generation group with the weights not yet divided by the
+    number of showers of the group, and these numbers of showers.
+    """
+
+    def __init__(
+        self,
+        bins: dict[str, ArrayLike],
+        model: CosmicRayFlux,
+        proton_only: bool,
+        groups: dict[PDGID, tuple[int, int]] | None,
+    ) -> None:
+        self.bins = bins
+        self.model = model
+        self.proton_only = proton_only
+        self.groups = groups
+        self.histograms: dict[_Group, WeightedHistogram] = {}
+        self.n_events: dict[_Group, int] = {}
+
+    def fill(
+        self, df_run: pd.DataFrame, df_event: pd.DataFrame, df_particles: pd.DataFrame
+    ) -> None:
+        """
+        Fills the particles of one chunk, as yielded by `panama.read_DAT_iter`,
+        in the ragged form or indexed by run, event and particle number.
+        """
+        run_numbers = df_event.index.get_level_values("run_number")
+        generation = df_run.loc[
+            run_numbers, ["energy_min", "energy_max", "energy_spectrum_slope"]
+        ].to_numpy()
+        keys = np.column_stack([df_event["particle_id"].to_numpy(), generation])
+        energy = df_event["total_energy"].to_numpy()
+
+        unique_keys, event_group = np.unique(keys, axis=0, return_inverse=True)
+        event_group = event_group.reshape(-1)
+        event_weights = np.zeros(len(df_event))
+
+        chunk_groups: list[_Group] = [
+            (float(pid), float(emin), float(emax), float(slope))
+            for pid, emin, emax, slope in unique_keys
+        ]
+        for group_idx, group in enumerate(chunk_groups):
+            primary_pid, emin, emax, slope = group
+            in_group = event_group == group_idx
+
+            pdgid = PDGID(particle_table.from_corsikaid([primary_pid], "pdgid")[0])
+            flux = _model_flux(
+                self.model, pdgid, energy[in_group], self.proton_only, self.groups
+            )
+            pdf = energy[in_group] ** slope / _energy_norm(emin, emax, slope)
+            event_weights[in_group] = flux / pdf
+
+            self.n_events[group] = self.n_events.get(group, 0) + int(in_group.sum())
+            if group not in self.histograms:
+                self.histograms[group] = WeightedHistogram(self.bins)
+
+        if len(df_particles.columns) == 0:
+            return
+
+        # the event (row of df_event) of each particle
+        if "particle_offset" in df_event:
+            particle_event = ragged.event_positions(
+                df_event["particle_offset"].to_numpy(), len(df_particles)
+            )
+        else:
+            particle_event = df_event.index.get_indexer(
+                df_particles.index.droplevel("particle_number")
+            )
+
+        weights = event_weights[particle_event]
+        particle_group = event_group[particle_event]
+        for group_idx, group in enumerate(chunk_groups):
+            in_group = particle_group == group_idx
+            self.histograms[group].fill(
+                {
+                    column: df_particles[column].to_numpy()[in_group]
+                    for column in self.bins
+                },
+                weights[in_group],
+            )
+
+    def merge(self, other: _GroupedHistograms) -> None:
+        """
+        Adds the showers and histograms of `other`.
+        """
+        for group, histogram in other.histograms.items():
+            self.n_events[group] = self.n_events.get(group, 0) + other.n_events[group]
+            if group in self.histograms:
+                self.histograms[group] += histogram
+            else:
+                self.histograms[group] = histogram
+
+    def result(self) -> WeightedHistogram:
+        """
+        The histogram of all groups, with the weights normalized
+        to the number of showers of their group.
+        """
+        groups = list(self.histograms)
+        _check_generation(groups)
+
+        result = WeightedHistogram(self.bins)
+        for group in groups:
+            result += self.histograms[group].scaled(1 / self.n_events[group])
+        return result
+
+
+def _check_generation(groups: list[_Group]) -> None:
+    """
+    Raises a ValueError, if the energy ranges of the generation groups of a primary
+    overlap, since their combined generation pdf (see `panama.weights.get_weights`)
+    depends on the number of showers of all groups, which are only known at the end.
+    """
+    for primary_pid in {group[0] for group in groups}:
+        intervals = sorted(group[1:] for group in groups if group[0] == primary_pid)
+        # sorted by the lower edge, an interval overlaps with an earlier one,
+        # if it starts below the highest upper edge of all earlier ones
+        highest = intervals[0]
+        for interval in intervals[1:]:
+            if interval[0] < highest[1]:
+                raise ValueError(
+                    f"The energy ranges {pd.Interval(*highest[:2])} and {pd.Interval(*interval[:2])} "
+                    f"of the primary {primary_pid:.0f} overlap, which can't be histogrammed chunk by chunk, "
+                    "use `panama.get_weights` instead."
+                )
+            if interval[1] > highest[1]:
+                highest = interval
+
+
+def histogram(
+    chunks: Iterable[tuple[pd.DataFrame, ...]],
+    bins: dict[str, ArrayLike],
+    model: CosmicRayFlux = DEFAULT_FLUX,
+    proton_only: bool = False,
+    groups: dict[PDGID, tuple[int, int]] | None = None,
+) -> WeightedHistogram:
+    """
+    Fills a weighted histogram of particle columns chunk by chunk.
+
+    Parameters
+    ----------
+    chunks: Iterable[tuple[pd.DataFrame, ...]]
+        Tuples (run_header, event_header, particles) as returned by `panama.read_DAT`,
+        e.g. from `panama.read_DAT_iter` or from the chunks of a converted store.
+        Every shower must be in exactly one chunk, since the weights are
+        normalized to the number of showers in the event DataFrames.
+    bins: dict[str, ArrayLike]
+        The bin edges of each dimension, by the particle column to histogram,
+        e.g. `{"energy": np.geomspace(1e2, 1e6, 41)}`.
+    model, proton_only, groups:
+        The flux model to weight the showers to, see `panama.weights.get_weights`.
+
+    Returns
+    -------
+    The `WeightedHistogram` of all particles.
+    """
+    grouped = _GroupedHistograms(bins, model, proton_only, groups)
+    for df_run, df_event, df_particles, *_ in chunks:
+        grouped.fill(df_run, df_event, df_particles)
+
+    return grouped.result()
+
+
+def histogram_DAT(
+    files: Path | str | list[Path] | None = None,
+    glob: str | None = None,
+    bins: dict[str, ArrayLike] | None = None,
+    model: CosmicRayFlux = DEFAULT_FLUX,
+    proton_only: bool = False,
+    groups: dict[PDGID, tuple[int, int]] | None = None,
+    particle_filter: str | None = None,
+    chunk_events: int | None = 1000,
+    chunk_particles: int | None = None,
+    n_workers: int = 1,
+    drop_mothers: bool = True,
+    drop_non_particles: bool = True,
+    memmap: bool = False,
+) -> WeightedHistogram:
+    """
+    Fills a weighted histogram of particle columns directly from CORSIKA DAT files.
+    The files are read chunk by chunk (see `panama.read_DAT_iter`) in the ragged form,
+    only keeping the columns of the histogram.
+
+    Parameters
+    ----------
+    files: Path or List of Paths
+        Single or list of DAT files to read, see `panama.read_DAT`.
+    glob:
+        Globbing expression like `path/to/corsika/output/DAT*`, see `panama.read_DAT`.
+    bins: dict[str, ArrayLike]
+        The bin edges of each dimension, by the particle column to histogram,
+        e.g. `{"energy": np.geomspace(1e2, 1e6, 41), "zenith": np.linspace(0, 1.5, 16)}`.
+    model, proton_only, groups:
+        The flux model to weight the showers to, see `panama.weights.get_weights`.
+    particle_filter: str | None
+        Query string selecting the particles to fill, e.g. `"abs(pdgid) == 13"`.
+        (default: None)
+    chunk_events, chunk_particles:
+        The size of the chunks, see `panama.read_DAT_iter`.
+    n_workers: int
+        Number of processes, each of which fills the histograms of whole files.
+        They are added up at the end. (default: 1)
+    drop_mothers, drop_non_particles, memmap:
+        See `panama.read_DAT`.
+
+    Returns
+    -------
+    The `WeightedHistogram` of all selected particles.
+    """
+    if bins is None or len(bins) == 0:
+        raise ValueError("The bins of at least one column have to be given.")
+
+    fill = partial(
+        _fill_files,
+        bins=bins,
+        model=model,
+        proton_only=proton_only,
+        groups=groups,
+        particle_filter=particle_filter,
+        chunk_events=chunk_events,
+        chunk_particles=chunk_particles,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        memmap=memmap,
+    )
+    files = _get_files(files, glob)
+    if len(files) == 0:
+        raise ValueError("No files to read.")
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(
+                tqdm(
+                    executor.map(fill, [[file] for file in files]),
+                    total=len(files),
+                    unit="file",
+                )
+            )
+    else:
+        results = [fill(files)]
+
+    grouped = results[0]
+    for result in results[1:]:
+        grouped.merge(result)
+
+    return grouped.result()
+
+
+def _fill_files(
+    files: list[Path],
+    bins: dict[str, ArrayLike],
+    model: CosmicRayFlux,
+    proton_only: bool,
+    groups: dict[PDGID, tuple[int, int]] | None,
+    particle_filter: str | None,
+    chunk_events: int | None,
+    chunk_particles: int | None,
+    drop_mothers: bool,
+    drop_non_particles: bool,
+    memmap: bool,
+) -> _GroupedHistograms:
+    """
+    Fills the not yet normalized histograms of the generation groups from `files`.
+    """
+    grouped = _GroupedHistograms(bins, model, proton_only, groups)
+    for df_run, df_event, df_particles in read_DAT_iter(
+        files,
+        chunk_events=chunk_events,
+        chunk_particles=chunk_particles,
+        columns=list(bins),
+        particle_filter=particle_filter,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        memmap=memmap,
+        ragged=True,
+    ):
+        grouped.fill(df_run, df_event, df_particles)
+
+    return grouped
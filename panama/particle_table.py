@@ -0,0 +1,256 @@
+"""
+Vectorized lookup of the particle properties needed by panama.
+
+The properties of all particles are collected once from the `particle` package
+into a table, which is indexed densely by the CORSIKA7 id and via a sorted
+pdgid array by the pdgid, so they can be gathered for whole columns at once.
+The table is built lazily on first use and loaded from the cache directory
+(`$PANAMA_CACHE_DIR`, default `~/.cache/panama`), if it was saved there before.
+It is saved automatically only if `$PANAMA_CACHE_DIR` is set, otherwise
+`save_table()` has to be called explicitly, so nothing is written to the home
+directory unasked.
+"""
+
+from __future__ import annotations
+
+import os
+from contextlib import suppress
+from math import inf
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import particle
+from numpy.typing import ArrayLike, NDArray
+from particle import Corsika7ID, Particle
+from particle.exceptions import MatchingIDNotFound
+from particle.particle import InvalidParticle, ParticleNotFound
+
+from .constants import PDGID_ERROR_VAL
+
+# CORSIKA7 ids have at most 4 digits, the particle description is id * 1000 + ...
+MAX_CORSIKAID = 9999
+
+PROPERTY_DTYPE = np.dtype(
+    [
+        ("pdgid", np.int64),
+        ("mass", np.float64),  # GeV
+        ("lifetime", np.float64),  # ns
+        ("has_charm", bool),
+        ("is_resonance", bool),
+    ]
+)
+
+# corsikaid -> slot, properties of the slots, sorted pdgids with their slots,
+# empty until first used
+_table: dict[str, NDArray[Any]] = {}
+
+
+def cache_dir() -> Path:
+    """
+    The cache directory of panama, `$PANAMA_CACHE_DIR` or by default `~/.cache/panama`.
+    """
+    path = os.environ.get("PANAMA_CACHE_DIR")
+    if path is None:
+        return Path.home() / ".cache" / "panama"
+
+    return Path(path)
+
+
+def cache_path() -> Path:
+    """
+    The file the particle table is saved to, it depends on the version
+    of the `particle` package, so an update of it builds a new table.
+    """
+    return cache_dir() / f"particle_table_{particle.__version__}.npz"
+
+
+def _pdgid_properties(pdgid: int) -> tuple[int, float, float, bool, bool]:
+    """
+    The properties of a single pdgid from the `particle` package.
+    Unknown masses and lifetimes are set to 0, the error value gets an
+    infinite lifetime and no charm or resonance flag.
+    """
+    if pdgid == PDGID_ERROR_VAL:
+        return (PDGID_ERROR_VAL, 0, inf, False, False)
+
+    try:
+        p = Particle.from_pdgid(pdgid)
+    except (InvalidParticle, ParticleNotFound):
+        return (pdgid, 0, 0, False, False)
+
+    return (
+        pdgid,
+        p.mass / 1000 if p.mass is not None else 0,
+        p.lifetime if p.lifetime is not None else 0,
+        "c" in p.quarks.lower(),
+        "*" in p.name,
+    )
+
+
+def _corsikaid_to_pdgid(corsikaid: int) -> int:
+    try:
+        cid = Corsika7ID(corsikaid)
+        return int(cid.to_pdgid()) if cid.is_particle() else PDGID_ERROR_VAL
+    except (InvalidParticle, MatchingIDNotFound):
+        return PDGID_ERROR_VAL
+
+
+def _make_table(
+    corsikaid_pdgids: NDArray[Any], properties: NDArray[Any]
+) -> dict[str, NDArray[Any]]:
+    order = np.argsort(properties["pdgid"])
+    pdgid_slot = np.searchsorted(properties["pdgid"][order], corsikaid_pdgids)
+    return {
+        "corsikaid_slot": order[pdgid_slot],
+        "properties": properties,
+        "sorted_pdgids": properties["pdgid"][order],
+        "sorted_slots": order,
+    }
+
+
+def build_table(pdgids: ArrayLike | None = None) -> dict[str, NDArray[Any]]:
+    """
+    Builds the table from the `particle` package for all CORSIKA7 ids
+    and the additional `pdgids`.
+    """
+    corsikaid_pdgids = np.array(
+        [_corsikaid_to_pdgid(corsikaid) for corsikaid in range(MAX_CORSIKAID + 1)],
+        dtype=np.int64,
+    )
+    unique = np.union1d(
+        np.union1d(corsikaid_pdgids, [PDGID_ERROR_VAL]),
+        np.asarray([] if pdgids is None else pdgids, dtype=np.int64),
+    )
+    properties = np.array(
+        [_pdgid_properties(int(pdgid)) for pdgid in unique], dtype=PROPERTY_DTYPE
+    )
+    return _make_table(corsikaid_pdgids, properties)
+
+
+def save_table(path: Path | str | None = None) -> None:
+    """
+    Saves the current table to `path`, by default to `cache_path()`.
+    """
+    path = cache_path() if path is None else Path(path)
+    table = _get_table()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write to a temporary file first, so concurrent processes never see half a table
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            corsikaid_pdgids=table["properties"]["pdgid"][table["corsikaid_slot"]],
+            properties=table["properties"],
+        )
+    os.replace(tmp_path, path)
+
+
+def load_table(path: Path | str | None = None) -> None:
+    """
+    Loads a table saved by `save_table` from `path`, by default from `cache_path()`.
+    """
+    with np.load(cache_path() if path is None else path) as data:
+        table = _make_table(data["corsikaid_pdgids"], data["properties"])
+    _table.update(table)
+
+
+def _get_table() -> dict[str, NDArray[Any]]:
+    """
+    Returns the table, loading it from the cache or building it if necessary.
+    """
+    if len(_table) == 0:
+        try:
+            load_table()
+        except (OSError, KeyError, ValueError):
+            _table.update(build_table())
+            _autosave()
+
+    return _table
+
+
+def _autosave() -> None:
+    """
+    Saves the table to the cache, if `$PANAMA_CACHE_DIR` is set.
+    """
+    if os.environ.get("PANAMA_CACHE_DIR") is not None:
+        # the cache is only an optimization, e.g. a read-only directory is fine
+        with suppress(OSError):
+            save_table()
+
+
+def _add_pdgids(pdgids: NDArray[Any]) -> None:
+    """
+    Adds the properties of pdgids, which are no CORSIKA7 particle, to the table.
+    """
+    table = _get_table()
+    new = np.array(
+        [_pdgid_properties(int(pdgid)) for pdgid in np.unique(pdgids)],
+        dtype=PROPERTY_DTYPE,
+    )
+    table.update(
+        _make_table(
+            table["properties"]["pdgid"][table["corsikaid_slot"]],
+            np.concatenate([table["properties"], new]),
+        )
+    )
+    _autosave()
+
+
+def properties() -> NDArray[Any]:
+    """
+    The property table, a structured array with the fields of `PROPERTY_DTYPE`,
+    to be indexed with the rows from `corsikaid_to_slot` or `pdgid_to_slot`.
+    Pdgids added later by `pdgid_to_slot` create a new table.
+    """
+    return _get_table()["properties"]
+
+
+def corsikaid_to_slot(corsikaids: ArrayLike) -> NDArray[Any]:
+    """
+    The rows of the property table for the CORSIKA7 ids.
+    Invalid ids get the row of `PDGID_ERROR_VAL`.
+    """
+    table = _get_table()
+    corsikaids = np.asarray(corsikaids).astype(np.int64)
+    valid = (corsikaids >= 0) & (corsikaids <= MAX_CORSIKAID)
+    slots = table["corsikaid_slot"][np.where(valid, corsikaids, 0)]
+    if not np.all(valid):
+        slots[~valid] = table["corsikaid_slot"][0]
+    return slots
+
+
+def pdgid_to_slot(pdgids: ArrayLike) -> NDArray[Any]:
+    """
+    The rows of the property table for the pdgids.
+    Pdgids not in the table yet are added to it.
+    """
+    pdgids = np.asarray(pdgids).astype(np.int64)
+    table = _get_table()
+
+    idx = np.searchsorted(table["sorted_pdgids"], pdgids)
+    idx[idx == len(table["sorted_pdgids"])] = 0
+    missing = table["sorted_pdgids"][idx] != pdgids
+    if np.any(missing):
+        _add_pdgids(pdgids[missing])
+        return pdgid_to_slot(pdgids)
+
+    return table["sorted_slots"][idx]
+
+
+def from_corsikaid(corsikaids: ArrayLike, name: str) -> NDArray[Any]:
+    """
+    Gathers the property `name` (one of the fields of `PROPERTY_DTYPE`)
+    for an array of CORSIKA7 ids.
+    """
+    return np.take(properties()[name], corsikaid_to_slot(corsikaids))
+
+
+def from_pdgid(pdgids: ArrayLike, name: str) -> NDArray[Any]:
+    """
+    Gathers the property `name` (one of the fields of `PROPERTY_DTYPE`)
+    for an array of pdgids.
+    """
+    slots = pdgid_to_slot(pdgids)
+    return np.take(properties()[name], slots)
@@ -5,18 +5,35 @@ using multiple different definitions.
 
 from __future__ import annotations
 
+import importlib.util
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from math import inf
+from pathlib import Path
+from typing import Any, cast
 
 import numpy as np
 import pandas as pd
-from numpy.typing import ArrayLike
-from particle import Particle
+from numpy.typing import ArrayLike, NDArray
+from tqdm import tqdm
 
+from . import particle_table
+from .ancestry import MOTHER_COLUMNS, get_mother_columns
 from .constants import D0_LIFETIME, PDGID_ERROR_VAL, PDGIDS_PION_KAON
+from .version import __distribution__
+
+# the default lifetime limit of the combined functions, 10 times the D0 lifetime
+# (the `particle` package types it as optional, the D0 always has one)
+_LIFETIME_LIMIT_NS: float = cast(float, D0_LIFETIME) * 10
 
 
 def is_prompt_lifetime_limit(
-    df_particles: pd.DataFrame, lifetime_limit_ns: float = D0_LIFETIME * 10
+    df_particles: pd.DataFrame,
+    lifetime_limit_ns: float = D0_LIFETIME * 10,
+    df_mothers: pd.DataFrame | None = None,
 ) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by the lifetime of the mother particle.
 
@@ -25,31 +42,77 @@ def is_prompt_lifetime_limit(
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
     lifetime_limit_ns:
         The lifetime limit in nanoseconds above which a particle is considered conventional.
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
 
-    dif = df_particles["hadron_gen"].to_numpy(copy=False) - df_particles[
-        "mother_hadr_gen"
-    ].to_numpy(copy=False)
+    names = (
+        "has_mother",
+        "hadron_gen",
+        "mother_hadr_gen",
+        "mother_pdgid",
+        "mother_lifetimes",
+        "mother_is_resonance",
+        "mother_has_charm",
+    )
+    return _is_prompt_lifetime_limit(
+        *_columns(df_particles, df_mothers, *names),
+        lifetime_limit_ns=lifetime_limit_ns,
+    )
+
+
+def _columns(
+    df_particles: pd.DataFrame, df_mothers: pd.DataFrame | None, *names: str
+) -> list[NDArray[Any]]:
+    """
+    The columns `names` of the particles as arrays. If the mother table is given,
+    the mother columns are joined from it with `get_mother_columns`.
+    """
+    if df_mothers is None:
+        return [df_particles[name].to_numpy(copy=False) for name in names]
+
+    df_joined = get_mother_columns(
+        df_particles, df_mothers, [name for name in names if name in MOTHER_COLUMNS]
+    )
+    return [
+        (df_joined if name in MOTHER_COLUMNS else df_particles)[name].to_numpy(
+            copy=False
+        )
+        for name in names
+    ]
+
+
+def _is_prompt_lifetime_limit(
+    has_mother: NDArray[Any],
+    hadron_gen: NDArray[Any],
+    mother_hadr_gen: NDArray[Any],
+    mother_pdgid: NDArray[Any],
+    mother_lifetimes: NDArray[Any],
+    mother_is_resonance: NDArray[Any],
+    mother_has_charm: NDArray[Any],
+    *,
+    lifetime_limit_ns: float = D0_LIFETIME * 10,
+) -> NDArray[Any]:
+    """
+    `is_prompt_lifetime_limit` on the plain arrays of the columns with the same names.
+    """
+    dif = hadron_gen - mother_hadr_gen
 
-    return df_particles["has_mother"].to_numpy(copy=False) & (
+    return has_mother & (
         (
-            (df_particles["mother_lifetimes"].to_numpy(copy=False) <= lifetime_limit_ns)
+            (mother_lifetimes <= lifetime_limit_ns)
             & (
-                (
-                    np.abs(dif)
-                    <= 1 & ~df_particles["mother_is_resonance"].to_numpy(copy=False)
-                )
+                (np.abs(dif) <= 1 & ~mother_is_resonance)
                 # np.abs because of some very weird stuff going on in ehist
-                | ((dif == 30) & df_particles["mother_has_charm"].to_numpy(copy=False))
+                | ((dif == 30) & mother_has_charm)
             )
         )
         | (
-            (df_particles["mother_pdgid"].abs().to_numpy(copy=False) == 13)
-            & (df_particles["hadron_gen"] < 3)
+            (np.abs(mother_pdgid) == 13) & (hadron_gen < 3)
         )  # mother is muon (and in early generation)
     )
 
@@ -58,40 +121,21 @@ def add_cleaned_mother_cols(df_particles: pd.DataFrame) -> None:
     """
     Adds mother_lifetime_cleaned, mother_mass_cleaned and mother_energy_cleaned if not present in the dataframe.
     """
+    if (
+        "mother_lifetime_cleaned" not in df_particles
+        or "mother_mass_cleaned" not in df_particles
+    ):
+        slots = particle_table.pdgid_to_slot(df_particles["mother_pdgid_cleaned"])
+        properties = particle_table.properties()
+
     if "mother_lifetime_cleaned" not in df_particles:
-        pdgids = df_particles["mother_pdgid_cleaned"].unique()
-        lifetimes = {
-            pdgid: (
-                Particle.from_pdgid(pdgid).lifetime if pdgid != PDGID_ERROR_VAL else inf
-            )
-            for pdgid in pdgids
-        }
-        for pdgid in lifetimes:
-            if lifetimes[pdgid] is None:
-                lifetimes[pdgid] = 0
-
-        df_particles["mother_lifetime_cleaned"] = (
-            df_particles["mother_pdgid_cleaned"].map(lifetimes, na_action=None).array
-        )
+        df_particles["mother_lifetime_cleaned"] = np.take(properties["lifetime"], slots)
 
     if "mother_mass_cleaned" not in df_particles:
-        pdgids = df_particles["mother_pdgid_cleaned"].unique()
-        masses = {
-            pdgid: Particle.from_pdgid(pdgid).mass if pdgid != PDGID_ERROR_VAL else 0
-            for pdgid in pdgids
-        }
-        for pdgid, mass in masses.items():
-            mass_ = mass
-            if mass is None:
-                mass_ = 0
-            masses[pdgid] = mass_ / 1000
-
-        df_particles["mother_mass_cleaned"] = (
-            df_particles["mother_pdgid_cleaned"].map(masses, na_action=None).array
-        )
+        df_particles["mother_mass_cleaned"] = np.take(properties["mass"], slots)
 
     if "mother_energy_cleaned" not in df_particles:
-        energy_cleaned = df_particles["mother_energy"].to_numpy(copy=False)
+        energy_cleaned = df_particles["mother_energy"].to_numpy(copy=True)
         energy_cleaned[
             df_particles["mother_pdgid_cleaned"].to_numpy(copy=False) == PDGID_ERROR_VAL
         ] = inf
@@ -99,7 +143,9 @@ def add_cleaned_mother_cols(df_particles: pd.DataFrame) -> None:
 
 
 def is_prompt_lifetime_limit_cleaned(
-    df_particles: pd.DataFrame, lifetime_limit_ns: float = D0_LIFETIME * 10
+    df_particles: pd.DataFrame,
+    lifetime_limit_ns: float = D0_LIFETIME * 10,
+    df_mothers: pd.DataFrame | None = None,
 ) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by lifetime of the mother particle.
     It considers the cleaned particle type of the mother.
@@ -107,23 +153,28 @@ def is_prompt_lifetime_limit_cleaned(
     Parameters
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
-    add_cleaned_mother_cols(df_particles)
+    if df_mothers is None:
+        add_cleaned_mother_cols(df_particles)
 
     is_prompt = np.ones(df_particles.shape[0], dtype=bool)
 
-    lifetimes = df_particles["mother_lifetime_cleaned"].to_numpy(copy=False)
+    (lifetimes,) = _columns(df_particles, df_mothers, "mother_lifetime_cleaned")
 
     is_prompt[lifetimes >= lifetime_limit_ns] = False
 
     return is_prompt
 
 
-def is_prompt_energy(df_particles: pd.DataFrame, s: float = 2) -> ArrayLike:
+def is_prompt_energy(
+    df_particles: pd.DataFrame, s: float = 2, df_mothers: pd.DataFrame | None = None
+) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by energy of the mother particle,
        with considering the cleaned particle type of the mother.
 
@@ -131,31 +182,47 @@ def is_prompt_energy(df_particles: pd.DataFrame, s: float = 2) -> ArrayLike:
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
     s: scaling factor. How much bigger does the decay length has to be compared to the interaction length
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
-    add_cleaned_mother_cols(df_particles)
+    if df_mothers is None:
+        add_cleaned_mother_cols(df_particles)
+
+    return _is_prompt_energy(
+        *_columns(
+            df_particles,
+            df_mothers,
+            "mother_energy_cleaned",
+            "mother_mass_cleaned",
+            "mother_lifetime_cleaned",
+        ),
+        s=s,
+    )
 
-    energy_limit_conversion_factor = 21681.666  # GeV
 
-    limit = (
-        energy_limit_conversion_factor
-        * df_particles["mother_mass_cleaned"]
-        / df_particles["mother_lifetime_cleaned"]
-        / s
-    )
+def _is_prompt_energy(
+    energy: NDArray[Any], mass: NDArray[Any], lifetime: NDArray[Any], *, s: float
+) -> NDArray[Any]:
+    """
+    True if the decay length of the mother is shorter than `s` times its interaction length.
+    """
+    energy_limit_conversion_factor = 21681.666  # GeV
 
-    is_prompt = df_particles["mother_energy_cleaned"].to_numpy(
-        copy=False
-    ) < limit.to_numpy(copy=False)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limit = energy_limit_conversion_factor * mass / lifetime / s
 
-    return is_prompt
+    return energy < limit
 
 
 def is_abs_id_not_in(
-    df_particles: pd.DataFrame, pdgids: list[int], pdgid_col: str
+    df_particles: pd.DataFrame,
+    pdgids: list[int],
+    pdgid_col: str,
+    df_mothers: pd.DataFrame | None = None,
 ) -> ArrayLike:
     """Return a numpy array which is true if abs(pdgid_col) is not in pdgids, false otherwise.
 
@@ -167,94 +234,454 @@ def is_abs_id_not_in(
         list of ints with the pdgids to check
     pdgid_col: str
         column to check if abs value is not equal to any value in pdgids
+    df_mothers: DataFrame | None
+        the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True if abs value of col is not in pdgids, False otherwise
     """
-
-    pdgidc = np.abs(df_particles[pdgid_col].to_numpy(copy=False))
+    (pdgidc,) = _columns(df_particles, df_mothers, pdgid_col)
+    pdgidc = np.abs(pdgidc)
 
     return ~np.isin(pdgidc.astype(int), pdgids)
 
 
-def is_prompt_pion_kaon(df_particles: pd.DataFrame) -> ArrayLike:
+def is_prompt_pion_kaon(
+    df_particles: pd.DataFrame, df_mothers: pd.DataFrame | None = None
+) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by the pdgid (cleaned)
     of the mother particle. If the mother is a pion or a kaon it is not prompt, otherwise it is.
 
     Parameters
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
-    pion_kaon_pdgids
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
-    return is_abs_id_not_in(df_particles, PDGIDS_PION_KAON, "mother_pdgid_cleaned")
+    return is_abs_id_not_in(
+        df_particles, PDGIDS_PION_KAON, "mother_pdgid_cleaned", df_mothers=df_mothers
+    )
 
 
-def is_prompt_pion_kaon_wrong_pdgid(df_particles: pd.DataFrame) -> ArrayLike:
+def is_prompt_pion_kaon_wrong_pdgid(
+    df_particles: pd.DataFrame, df_mothers: pd.DataFrame | None = None
+) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by the pdgid (uncleaned)
     of the mother particle. If the mother is a pion or a kaon it is not prompt, otherwise it is.
 
     Parameters
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
 
-    return is_abs_id_not_in(df_particles, PDGIDS_PION_KAON, "mother_pdgid")
+    return is_abs_id_not_in(
+        df_particles, PDGIDS_PION_KAON, "mother_pdgid", df_mothers=df_mothers
+    )
 
 
-def is_prompt_pion_kaon_grandmother(df_particles: pd.DataFrame) -> ArrayLike:
+def is_prompt_pion_kaon_grandmother(
+    df_particles: pd.DataFrame, df_mothers: pd.DataFrame | None = None
+) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by the pdgid (cleaned)
     of the mother particle. If the mother is a pion or a kaon it is not prompt, otherwise it is.
 
     Parameters
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
-
-    pdgidc = np.abs(df_particles["mother_pdgid_cleaned"].to_numpy(copy=False))
-    pdgidgm = np.abs(df_particles["grandmother_pdgid"].to_numpy(copy=False))
+    pdgidc, pdgidgm = (
+        np.abs(column)
+        for column in _columns(
+            df_particles, df_mothers, "mother_pdgid_cleaned", "grandmother_pdgid"
+        )
+    )
 
     return ~np.isin(pdgidc.astype(int), PDGIDS_PION_KAON) & ~np.isin(
         pdgidgm.astype(int), PDGIDS_PION_KAON
     )
 
 
-def is_prompt_energy_wrong_pdgid(df_particles: pd.DataFrame, s: float = 2) -> ArrayLike:
+def is_prompt_energy_wrong_pdgid(
+    df_particles: pd.DataFrame, s: float = 2, df_mothers: pd.DataFrame | None = None
+) -> ArrayLike:
     """Return a numpy array of prompt labels for the input dataframe differentiating it by energy of the mother particle (uncleaned).
 
     Parameters
     ----------
     df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
     s: scaling factor. How much bigger does the decay length has to be compared to the interaction length
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
 
     Returns
     -------
     A numpy boolean array, True for prompt, False for conventional
     """
+    return _is_prompt_energy(
+        *_columns(
+            df_particles,
+            df_mothers,
+            "mother_energy",
+            "mother_mass",
+            "mother_lifetimes",
+        ),
+        s=s,
+    )
 
-    energy_limit_conversion_factor = 21681.666  # GeV
 
-    limit = (
-        energy_limit_conversion_factor
-        * df_particles["mother_mass"]
-        / df_particles["mother_lifetimes"]
-        / s
+# the prompt definitions of `classify_prompt`, the label of each is the bit
+# `1 << PROMPT_DEFINITIONS.index(definition)` of the packed labels
+PROMPT_DEFINITIONS = (
+    "lifetime_limit",
+    "lifetime_limit_cleaned",
+    "energy",
+    "energy_wrong_pdgid",
+    "pion_kaon",
+    "pion_kaon_wrong_pdgid",
+    "pion_kaon_grandmother",
+)
+
+# the columns each definition needs
+_DEFINITION_COLUMNS = {
+    "lifetime_limit": (
+        "has_mother",
+        "hadron_gen",
+        "mother_hadr_gen",
+        "mother_pdgid",
+        "mother_lifetimes",
+        "mother_is_resonance",
+        "mother_has_charm",
+    ),
+    "lifetime_limit_cleaned": ("mother_lifetime_cleaned",),
+    "energy": (
+        "mother_energy_cleaned",
+        "mother_mass_cleaned",
+        "mother_lifetime_cleaned",
+    ),
+    "energy_wrong_pdgid": ("mother_energy", "mother_mass", "mother_lifetimes"),
+    "pion_kaon": ("mother_pdgid_cleaned",),
+    "pion_kaon_wrong_pdgid": ("mother_pdgid",),
+    "pion_kaon_grandmother": ("mother_pdgid_cleaned", "grandmother_pdgid"),
+}
+
+_CLEANED_COLUMNS = (
+    "mother_lifetime_cleaned",
+    "mother_mass_cleaned",
+    "mother_energy_cleaned",
+)
+
+
+def classify_prompt(
+    df_particles: pd.DataFrame,
+    definitions: list[str] | None = None,
+    lifetime_limit_ns: float = _LIFETIME_LIMIT_NS,
+    s: float = 2,
+    df_mothers: pd.DataFrame | None = None,
+) -> NDArray[np.uint8]:
+    """Return the prompt labels of multiple definitions at once, packed into one uint8 per particle.
+    The columns are only extracted once and everything shared by the definitions
+    (the cleaned mother properties, the pion and kaon lookup) is only computed once.
+    Unlike the single definitions, the cleaned mother columns are not added to `df_particles`.
+
+    Parameters
+    ----------
+    df_particles: dataframe with the corsika particles, additional_columns have to be present when running `read_DAT`
+    definitions: The definitions to evaluate, out of `PROMPT_DEFINITIONS`, the others stay 0.
+        If None, all of them are evaluated. (default: None)
+    lifetime_limit_ns: The lifetime limit of `is_prompt_lifetime_limit` and `is_prompt_lifetime_limit_cleaned`.
+    s: The scaling factor of `is_prompt_energy` and `is_prompt_energy_wrong_pdgid`.
+    df_mothers: the mother table of the particles (`read_DAT(..., mother_table=True)`),
+        the mother columns are then taken from it instead of `df_particles`
+
+    Returns
+    -------
+    A numpy uint8 array, with the bit `1 << PROMPT_DEFINITIONS.index(definition)` set, if the particle
+    is prompt by this definition, see `unpack_prompt_labels`.
+    """
+    definitions = _check_definitions(definitions)
+
+    # the missing cleaned columns are calculated once, like `add_cleaned_mother_cols`
+    names, computed = _prompt_columns(
+        definitions, None if df_mothers is not None else df_particles.columns
     )
 
-    is_prompt = df_particles["mother_energy"].to_numpy(copy=False) < limit.to_numpy(
-        copy=False
+    columns = dict(
+        zip(sorted(names), _columns(df_particles, df_mothers, *sorted(names)))
     )
+    if len(computed) > 0:
+        cleaned = _cleaned_mother_columns(
+            columns["mother_pdgid_cleaned"], columns["mother_energy"]
+        )
+        columns.update({name: cleaned[name] for name in computed})
 
-    return is_prompt
+    if "mother_pdgid_cleaned" in names:
+        cleaned_is_pion_kaon = np.isin(
+            np.abs(columns["mother_pdgid_cleaned"]).astype(int), PDGIDS_PION_KAON
+        )
+
+    labels = np.zeros(len(df_particles), dtype=np.uint8)
+    for definition in definitions:
+        if definition == "lifetime_limit":
+            is_prompt = _is_prompt_lifetime_limit(
+                *(columns[name] for name in _DEFINITION_COLUMNS[definition]),
+                lifetime_limit_ns=lifetime_limit_ns,
+            )
+        elif definition == "lifetime_limit_cleaned":
+            is_prompt = ~(columns["mother_lifetime_cleaned"] >= lifetime_limit_ns)
+        elif definition in ("energy", "energy_wrong_pdgid"):
+            is_prompt = _is_prompt_energy(
+                *(columns[name] for name in _DEFINITION_COLUMNS[definition]), s=s
+            )
+        elif definition == "pion_kaon":
+            is_prompt = ~cleaned_is_pion_kaon
+        elif definition == "pion_kaon_wrong_pdgid":
+            is_prompt = ~np.isin(
+                np.abs(columns["mother_pdgid"]).astype(int), PDGIDS_PION_KAON
+            )
+        else:
+            is_prompt = ~cleaned_is_pion_kaon & ~np.isin(
+                np.abs(columns["grandmother_pdgid"]).astype(int), PDGIDS_PION_KAON
+            )
+
+        labels |= is_prompt.astype(np.uint8) << np.uint8(
+            PROMPT_DEFINITIONS.index(definition)
+        )
+
+    return labels
+
+
+def _check_definitions(definitions: list[str] | None) -> list[str]:
+    """
+    The prompt definitions to evaluate, all of them if None.
+    """
+    if definitions is None:
+        return list(PROMPT_DEFINITIONS)
+
+    unknown = [name for name in definitions if name not in PROMPT_DEFINITIONS]
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown prompt definitions {unknown}, available are {PROMPT_DEFINITIONS}."
+        )
+    return definitions
+
+
+def _prompt_columns(
+    definitions: list[str], present: Collection[str] | None
+) -> tuple[set[str], set[str]]:
+    """
+    The columns to extract for the definitions and the cleaned mother columns to
+    calculate from them, since they are not `present` (None if all are, like in a mother table).
+    """
+    names = {
+        name for definition in definitions for name in _DEFINITION_COLUMNS[definition]
+    }
+    if present is None:
+        return names, set()
+
+    computed = {
+        name for name in _CLEANED_COLUMNS if name in names and name not in present
+    }
+    if len(computed) > 0:
+        names = (names - computed) | {"mother_pdgid_cleaned", "mother_energy"}
+    return names, computed
+
+
+def prompt_label(labels: ArrayLike, definition: str) -> NDArray[np.bool_]:
+    """
+    The prompt label of one definition from the packed labels of `classify_prompt`,
+    True for prompt, False for conventional.
+    """
+    if definition not in PROMPT_DEFINITIONS:
+        raise ValueError(
+            f"Unknown prompt definition {definition}, available are {PROMPT_DEFINITIONS}."
+        )
+    bit = np.uint8(1 << PROMPT_DEFINITIONS.index(definition))
+    return (np.asarray(labels, dtype=np.uint8) & bit) != 0
+
+
+def unpack_prompt_labels(
+    labels: ArrayLike, definitions: list[str] | None = None
+) -> dict[str, NDArray[np.bool_]]:
+    """
+    Unpacks the labels of `classify_prompt` into one boolean array per definition,
+    named like the function of the definition, e.g. `is_prompt_energy`.
+
+    Can be used like this: `df = df.assign(**unpack_prompt_labels(classify_prompt(df)))`
+    """
+    if definitions is None:
+        definitions = list(PROMPT_DEFINITIONS)
+
+    return {
+        f"is_prompt_{definition}": prompt_label(labels, definition)
+        for definition in definitions
+    }
+
+
+def _cleaned_mother_columns(
+    mother_pdgid_cleaned: NDArray[Any], mother_energy: NDArray[Any]
+) -> dict[str, NDArray[Any]]:
+    """
+    The cleaned mother columns of `add_cleaned_mother_cols` as arrays.
+    """
+    slots = particle_table.pdgid_to_slot(mother_pdgid_cleaned)
+    properties = particle_table.properties()
+
+    energy_cleaned = np.array(mother_energy, copy=True)
+    energy_cleaned[mother_pdgid_cleaned == PDGID_ERROR_VAL] = inf
+
+    return {
+        "mother_lifetime_cleaned": np.take(properties["lifetime"], slots),
+        "mother_mass_cleaned": np.take(properties["mass"], slots),
+        "mother_energy_cleaned": energy_cleaned,
+    }
+
+
+def label_prompt_hdf(
+    path: Path | str,
+    key: str = "particles",
+    output: Path | str | None = None,
+    output_key: str = "prompt_labels",
+    definitions: list[str] | None = None,
+    packed: bool = False,
+    lifetime_limit_ns: float = _LIFETIME_LIMIT_NS,
+    s: float = 2,
+    chunk_particles: int = 1_000_000,
+    n_workers: int = 1,
+    complevel: int = 5,
+) -> None:
+    """Labels the particles of a stored particle table chunk by chunk with `classify_prompt`,
+    so the table never has to fit into memory, and stores the labels as a new table.
+    Only the columns needed by the definitions are read.
+
+    Parameters
+    ----------
+    path: The hdf5 file with the particle table, which has to be stored in the table format
+        (e.g. `df.to_hdf(path, key="particles", format="table")`, or appended chunk by chunk),
+        with the mother columns (`read_DAT(..., mother_columns=True)`).
+    key: The key of the particle table in `path`. (default: 'particles')
+    output: The hdf5 file to store the labels in. If None, they are stored in `path`.
+    output_key: The key of the label table in `output`, which is replaced if it exists. (default: 'prompt_labels')
+    definitions: The definitions to evaluate, out of `PROMPT_DEFINITIONS`. If None, all of them are evaluated.
+    packed: Store the packed labels of `classify_prompt` as one uint8 column 'prompt_labels',
+        instead of one boolean column per definition, named like `unpack_prompt_labels`. (default: False)
+    lifetime_limit_ns, s: see `classify_prompt`
+    chunk_particles: The number of particles (rows) to label at once.
+    n_workers: The number of processes to label the chunks in parallel, reading and
+        writing the file is always done by the calling process.
+    complevel: The compression level of the label table, between 0 and 9.
+
+    The label table has the index of the particle table, read it like
+    `pd.read_hdf(path, "prompt_labels", start=start, stop=stop)` to get the labels of the same rows.
+    """
+    if importlib.util.find_spec("tables") is None:
+        raise ImportError(
+            f"Optional dependency PyTables is not installed and hdf5 files are not available. "
+            f"You can install it via `pip install {__distribution__}[hdf]`."
+        )
+    if chunk_particles < 1:
+        raise ValueError(f"chunk_particles must be positive, got {chunk_particles}.")
+
+    definitions = _check_definitions(definitions)
+    path = Path(path)
+    output = path if output is None else Path(output)
+    same_file = output.resolve() == path.resolve()
+
+    with ExitStack() as stack:
+        store = stack.enter_context(pd.HDFStore(path, mode="a" if same_file else "r"))
+        out_store = (
+            store if same_file else stack.enter_context(pd.HDFStore(output, mode="a"))
+        )
+
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            raise ValueError(
+                f"The table {key} in {path} is stored in the fixed format, which can't be read in chunks. "
+                "Store it with `format='table'`."
+            )
+        present = store.select(key, start=0, stop=0).columns
+        names, _ = _prompt_columns(definitions, present)
+
+        starts = range(0, storer.nrows, chunk_particles)
+        chunks = (
+            store.select(
+                key, start=start, stop=start + chunk_particles, columns=sorted(names)
+            )
+            for start in starts
+        )
+        classify = partial(
+            _label_chunk,
+            definitions=definitions,
+            packed=packed,
+            lifetime_limit_ns=lifetime_limit_ns,
+            s=s,
+        )
+
+        if output_key in out_store:
+            out_store.remove(output_key)
+        for labels in tqdm(
+            _map_chunks(classify, chunks, n_workers), total=len(starts), unit="chunk"
+        ):
+            out_store.append(
+                output_key, labels, format="table", index=False, complevel=complevel
+            )
+
+
+def _label_chunk(
+    df_particles: pd.DataFrame,
+    definitions: list[str],
+    packed: bool,
+    lifetime_limit_ns: float,
+    s: float,
+) -> pd.DataFrame:
+    """
+    The label table of one chunk of `label_prompt_hdf`.
+    """
+    labels = classify_prompt(df_particles, definitions, lifetime_limit_ns, s)
+    if packed:
+        return pd.DataFrame({"prompt_labels": labels}, index=df_particles.index)
+
+    return pd.DataFrame(
+        unpack_prompt_labels(labels, definitions), index=df_particles.index
+    )
+
+
+def _map_chunks(
+    func: Callable[[pd.DataFrame], pd.DataFrame],
+    chunks: Iterable[pd.DataFrame],
+    n_workers: int,
+) -> Iterator[pd.DataFrame]:
+    """
+    `map(func, chunks)` in `n_workers` processes, in the order of the chunks, with
+    at most two chunks per process read ahead, so they are not all in memory at once.
+    """
+    if n_workers <= 1:
+        yield from map(func, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending: deque[Future[pd.DataFrame]] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk))
+            if len(pending) >= 2 * n_workers:
+                yield pending.popleft().result()
+
+        while len(pending) > 0:
+            yield pending.popleft().result()
@@ -0,0 +1,140 @@
+"""
+Helpers for the ragged form of the particles, returned by `read_DAT(..., ragged=True)`.
+
+In the ragged form, the particle DataFrame has a plain `RangeIndex` and the
+particles of each shower are consecutive rows in the order of the event DataFrame.
+The column `particle_offset` of the event DataFrame is the row of the first particle
+of each event (awkward-array style offsets), so per-event operations are
+simple segment operations on the columns, without a MultiIndex.
+
+>>> df_run, df_event, df = read_DAT(glob="DAT*", ragged=True)
+>>> offsets = df_event["particle_offset"].to_numpy()
+>>> df_event["n_muons"] = segment_count(np.abs(df["pdgid"]) == 13, offsets)
+>>> df["primary_energy"] = broadcast(df_event["total_energy"], offsets, len(df))
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+
+def counts(offsets: ArrayLike, n_particles: int) -> NDArray[Any]:
+    """
+    The number of particles of each event.
+
+    Parameters
+    ----------
+    offsets: ArrayLike
+        The row of the first particle of each event (`particle_offset`).
+    n_particles: int
+        The total number of particles (rows of the particle DataFrame).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return np.diff(offsets, append=n_particles)
+
+
+def event_positions(offsets: ArrayLike, n_particles: int) -> NDArray[Any]:
+    """
+    The position (row of the event DataFrame) of the event of each particle.
+    """
+    n = counts(offsets, n_particles)
+    return np.repeat(np.arange(len(n)), n)
+
+
+def broadcast(values: ArrayLike, offsets: ArrayLike, n_particles: int) -> NDArray[Any]:
+    """
+    Broadcasts one value per event to all particles of the event,
+    e.g. the primary energy for weighting.
+
+    Parameters
+    ----------
+    values: ArrayLike
+        One value per event, in the order of the event DataFrame.
+    offsets: ArrayLike
+        The row of the first particle of each event (`particle_offset`).
+    n_particles: int
+        The total number of particles (rows of the particle DataFrame).
+
+    Returns
+    -------
+    An array with one value per particle.
+    """
+    values = np.asarray(values)
+    n = counts(offsets, n_particles)
+    if len(values) != len(n):
+        raise ValueError(
+            f"Got {len(values)} values for {len(n)} events, need one per event."
+        )
+    return np.repeat(values, n)
+
+
+def segment_reduce(
+    ufunc: np.ufunc, values: ArrayLike, offsets: ArrayLike, empty: Any
+) -> NDArray[Any]:
+    """
+    Reduces the particles of each event with `ufunc`, like `ufunc.reduceat`,
+    but events without particles get the value `empty`.
+
+    Parameters
+    ----------
+    ufunc: np.ufunc
+        The reduction, e.g. `np.add`, `np.maximum` or `np.minimum`.
+    values: ArrayLike
+        One value per particle.
+    offsets: ArrayLike
+        The row of the first particle of each event (`particle_offset`).
+    empty: Any
+        The result for events without particles.
+
+    Returns
+    -------
+    An array with one value per event.
+    """
+    values = np.asarray(values)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    has_particles = counts(offsets, len(values)) > 0
+
+    if np.all(has_particles):
+        result = np.empty(len(offsets), dtype=values.dtype)
+    else:
+        # e.g. NaN for empty events promotes integers to float
+        dtype = np.result_type(values.dtype, np.min_scalar_type(empty))
+        result = np.full(len(offsets), empty, dtype=dtype)
+
+    # reduceat reduces up to the next index, so only the non-empty
+    # events are passed, the empty ones in between have no rows anyway
+    if np.any(has_particles):
+        result[has_particles] = ufunc.reduceat(values, offsets[has_particles])
+
+    return result
+
+
+def segment_sum(values: ArrayLike, offsets: ArrayLike) -> NDArray[Any]:
+    """
+    The sum of `values` over the particles of each event, 0 for empty events.
+    """
+    return segment_reduce(np.add, values, offsets, 0)
+
+
+def segment_count(mask: ArrayLike, offsets: ArrayLike) -> NDArray[Any]:
+    """
+    The number of particles of each event, for which `mask` is True.
+    """
+    return segment_reduce(np.add, np.asarray(mask, dtype=np.int64), offsets, 0)
+
+
+def segment_max(values: ArrayLike, offsets: ArrayLike) -> NDArray[Any]:
+    """
+    The maximum of `values` over the particles of each event, NaN for empty events.
+    """
+    return segment_reduce(np.maximum, values, offsets, np.nan)
+
+
+def segment_min(values: ArrayLike, offsets: ArrayLike) -> NDArray[Any]:
+    """
+    The minimum of `values` over the particles of each event, NaN for empty events.
+    """
+    return segment_reduce(np.minimum, values, offsets, np.nan)
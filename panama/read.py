@@ -4,23 +4,38 @@ Functions concerning input of CORSIKA7 DAT files.
 
 from __future__ import annotations
 
-from math import inf
+import re
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Any
 
 import numpy as np
 import pandas as pd
 from corsikaio import CorsikaParticleFile
 from corsikaio.subblocks import event_header_types, particle_data_dtype
-from particle import Corsika7ID, Particle
+from numpy.typing import NDArray
 from tqdm import tqdm
 
+from . import particle_table, ragged
+from .accessor import DERIVED_COLUMNS, derive_column
+from .ancestry import MOTHER_COLUMNS, MOTHER_TABLE_COLUMNS
 from .constants import (
     CORSIKA_FIELD_BYTE_LEN,
     DEFAULT_EVENT_HEADER_FEATURES,
     DEFAULT_RUN_HEADER_FEATURES,
     PDGID_ERROR_VAL,
 )
-from .prompt import is_prompt_lifetime_limit
+from .dat import (
+    BLOCK_SIZE_WORDS,
+    LONG,
+    PARTICLE_SIZE_WORDS,
+    PARTICLES_PER_BLOCK,
+    DATFile,
+    read_run_headers,
+)
+from .prompt import _is_prompt_lifetime_limit
 
 
 def read_DAT(
@@ -34,7 +49,16 @@ def read_DAT(
     drop_mothers: bool = True,
     drop_non_particles: bool = True,
     noparse: bool = True,
-) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    columns: list[str] | None = None,
+    particle_filter: str | None = None,
+    compact: bool = False,
+    mother_table: bool = False,
+    ragged: bool = False,
+    n_workers: int = 1,
+    memmap: bool = False,
+    catalog: Path | str | None = None,
+    event_filter: str | None = None,
+) -> tuple[pd.DataFrame, ...]:
     r"""
     Read CORSIKA DAT files to Pandas.DataFrame.
     Exactly one of `files` or `glob` must be provided.
@@ -80,6 +104,8 @@ def read_DAT(
             - `mass`
             - `energy`
             - `zenith`
+        Without them, the same columns are available lazily
+        through the `df.panama` accessor (e.g. `df.panama.energy`).
     mother_columns: bool
         Weather to add columns related to the mother/grandmother
         output of the EHIST option.
@@ -93,6 +119,71 @@ def read_DAT(
     noparse:
         Use the "noparse" feature of pycorsikaio, which theoretically
         makes reading in the corsika files faster
+    columns: list[str] | None
+        The columns of the particle DataFrame to return, besides the index.
+        If None, all columns are returned. (default: None)
+    particle_filter: str | None
+        Query string on the columns of the particles, e.g.
+        `"abs(pdgid) == 13 & energy > 500"`.
+        It is evaluated on the plain arrays together with `drop_mothers` and
+        `drop_non_particles`, so the DataFrame only holds the selected rows.
+        It can use all columns, also the ones not in `columns`, and is evaluated
+        after the mother columns are added.
+        (default: None)
+    compact: bool
+        Use the smallest dtypes, which can hold all values, for the particle
+        DataFrame (see `COMPACT_DTYPES`), e.g. int8 for `hadron_gen` and
+        int32 for `pdgid` and the index. The floating point columns calculated
+        in double precision (`mass`, `energy`, mother energies, masses and lifetimes)
+        are rounded to float32, like the kinematics read from the file.
+        This roughly halves the memory of the particle DataFrame.
+        (default: False)
+    mother_table: bool
+        Return the information about the mothers of the particles as a fourth DataFrame,
+        the mother table (see `panama.ancestry`), instead of as columns of the particles.
+        It only has rows for particles with a mother and the columns
+        `panama.ancestry.MOTHER_TABLE_COLUMNS`, all other mother columns are
+        looked up when joining it with `panama.ancestry.get_mother_columns`.
+        Only `is_prompt` is still added to the particles.
+        Requires EHIST output, like `mother_columns`, which is not needed in addition.
+        (default: False)
+    ragged: bool
+        Return the particles in the ragged form (see `panama.ragged`) instead of
+        indexed by run, event and particle number, which is slow to build and
+        memory-hungry for many particles. The particle DataFrame then has a
+        `RangeIndex` and keeps only `particle_number` as a column, the particles
+        of each event are consecutive rows in the order of the event DataFrame,
+        which gets the column `particle_offset` with the row of the first
+        particle of each event. The mother table is indexed by the rows of the particles.
+        (default: False)
+    n_workers: int
+        Number of processes to read the files with. Each process reads
+        (and calculates the additional columns of) whole files, which are
+        merged in the same order as when reading them one after another.
+        Can't be used together with `max_events`.
+        (default: 1)
+    memmap: bool
+        Read the files with the vectorized reader of `panama.dat`, which
+        memory maps the files and locates all particle blocks at once,
+        instead of iterating over the events with pycorsikaio.
+        This is much faster for files with many small showers.
+        (default: False)
+    catalog: Path | str | None
+        File to persist the run headers of all files in, see
+        `panama.dat.read_run_headers`. Unchanged files are then
+        not opened again to get their run header.
+        Can't be used together with `n_workers` > 1.
+        (default: None)
+    event_filter: str | None
+        Query string (like for `pandas.DataFrame.query`) on the fields of the
+        event header, e.g. `"particle_id == 14 & total_energy > 1e6"`.
+        It is evaluated as soon as the event header is read, and the
+        particles of rejected showers are not kept or converted.
+        With `memmap=True`, their particle blocks are not even read from disk,
+        while pycorsikaio (`memmap=False`) still reads and parses all blocks
+        of every event, so only `memmap=True` saves the reading time.
+        Rejected events are not counted for `max_events`.
+        (default: None)
 
     Returns
     -------
@@ -103,13 +194,520 @@ def read_DAT(
             DataFrame with the information about each event
         particles: pandas.DataFrame
             DataFrame with the information about each particle
+    and with `mother_table=True` as fourth entry
+        mothers: pandas.DataFrame
+            DataFrame with the information about the mother of each particle
+            which has one, with the same index as the particles
+    With `ragged=True`, the event DataFrame has the additional column `particle_offset`.
+    """
+    files = _get_files(files, glob)
+    _check_column_options(
+        additional_columns, mother_columns or mother_table, drop_non_particles
+    )
+
+    if run_header_features is None:
+        run_header_features = DEFAULT_RUN_HEADER_FEATURES
+
+    if event_header_features is None:
+        event_header_features = DEFAULT_EVENT_HEADER_FEATURES
+
+    if n_workers > 1:
+        if max_events is not None:
+            raise ValueError("max_events can't be used together with n_workers > 1")
+        if catalog is not None:
+            raise ValueError("catalog can't be used together with n_workers > 1")
+
+        return _read_files_parallel(
+            files,
+            n_workers=n_workers,
+            run_header_features=run_header_features,
+            event_header_features=event_header_features,
+            additional_columns=additional_columns,
+            mother_columns=mother_columns,
+            drop_mothers=drop_mothers,
+            drop_non_particles=drop_non_particles,
+            noparse=noparse,
+            columns=columns,
+            particle_filter=particle_filter,
+            compact=compact,
+            mother_table=mother_table,
+            ragged=ragged,
+            memmap=memmap,
+            event_filter=event_filter,
+        )
+
+    return _read_files(
+        files,
+        max_events=max_events,
+        catalog=catalog,
+        event_filter=event_filter,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        additional_columns=additional_columns,
+        mother_columns=mother_columns,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        noparse=noparse,
+        columns=columns,
+        particle_filter=particle_filter,
+        compact=compact,
+        mother_table=mother_table,
+        ragged=ragged,
+        memmap=memmap,
+    )
+
+
+def read_DAT_iter(
+    files: Path | str | list[Path] | None = None,
+    glob: str | None = None,
+    chunk_events: int | None = 1000,
+    chunk_particles: int | None = None,
+    max_events: int | None = None,
+    run_header_features: list[str] | None = None,
+    event_header_features: list[str] | None = None,
+    additional_columns: bool = True,
+    mother_columns: bool = False,
+    drop_mothers: bool = True,
+    drop_non_particles: bool = True,
+    noparse: bool = True,
+    columns: list[str] | None = None,
+    particle_filter: str | None = None,
+    compact: bool = False,
+    mother_table: bool = False,
+    ragged: bool = False,
+    memmap: bool = False,
+    catalog: Path | str | None = None,
+    event_filter: str | None = None,
+) -> Iterator[tuple[pd.DataFrame, ...]]:
+    """
+    Read CORSIKA DAT files chunk by chunk, so only one chunk has to be kept in memory.
+    This takes the same arguments as `read_DAT`, plus the chunk size, and yields
+    tuples of DataFrames with the same columns as the ones returned by `read_DAT`.
+
+    A chunk is finished after the event, with which `chunk_events` or
+    `chunk_particles` is reached, so chunks never split a shower.
+    The run DataFrame of each chunk holds the runs which have events in this chunk,
+    thus a run spanning multiple chunks will be part of all of them.
+
+    Parameters
+    ----------
+    files: Path or List of Paths
+        Single or list of DAT files to read, see `read_DAT`.
+    glob:
+        Globbing expression like `path/to/corsika/output/DAT*`, see `read_DAT`.
+    chunk_events: int | None
+        Maximum number of events per chunk. If None, only `chunk_particles` is considered.
+        (default: 1000)
+    chunk_particles: int | None
+        Number of particles (rows of the CORSIKA particle blocks) after which
+        a chunk is finished. If None, only `chunk_events` is considered.
+        (default: None)
+
+    Events rejected by `event_filter` don't count for the chunk size.
+    For all other parameters see `read_DAT`.
+
+    Yields
+    ------
+    A tuple (run_header, event_header, particles) for each chunk, see `read_DAT`.
     """
+    if chunk_events is None and chunk_particles is None:
+        raise ValueError(
+            "`chunk_events` and `chunk_particles` can't both be None, use `read_DAT` to read everything at once."
+        )
+
+    files = _get_files(files, glob)
+    _check_column_options(
+        additional_columns, mother_columns or mother_table, drop_non_particles
+    )
+
+    if run_header_features is None:
+        run_header_features = DEFAULT_RUN_HEADER_FEATURES
+
+    if event_header_features is None:
+        event_header_features = DEFAULT_EVENT_HEADER_FEATURES
+
+    for chunk in _iter_chunks(
+        files,
+        max_events=max_events,
+        chunk_events=chunk_events,
+        chunk_particles=chunk_particles,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        noparse=noparse,
+        memmap=memmap,
+        catalog=catalog,
+        event_filter=event_filter,
+    ):
+        if len(chunk.event_headers) == 0:
+            continue
+
+        yield _chunk_to_dataframes(
+            chunk,
+            run_header_features=run_header_features,
+            event_header_features=event_header_features,
+            additional_columns=additional_columns,
+            mother_columns=mother_columns,
+            drop_mothers=drop_mothers,
+            drop_non_particles=drop_non_particles,
+            noparse=noparse,
+            columns=columns,
+            particle_filter=particle_filter,
+            compact=compact,
+            mother_table=mother_table,
+            ragged=ragged,
+        )
+
+
+def read_events(
+    index: pd.DataFrame,
+    keys: list[tuple[int, int]] | pd.MultiIndex | None = None,
+    event_filter: str | None = None,
+    run_header_features: list[str] | None = None,
+    event_header_features: list[str] | None = None,
+    additional_columns: bool = True,
+    mother_columns: bool = False,
+    drop_mothers: bool = True,
+    drop_non_particles: bool = True,
+    noparse: bool = True,
+    columns: list[str] | None = None,
+    particle_filter: str | None = None,
+    compact: bool = False,
+    mother_table: bool = False,
+    ragged: bool = False,
+) -> tuple[pd.DataFrame, ...]:
+    """
+    Read only the given events, using the event index of the files
+    (see `panama.dat.read_index`) to go directly to their subblocks.
+    The time this takes depends only on the number of requested events and
+    their particles, not on the size of the files.
+
+    Parameters
+    ----------
+    index: pd.DataFrame
+        The event index of the files, as returned by `panama.dat.read_index`.
+    keys: list[tuple[int, int]] | pd.MultiIndex | None
+        The `(run_number, event_number)` of the events to read.
+        If None, all events of the index are read.
+    event_filter: str | None
+        Query string on the columns of the index (e.g. `"total_energy > 1e6"`),
+        only the subblocks of the events passing it are read from disk.
+        Can only use the event header fields stored in the index.
+
+    For all other parameters see `read_DAT`.
+
+    Returns
+    -------
+    A tuple (run_header, event_header, particles), see `read_DAT`.
+    The events are in the order of the index, not of `keys`.
+    """
+    _check_column_options(
+        additional_columns, mother_columns or mother_table, drop_non_particles
+    )
+
+    if run_header_features is None:
+        run_header_features = DEFAULT_RUN_HEADER_FEATURES
+
+    if event_header_features is None:
+        event_header_features = DEFAULT_EVENT_HEADER_FEATURES
 
+    selected = index
+    if keys is not None and len(keys) == 0:
+        selected = index.iloc[:0]
+    elif keys is not None:
+        positions = index.index.get_indexer(pd.MultiIndex.from_tuples(list(keys)))
+        if np.any(positions < 0):
+            raise KeyError(
+                f"Events {[key for key, pos in zip(keys, positions) if pos < 0]} are not in the index"
+            )
+        selected = index.iloc[np.unique(positions)]
+
+    if event_filter is not None:
+        selected = selected.query(event_filter)
+
+    chunk = _Chunk()
+    if len(selected) == 0 and len(index) > 0:
+        # nothing selected, the empty event headers still need the version
+        chunk.version = DATFile(index["file"].iloc[0]).version
+
+    for file, events in selected.groupby("file", sort=False):
+        dat = DATFile(file)
+        run_idx = int(dat.run_header["run_number"])
+        chunk.run_headers[run_idx] = [
+            dat.run_header[key] for key in run_header_features
+        ]
+        chunk.version = dat.version
+
+        first = dat.block_numbers(events["particles_offset"].to_numpy())
+        end = dat.block_numbers(events["particles_end_offset"].to_numpy())
+        n_blocks = end - first
+
+        # all blocks from first to end of every event, in one array
+        particle_block_event = np.repeat(np.arange(len(events)), n_blocks)
+        particle_blocks = (
+            np.arange(n_blocks.sum())
+            - np.repeat(np.cumsum(n_blocks) - n_blocks, n_blocks)
+            + np.repeat(first, n_blocks)
+        )
+        is_particle_block = dat[particle_blocks][:, :1].view(np.uint32)[:, 0] != LONG
+
+        _add_blocks(
+            chunk,
+            dat,
+            dat.block_numbers(events["evth_offset"].to_numpy()),
+            particle_blocks[is_particle_block],
+            particle_block_event[is_particle_block],
+            run_idx=run_idx,
+            event_numbers=events.index.get_level_values("event_number").to_numpy(),
+            event_header_features=event_header_features,
+            noparse=noparse,
+        )
+
+    return _chunk_to_dataframes(
+        chunk,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        additional_columns=additional_columns,
+        mother_columns=mother_columns,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        noparse=noparse,
+        columns=columns,
+        particle_filter=particle_filter,
+        compact=compact,
+        mother_table=mother_table,
+        ragged=ragged,
+    )
+
+
+def summarize_DAT(
+    files: Path | str | list[Path] | None = None,
+    glob: str | None = None,
+    aggregations: dict[str, tuple[str, ...]] | None = None,
+    chunk_events: int | None = 1000,
+    chunk_particles: int | None = None,
+    max_events: int | None = None,
+    run_header_features: list[str] | None = None,
+    event_header_features: list[str] | None = None,
+    drop_mothers: bool = True,
+    drop_non_particles: bool = True,
+    noparse: bool = True,
+    particle_filter: str | None = None,
+    memmap: bool = False,
+    catalog: Path | str | None = None,
+    event_filter: str | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read CORSIKA DAT files into per-event summaries of their particles,
+    e.g. the number of muons above some energy or the energy of the leading muon.
+    The files are read chunk by chunk (see `read_DAT_iter`) and the particles
+    of each chunk are discarded after aggregating them, so the memory needed
+    only grows with the number of events, not with the number of particles.
+
+    Parameters
+    ----------
+    files: Path or List of Paths
+        Single or list of DAT files to read, see `read_DAT`.
+    glob:
+        Globbing expression like `path/to/corsika/output/DAT*`, see `read_DAT`.
+    aggregations: dict[str, tuple[str, ...]]
+        The columns to add to the event DataFrame, as
+        `name: (column, how)` or `name: (column, how, where)`, where
+        `column` is a particle column (see `read_DAT`),
+        `how` one of `AGGREGATIONS` and `where` a query string selecting
+        the particles to aggregate, e.g.
+        `{"n_muons": ("energy", "count", "abs(pdgid) == 13 & energy > 100"),
+        "leading_muon_zenith": ("zenith", "leading", "abs(pdgid) == 13")}`.
+        Events without (selected) particles get 0 for `count` and `sum`
+        and NaN otherwise.
+    chunk_events: int | None
+        Maximum number of events per chunk, see `read_DAT_iter`. (default: 1000)
+    chunk_particles: int | None
+        Number of particles after which a chunk is finished, see `read_DAT_iter`.
+        (default: None)
+
+    For all other parameters see `read_DAT`.
+
+    Returns
+    -------
+    A tuple (run_header, event_header) like the one of `read_DAT`,
+    the event DataFrame has the additional columns of `aggregations`.
+    """
+    if aggregations is None or len(aggregations) == 0:
+        raise ValueError("At least one aggregation has to be given.")
+
+    # the particle columns of the ragged chunks, the specs are checked against them
+    # before reading, since chunks without particles never look at them
+    known = [*particle_data_dtype.names, "particle_number", *DERIVED_COLUMNS]
+    for name, (column, how, *where) in aggregations.items():
+        if how not in AGGREGATIONS:
+            raise ValueError(
+                f"Unknown aggregation {how} for {name}, available are {AGGREGATIONS}."
+            )
+        if column not in known:
+            raise ValueError(
+                f"Unknown particle columns {[column]}, available are {known}."
+            )
+        if len(where) > 0:
+            try:
+                _evaluate(dict.fromkeys(known, np.zeros(0)), where[0])
+            except NameError as e:
+                raise ValueError(
+                    f"Unknown particle columns in {where[0]} of {name}, available are {known}."
+                ) from e
+
+    run_frames = []
+    event_frames = []
+    for df_run_headers, df_event_headers, df_particles in read_DAT_iter(
+        files,
+        glob,
+        chunk_events=chunk_events,
+        chunk_particles=chunk_particles,
+        max_events=max_events,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        noparse=noparse,
+        particle_filter=particle_filter,
+        memmap=memmap,
+        catalog=catalog,
+        event_filter=event_filter,
+        ragged=True,
+    ):
+        offsets = df_event_headers.pop("particle_offset").to_numpy()
+        data = {
+            name: df_particles[name].to_numpy(copy=False)
+            for name in df_particles.columns
+        }
+        for name, (column, how, *where) in aggregations.items():
+            df_event_headers[name] = _aggregate(
+                data, offsets, column, how, where[0] if len(where) > 0 else None
+            )
+
+        run_frames.append(df_run_headers)
+        event_frames.append(df_event_headers)
+
+    if len(event_frames) == 0:
+        # every event was rejected, the summaries are empty but keep their columns
+        file_list = _get_files(files, glob)
+        if len(file_list) == 0:
+            raise ValueError("No files to read.")
+
+        df_run_headers, df_event_headers, _ = _chunk_to_dataframes(
+            _Chunk(DATFile(file_list[0]).version),
+            run_header_features=run_header_features or DEFAULT_RUN_HEADER_FEATURES,
+            event_header_features=event_header_features
+            or DEFAULT_EVENT_HEADER_FEATURES,
+            additional_columns=False,
+            mother_columns=False,
+            drop_mothers=drop_mothers,
+            drop_non_particles=drop_non_particles,
+            noparse=noparse,
+            ragged=True,
+        )
+        offsets = df_event_headers.pop("particle_offset").to_numpy()
+        for name, (column, how, *where) in aggregations.items():
+            df_event_headers[name] = _aggregate(
+                {}, offsets, column, how, where[0] if len(where) > 0 else None
+            )
+        return df_run_headers, df_event_headers
+
+    # runs spanning multiple chunks are part of each of them
+    df_run_headers = pd.concat(run_frames)
+    df_run_headers = df_run_headers[~df_run_headers.index.duplicated()]
+
+    return df_run_headers, pd.concat(event_frames)
+
+
+# the aggregations of `summarize_DAT`, `leading` is the value
+# of the particle with the highest energy
+AGGREGATIONS = ["count", "sum", "min", "max", "mean", "leading"]
+
+
+def _aggregate(
+    data: dict[str, NDArray[Any]],
+    offsets: NDArray[Any],
+    column: str,
+    how: str,
+    where: str | None,
+) -> NDArray[Any]:
+    """
+    Aggregates the particle `column` per event for `summarize_DAT`.
+    """
+    n_events = len(offsets)
+    if len(data) == 0:
+        # the chunk has no particles at all
+        if how == "count":
+            return np.zeros(n_events, dtype=np.int64)
+        return np.zeros(n_events) if how == "sum" else np.full(n_events, np.nan)
+
+    if column not in data:
+        raise ValueError(
+            f"Unknown particle columns {[column]}, available are {list(data)}."
+        )
+
+    values = data[column]
+    energy = data["energy"]
+    if where is not None:
+        selected = _evaluate(data, where)
+        # the offsets of the events in the selected particles
+        offsets = np.concatenate([[0], np.cumsum(selected)])[offsets]
+        values = values[selected]
+        energy = energy[selected]
+
+    if how == "count":
+        return ragged.counts(offsets, len(values))
+    if how == "sum":
+        return ragged.segment_sum(values, offsets)
+    if how == "min":
+        return ragged.segment_min(values, offsets)
+    if how == "max":
+        return ragged.segment_max(values, offsets)
+    if how == "mean":
+        with np.errstate(invalid="ignore"):
+            return ragged.segment_sum(values.astype(float), offsets) / ragged.counts(
+                offsets, len(values)
+            )
+
+    # leading: the first particle with the maximal energy of its event
+    is_leading = energy == ragged.broadcast(
+        ragged.segment_max(energy, offsets), offsets, len(energy)
+    )
+    events, first = np.unique(
+        ragged.event_positions(offsets, len(energy))[is_leading], return_index=True
+    )
+    result = np.full(n_events, np.nan)
+    result[events] = values[is_leading][first]
+    return result
+
+
+def _get_files(files: Path | str | list[Path] | None, glob: str | None) -> list[Path]:
+    """
+    Checks the `files` and `glob` arguments of the read functions
+    and returns the list of files to read.
+    """
     if files is None and glob is None:
         raise ValueError("`file` and `glob` can't both be None")
     if files is not None and glob is not None:
         raise ValueError("`file` and `glob` can't both be not None")
 
+    if glob is not None:
+        basepath = Path(glob).parent
+        files = list(basepath.glob(Path(glob).name))
+    elif isinstance(files, (Path, str)):  # noqa: UP038
+        files = [Path(files)]
+
+    assert isinstance(files, list)
+
+    return files
+
+
+def _check_column_options(
+    additional_columns: bool, mother_columns: bool, drop_non_particles: bool
+) -> None:
+    """
+    Raises a ValueError if the requested columns can't be calculated.
+    """
     if not additional_columns:
         if drop_non_particles:
             raise ValueError(
@@ -120,55 +718,372 @@ def read_DAT(
                 "mother_columns requires additional_columns to be calculated"
             )
 
-    if glob is not None:
-        basepath = Path(glob).parent
-        files = list(basepath.glob(Path(glob).name))
-    elif isinstance(files, (Path, str)):  # noqa: UP038
-        files = [Path(files)]
 
-    assert isinstance(files, list)
+def _read_files(
+    files: list[Path],
+    max_events: int | None,
+    run_header_features: list[str],
+    event_header_features: list[str],
+    additional_columns: bool,
+    mother_columns: bool,
+    drop_mothers: bool,
+    drop_non_particles: bool,
+    noparse: bool,
+    columns: list[str] | None = None,
+    particle_filter: str | None = None,
+    compact: bool = False,
+    mother_table: bool = False,
+    ragged: bool = False,
+    memmap: bool = False,
+    catalog: Path | str | None = None,
+    event_filter: str | None = None,
+    progress: bool = True,
+) -> tuple[pd.DataFrame, ...]:
+    """
+    Reads all files one after another into the run, event and particle DataFrames.
+    """
+    # without any chunk limits, everything ends up in one single chunk
+    (chunk,) = _iter_chunks(
+        files,
+        max_events=max_events,
+        chunk_events=None,
+        chunk_particles=None,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        noparse=noparse,
+        memmap=memmap,
+        catalog=catalog,
+        event_filter=event_filter,
+        progress=progress,
+    )
 
-    if run_header_features is None:
-        run_header_features = DEFAULT_RUN_HEADER_FEATURES
+    return _chunk_to_dataframes(
+        chunk,
+        run_header_features=run_header_features,
+        event_header_features=event_header_features,
+        additional_columns=additional_columns,
+        mother_columns=mother_columns,
+        drop_mothers=drop_mothers,
+        drop_non_particles=drop_non_particles,
+        noparse=noparse,
+        columns=columns,
+        particle_filter=particle_filter,
+        compact=compact,
+        mother_table=mother_table,
+        ragged=ragged,
+    )
 
-    if event_header_features is None:
-        event_header_features = DEFAULT_EVENT_HEADER_FEATURES
 
-    run_headers = []
-    event_headers = []
-    particles = []
+def _read_file(file: Path, **kwargs: Any) -> tuple[pd.DataFrame, ...]:
+    """
+    Reads a single file without progress bar, used by the worker processes.
+    """
+    return _read_files([file], max_events=None, progress=False, **kwargs)
 
-    # to index the particles
-    particles_run_num = []
-    particles_event_num = []
-    particles_num: list[int] = []
 
+def _read_files_parallel(
+    files: list[Path], n_workers: int, **kwargs: Any
+) -> tuple[pd.DataFrame, ...]:
+    """
+    Reads the files in `n_workers` processes and merges the
+    DataFrames in the order of `files`.
+    """
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(
+            tqdm(
+                executor.map(partial(_read_file, **kwargs), files),
+                total=len(files),
+                unit="file",
+            )
+        )
+
+    if kwargs.get("ragged", False):
+        results = _shift_ragged(results)
+
+    df_run_headers = pd.concat([result[0] for result in results])
+    df_event_headers = pd.concat([result[1] for result in results])
+
+    # files without any particles return empty DataFrames without columns,
+    # the mother table is the optional fourth entry
+    merged = [df_run_headers, df_event_headers]
+    for position in range(2, len(results[0])):
+        frames = [
+            result[position] for result in results if len(result[position].columns) > 0
+        ]
+        merged.append(pd.concat(frames) if len(frames) > 0 else pd.DataFrame([]))
+
+    return tuple(merged)
+
+
+def _shift_ragged(
+    results: list[tuple[pd.DataFrame, ...]],
+) -> list[tuple[pd.DataFrame, ...]]:
+    """
+    Shifts the particle rows of the ragged results of single files
+    (offsets, particle index and mother table index), so they can be concatenated.
+    """
+    shifted = []
+    n_particles = 0
+    for df_run_headers, df_event_headers, df_particles, *df_mothers in results:
+        df_event_headers["particle_offset"] += n_particles
+        df_particles.index += n_particles
+        for df in df_mothers:
+            df.index += n_particles
+        shifted.append((df_run_headers, df_event_headers, df_particles, *df_mothers))
+        n_particles += len(df_particles)
+
+    return shifted
+
+
+_INDEX_COLUMNS = ["run_number", "event_number", "particle_number"]
+
+# the dtypes of the particle columns with `compact=True`,
+# all other columns keep their (already minimal) dtype
+COMPACT_DTYPES = {
+    "run_number": np.int32,
+    "event_number": np.int32,
+    "particle_number": np.int32,
+    "corsikaid": np.int16,
+    "hadron_gen": np.int8,
+    "n_obs_level": np.uint8,
+    "pdgid": np.int32,
+    "mass": np.float32,
+    "energy": np.float32,
+    "mother_hadr_gen": np.float32,
+    "mother_pdgid": np.int32,
+    "mother_energy": np.float32,
+    "mother_mass": np.float32,
+    "grandmother_pdgid": np.int32,
+    "mother_lifetimes": np.float32,
+    "mother_pdgid_cleaned": np.int32,
+}
+
+
+class _ParticleBuffer:
+    """
+    Growable, preallocated arrays for the raw particle rows and their
+    run, event and particle numbers. The capacity is doubled when it is
+    exceeded, so appending costs amortized O(1) per particle and the
+    arrays are never assembled from many small pieces.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.size = 0
+        self.particles = np.empty((capacity, PARTICLE_SIZE_WORDS), dtype=np.float32)
+        self.run_number = np.empty(capacity, dtype=np.int32)
+        self.event_number = np.empty(capacity, dtype=np.int32)
+        self.particle_number = np.empty(capacity, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, n: int) -> None:
+        capacity = len(self.run_number)
+        if self.size + n <= capacity:
+            return
+
+        capacity = max(2 * capacity, self.size + n)
+        for name in ("particles", "run_number", "event_number", "particle_number"):
+            old = getattr(self, name)
+            new = np.empty((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def append(
+        self,
+        particles: NDArray[Any],
+        run_number: int,
+        event_number: int | NDArray[Any],
+        particle_number: NDArray[Any],
+    ) -> None:
+        """
+        Appends the particle rows, either as (n, 7) float32 array or
+        with the structured `particle_data_dtype`.
+        """
+        if particles.dtype.names is not None:
+            particles = particles.view(np.float32).reshape(-1, PARTICLE_SIZE_WORDS)
+
+        n = len(particles)
+        self._reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.particles[rows] = particles
+        self.run_number[rows] = run_number
+        self.event_number[rows] = event_number
+        self.particle_number[rows] = particle_number
+        self.size += n
+
+
+class _Chunk:
+    """
+    The raw content of a number of consecutive events,
+    as read by `_iter_chunks` and not yet converted to DataFrames.
+    """
+
+    def __init__(self, version: float | None = None) -> None:
+        self.version = version
+        self.run_headers: dict[int, list[Any]] = {}
+        self.event_headers: list[Any] = []
+        self.particles = _ParticleBuffer()
+        self.n_particles = 0
+
+    def is_full(self, chunk_events: int | None, chunk_particles: int | None) -> bool:
+        """
+        True if `chunk_events` or `chunk_particles` is reached.
+        """
+        return (
+            chunk_events is not None and len(self.event_headers) >= chunk_events
+        ) or (chunk_particles is not None and self.n_particles >= chunk_particles)
+
+
+def _iter_chunks(
+    files: list[Path],
+    max_events: int | None,
+    chunk_events: int | None,
+    chunk_particles: int | None,
+    run_header_features: list[str],
+    event_header_features: list[str],
+    noparse: bool,
+    memmap: bool = False,
+    catalog: Path | str | None = None,
+    event_filter: str | None = None,
+    progress: bool = True,
+) -> Iterator[_Chunk]:
+    """
+    Reads the files event by event and yields a `_Chunk` as soon as
+    `chunk_events` or `chunk_particles` is reached.
+    The last chunk is always yielded, even if it is empty.
+    """
     events = 0
 
-    # Check how many showers are there
+    # the run headers are read up front (without opening each file a second time
+    # for reading the events), to know the number of showers for the progress bar
+    run_headers = None
     n_events = 0
-    if max_events is None:
-        for file in files:
-            with CorsikaParticleFile(file) as f:
-                n_events += f.run_header["n_showers"]
-    else:
+    if max_events is not None:
         n_events = max_events
+    elif progress or catalog is not None:
+        run_headers = read_run_headers(files, catalog=catalog)
+        n_events = sum(int(run_header["n_showers"]) for run_header in run_headers)
+
+    chunk = _Chunk()
+
+    with tqdm(total=int(n_events), disable=not progress) as pbar:
+        for file_idx, file in enumerate(files):
+            if memmap:
+                dat = DATFile(file)
+                file_run_header = (
+                    dat.run_header if run_headers is None else run_headers[file_idx]
+                )
+                run_header = [file_run_header[key] for key in run_header_features]
+                run_idx = int(file_run_header["run_number"])
+                chunk.run_headers[run_idx] = run_header
+                version = chunk.version = dat.version
+
+                evth, _, particle_blocks, particle_block_event = dat.scan()
+
+                if event_filter is not None:
+                    selected = _select_events(dat[evth], dat.version, event_filter)
+                    pbar.update(n=len(evth) - selected.sum())
+
+                    # the particle blocks of rejected events are never read
+                    evth = evth[selected]
+                    is_selected = selected[particle_block_event]
+                    particle_blocks = particle_blocks[is_selected]
+                    particle_block_event = (np.cumsum(selected) - 1)[
+                        particle_block_event[is_selected]
+                    ]
+
+                event_numbers = dat.event_numbers(evth)
+
+                # same as when iterating: the event with which max_events is reached
+                # is read without particles
+                n_file_events = n_particle_events = len(evth)
+                if max_events is not None and events + len(evth) >= max_events:
+                    n_file_events = min(len(evth), max(max_events - events, 1))
+                    n_particle_events = max(n_file_events - 1, 0)
+
+                # first particle block and number of rows of each event
+                block_starts = np.searchsorted(
+                    particle_block_event, np.arange(n_particle_events + 1)
+                )
+                event_rows = np.zeros(n_file_events, dtype=int)
+                event_rows[:n_particle_events] = (
+                    np.diff(block_starts) * PARTICLES_PER_BLOCK
+                )
+
+                start = 0
+                while start < n_file_events:
+                    stop = n_file_events
+                    if chunk_events is not None:
+                        stop = min(
+                            stop, start + chunk_events - len(chunk.event_headers)
+                        )
+                    if chunk_particles is not None:
+                        reached = np.flatnonzero(
+                            chunk.n_particles + np.cumsum(event_rows[start:stop])
+                            >= chunk_particles
+                        )
+                        if len(reached) > 0:
+                            stop = start + reached[0] + 1
+
+                    block_start = block_starts[min(start, n_particle_events)]
+                    block_stop = block_starts[min(stop, n_particle_events)]
+
+                    chunk.run_headers.setdefault(run_idx, run_header)
+                    _add_blocks(
+                        chunk,
+                        dat,
+                        evth[start:stop],
+                        particle_blocks[block_start:block_stop],
+                        particle_block_event[block_start:block_stop],
+                        run_idx=run_idx,
+                        event_numbers=event_numbers,
+                        event_header_features=event_header_features,
+                        noparse=noparse,
+                    )
+
+                    pbar.update(n=stop - start)
+                    events += stop - start
+                    start = stop
+
+                    if chunk.is_full(chunk_events, chunk_particles):
+                        yield chunk
+                        chunk = _Chunk(version)
+
+                continue
 
-    version = None
-
-    with tqdm(total=int(n_events)) as pbar:
-        for file in files:
             with CorsikaParticleFile(file, parse_blocks=not noparse) as f:
-                run_headers.append([f.run_header[key] for key in run_header_features])
-                run_idx = int(f.run_header["run_number"])
+                file_run_header = (
+                    f.run_header if run_headers is None else run_headers[file_idx]
+                )
+                run_header = [file_run_header[key] for key in run_header_features]
+                run_idx = int(file_run_header["run_number"])
+                chunk.run_headers[run_idx] = run_header
 
-                version = float(str(f.run_header["version"])[:3])
+                version = float(str(file_run_header["version"])[:3])
+                chunk.version = version
 
                 for event in f:
+                    if event_filter is not None and not _select_events(
+                        (
+                            event.header
+                            if noparse
+                            else np.frombuffer(event.header.tobytes(), np.float32)
+                        ).reshape(1, -1),
+                        version,
+                        event_filter,
+                    ):
+                        pbar.update(n=1)
+                        continue
+
+                    # the run header has to be present in every chunk, which
+                    # contains events of that run
+                    chunk.run_headers.setdefault(run_idx, run_header)
+
                     if noparse:
-                        event_headers.append(event.header)
+                        chunk.event_headers.append(event.header)
                     else:
-                        event_headers.append(
+                        chunk.event_headers.append(
                             [event.header[key] for key in event_header_features]
                         )
 
@@ -186,6 +1101,10 @@ def read_DAT(
                     events += 1
 
                     if max_events is not None and events >= max_events:
+                        # the chunk can be full with this event already
+                        if chunk.is_full(chunk_events, chunk_particles):
+                            yield chunk
+                            chunk = _Chunk(version)
                         break
 
                     # if noparse:
@@ -193,20 +1112,132 @@ def read_DAT(
                     # else:
                     n_particles = event.particles.shape[0]
 
-                    if n_particles == 0:
-                        continue
+                    if n_particles != 0:
+                        chunk.particles.append(
+                            event.particles,
+                            run_idx,
+                            event_idx,
+                            np.arange(n_particles),
+                        )
+                        chunk.n_particles += n_particles
+
+                    if chunk.is_full(chunk_events, chunk_particles):
+                        yield chunk
+                        chunk = _Chunk(version)
+
+    yield chunk
+
+
+def _evaluate(columns: dict[str, NDArray[Any]], expression: str) -> NDArray[Any]:
+    """
+    Evaluates the query string `expression` on the named `columns`
+    of equal length and returns a boolean mask of the selected rows.
+    Only the columns used in the expression are put into the DataFrame.
+    """
+    used = {
+        name: values
+        for name, values in columns.items()
+        if re.search(rf"\b{name}\b", expression) is not None
+    }
+    n_rows = len(next(iter(columns.values())))
+    return (
+        pd.DataFrame(used, index=np.arange(n_rows), copy=False)
+        .eval(expression)
+        .to_numpy(dtype=bool)
+    )
+
+
+def _select_events(
+    event_headers: NDArray[Any], version: float, event_filter: str
+) -> NDArray[Any]:
+    """
+    Evaluates the query string `event_filter` on the raw event header blocks
+    (array of shape (n_events, 273)) and returns a boolean mask of the selected events.
+    """
+    parsed = np.ascontiguousarray(event_headers).view(event_header_types[version])[:, 0]
+
+    # like in the event DataFrame, only the first entry of array fields is used
+    fields = {
+        name: parsed[name] if parsed[name].ndim == 1 else parsed[name][:, 0]
+        for name in parsed.dtype.names
+    }
+    return _evaluate(fields, event_filter)
+
+
+def _add_blocks(
+    chunk: _Chunk,
+    dat: DATFile,
+    evth: NDArray[Any],
+    particle_blocks: NDArray[Any],
+    particle_block_event: NDArray[Any],
+    run_idx: int,
+    event_numbers: NDArray[Any],
+    event_header_features: list[str],
+    noparse: bool,
+) -> None:
+    """
+    Adds the events with the header blocks `evth` and their particle blocks,
+    as located by `DATFile.scan`, to the chunk.
+    `event_numbers` are the event numbers of all events in the file.
+    """
+    event_headers = dat[evth]
+    if noparse:
+        chunk.event_headers.extend(event_headers)
+    else:
+        parsed = event_headers.view(event_header_types[dat.version])[:, 0]
+        chunk.event_headers.extend(
+            [header[key] for key in event_header_features] for header in parsed
+        )
+
+    if len(particle_blocks) == 0:
+        return
 
-                    particles.append(event.particles)
+    particles, particle_event, particle_number = dat.read_particles(
+        particle_blocks, particle_block_event
+    )
+    chunk.n_particles += len(particle_blocks) * PARTICLES_PER_BLOCK
+
+    if len(particles) == 0:
+        return
 
-                    particles_run_num += [run_idx] * n_particles
-                    particles_event_num += [event_idx] * n_particles
-                    particles_num += range(n_particles)
+    chunk.particles.append(
+        particles, run_idx, event_numbers[particle_event], particle_number
+    )
+
+
+def _chunk_to_dataframes(
+    chunk: _Chunk,
+    run_header_features: list[str],
+    event_header_features: list[str],
+    additional_columns: bool,
+    mother_columns: bool,
+    drop_mothers: bool,
+    drop_non_particles: bool,
+    noparse: bool,
+    columns: list[str] | None = None,
+    particle_filter: str | None = None,
+    compact: bool = False,
+    mother_table: bool = False,
+    ragged: bool = False,
+) -> tuple[pd.DataFrame, ...]:
+    """
+    Converts the raw content of a `_Chunk` into the
+    run, event and particle DataFrames, as described in `read_DAT`.
+    """
+    version = chunk.version
 
-    df_run_headers = pd.DataFrame(run_headers, columns=run_header_features)
+    df_run_headers = pd.DataFrame(
+        list(chunk.run_headers.values()), columns=run_header_features
+    )
     df_run_headers.set_index(keys=["run_number"], inplace=True)
 
     if noparse:
-        df_event_headers = pd.DataFrame(np.array(event_headers))
+        # one row of BLOCK_SIZE_WORDS per event, also without any events
+        df_event_headers = pd.DataFrame(
+            np.array(chunk.event_headers, dtype=np.float32).reshape(
+                -1, BLOCK_SIZE_WORDS
+            )
+        )
         valid_columns = [
             v[1] // CORSIKA_FIELD_BYTE_LEN
             for v in list(event_header_types[version].fields.values())
@@ -222,237 +1253,307 @@ def read_DAT(
         df_event_headers["run_number"] = df_event_headers["run_number"].astype(int)
         df_event_headers["event_number"] = df_event_headers["event_number"].astype(int)
     else:
-        df_event_headers = pd.DataFrame(event_headers, columns=event_header_features)
+        df_event_headers = pd.DataFrame(
+            chunk.event_headers, columns=event_header_features
+        )
+        if len(chunk.event_headers) == 0:
+            # all events were rejected, the dtypes can't be inferred from the values
+            dtype = event_header_types[version]
+            df_event_headers = df_event_headers.astype(
+                {name: dtype[name].base for name in event_header_features}
+            )
     df_event_headers.set_index(keys=["run_number", "event_number"], inplace=True)
 
     # finished parsing if no particles reached observation level
-    if len(particles) == 0:
+    if len(chunk.particles) == 0:
+        if ragged:
+            df_event_headers["particle_offset"] = 0
+        if mother_table:
+            return (
+                df_run_headers,
+                df_event_headers,
+                pd.DataFrame([]),
+                pd.DataFrame([]),
+            )
         return df_run_headers, df_event_headers, pd.DataFrame([])
 
-    if noparse:
-        # necessary since we can have a different number of particles in each event
-        df_particles_l = [pd.DataFrame(p) for p in particles]
+    # all columns are kept as numpy arrays until the rows and columns
+    # to keep are known, so the DataFrame only holds the final selection
+    # views into the buffer of the chunk, so nothing is copied until rows are selected
+    n_rows = len(chunk.particles)
+    data: dict[str, NDArray[Any]] = {
+        name: chunk.particles.particles[:n_rows, offset // CORSIKA_FIELD_BYTE_LEN]
+        for name, (_, offset) in particle_data_dtype.fields.items()
+    }
+    for name in _INDEX_COLUMNS:
+        data[name] = getattr(chunk.particles, name)[:n_rows]
 
-        df_particles = pd.concat(df_particles_l, ignore_index=True)
+    if noparse:
+        # the corsikaio blocks still contain the empty rows
+        is_particle = data["particle_description"] != 0
+        if not np.all(is_particle):
+            data = {name: values[is_particle] for name, values in data.items()}
 
-        valid_columns = [
-            v[1] // CORSIKA_FIELD_BYTE_LEN
-            for v in list(particle_data_dtype.fields.values())
-        ]
-        valid_names = particle_data_dtype.names
+    if additional_columns:
+        for name in DERIVED_COLUMNS:
+            data[name] = derive_column(name, data.__getitem__)
+
+        if compact:
+            # energy is calculated with the float64 mass, so it is only rounded once
+            for name in (
+                "corsikaid",
+                "hadron_gen",
+                "n_obs_level",
+                "pdgid",
+                "mass",
+                "energy",
+            ):
+                data[name] = data[name].astype(COMPACT_DTYPES[name])
+
+        if mother_columns or mother_table:
+            # mother and grandmother are the rows right before the daughter,
+            # so the rows can only be selected after this
+            data.update(
+                _mother_columns(
+                    particle_description=data["particle_description"],
+                    is_mother=data["is_mother"],
+                    hadron_gen=data["hadron_gen"],
+                    pdgid=data["pdgid"],
+                    energy=data["energy"],
+                    mass=data["mass"],
+                    compact=compact,
+                )
+            )
 
-        mapper = dict(zip(valid_columns, valid_names))
+    if columns is not None:
+        unknown = [name for name in columns if name not in data]
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Unknown particle columns {unknown}, available are {list(data)}."
+            )
 
-        df_particles.drop(
-            columns=df_particles.columns.difference(valid_columns), inplace=True
-        )
-        df_particles.rename(columns=mapper, inplace=True)
-        df_particles.query("particle_description != 0", inplace=True)
-    else:
-        # Hopefully this is more of O(events) than O(particles)
-        np_particles = np.empty(
-            (sum([p.shape[0] for p in particles]),), dtype=particles[0].dtype
+    selected = np.ones(len(data["run_number"]), dtype=bool)
+    if drop_mothers:
+        selected &= data["particle_description"] >= 0
+    if drop_non_particles:
+        selected &= data["pdgid"] != 0
+    if particle_filter is not None:
+        selected &= _evaluate(data, particle_filter)
+
+    if mother_table:
+        # only the selected particles with a mother get a row in the mother table
+        in_table = selected & data["has_mother"]
+        df_mothers = _to_dataframe(
+            {
+                name: data[name][in_table]
+                for name in _INDEX_COLUMNS + MOTHER_TABLE_COLUMNS
+            },
+            compact,
         )
-        n = 0
-        for p in particles:
-            n_p = p.shape[0]
-            np_particles[n : n + n_p] = p
-            n += n_p
+        if ragged:
+            df_mothers.index = pd.Index(
+                np.flatnonzero(data["has_mother"][selected]), dtype=np.int64
+            )
 
-        df_particles = pd.DataFrame(np_particles)
+    if columns is not None:
+        keep = _INDEX_COLUMNS + list(columns)
+    elif mother_table:
+        # besides `is_prompt`, the mother columns are in the mother table
+        keep = [
+            name for name in data if name == "is_prompt" or name not in MOTHER_COLUMNS
+        ]
+    else:
+        keep = list(data)
 
-    df_particles["run_number"] = pd.Series(particles_run_num, dtype=int)
-    df_particles["event_number"] = pd.Series(particles_event_num, dtype=int)
-    df_particles["particle_number"] = pd.Series(particles_num, dtype=int)
+    if np.all(selected):
+        data = {name: data[name] for name in keep}
+    else:
+        data = {name: data[name][selected] for name in keep}
 
-    if additional_columns:
-        df_particles["corsikaid"] = pd.Series(
-            np.abs(df_particles["particle_description"]) // 1000, dtype=int
-        )
-        df_particles["hadron_gen"] = pd.Series(
-            (df_particles["particle_description"].abs() % 1000) // 10,
-            dtype=int,
-        )
-        df_particles["n_obs_level"] = pd.Series(
-            df_particles["particle_description"].abs() % 10,
-            dtype=int,
-        )
-        df_particles["is_mother"] = df_particles["particle_description"] < 0
-
-        # the use of pd.NA is currently experimental in Int64 type columns
-        corsikaids = df_particles["corsikaid"].unique()
-        pdg_map = {
-            corsikaid: (
-                int(Corsika7ID(corsikaid).to_pdgid())
-                if Corsika7ID(corsikaid).is_particle()
-                else PDGID_ERROR_VAL
-            )  # This will be our error value
-            for corsikaid in corsikaids
-        }
-        df_particles["pdgid"] = (
-            df_particles["corsikaid"].map(pdg_map).astype(int, copy=False)
+    if ragged:
+        df_event_headers["particle_offset"] = _particle_offsets(
+            df_event_headers.index, data.pop("run_number"), data.pop("event_number")
         )
+        df_particles = pd.DataFrame(data, copy=False)
+        if not compact:
+            df_particles["particle_number"] = df_particles["particle_number"].astype(
+                int
+            )
+    else:
+        df_particles = _to_dataframe(data, compact)
 
-        pdgids = df_particles["pdgid"].unique()
+    if mother_table:
+        return df_run_headers, df_event_headers, df_particles, df_mothers
 
-        mass_map = {}
-        for pdgid in pdgids:
-            if pdgid == PDGID_ERROR_VAL:
-                mass_map[pdgid] = 0
-            else:
-                mass = Particle.from_pdgid(pdgid).mass
-                mass_map[pdgid] = mass / 1000 if mass is not None else 0  # GeV
+    return df_run_headers, df_event_headers, df_particles
 
-        df_particles["mass"] = df_particles["pdgid"].map(mass_map, na_action=None)
-        df_particles["energy"] = df_particles.eval("sqrt(mass**2+px**2+py**2+pz**2)")
-        df_particles["zenith"] = df_particles.eval("arccos(pz/sqrt(px**2+py**2+pz**2))")
 
-        if mother_columns:
-            add_mother_columns(df_particles, pdgids)
+def _to_dataframe(data: dict[str, NDArray[Any]], compact: bool) -> pd.DataFrame:
+    """
+    Builds the DataFrame indexed by run, event and particle number from the columns.
+    """
+    # the index columns are accumulated as int32, but returned as int64
+    if not compact:
+        for name in _INDEX_COLUMNS:
+            data[name] = data[name].astype(int)
 
-    if drop_mothers:
-        df_particles.drop(
-            index=df_particles.query("particle_description < 0").index,
-            inplace=True,
-        )
+    df = pd.DataFrame(data, copy=False)
+    df.set_index(keys=_INDEX_COLUMNS, inplace=True)
+    return df
 
-    if drop_non_particles:
-        df_particles.drop(index=df_particles.query("pdgid == 0").index, inplace=True)
 
-    df_particles.set_index(
-        keys=["run_number", "event_number", "particle_number"], inplace=True
+def _particle_offsets(
+    event_index: pd.MultiIndex, run_number: NDArray[Any], event_number: NDArray[Any]
+) -> NDArray[Any]:
+    """
+    The row of the first particle of each event in `event_index`,
+    for particles ordered like the events.
+    Events without particles get the row of the next event.
+    """
+    n_particles = len(run_number)
+    starts = np.flatnonzero(
+        (np.diff(run_number, prepend=-1) != 0)
+        | (np.diff(event_number, prepend=-1) != 0)
+    )
+    events = event_index.get_indexer(
+        pd.MultiIndex.from_arrays([run_number[starts], event_number[starts]])
     )
 
-    return df_run_headers, df_event_headers, df_particles
+    counts = np.zeros(len(event_index), dtype=np.int64)
+    counts[events] = np.diff(starts, append=n_particles)
+    return np.cumsum(counts) - counts
 
 
 def add_mother_columns(
-    df_particles: pd.DataFrame, pdgids: list[int] | None = None
+    df_particles: pd.DataFrame,
+    pdgids: list[int] | None = None,
+    compact: bool = False,
 ) -> None:
     """
     Adds the information from mother and grandmother rows to
     the column of the daughter particle.
 
-    This looks so complicated, since in the table different rows
-    depend on each other. To do this in a numpy-friendly way is not
-    that trivial. (We do not want to iterate through the rows -> python loops)
-    So this is done via a shifted index array.
+    In the table different rows depend on each other, the mother and
+    grandmother rows are written right before their daughter.
+    To do this in a numpy-friendly way (We do not want to iterate through
+    the rows -> python loops), all columns are gathered with the same
+    shifted index arrays.
 
     Parameters
     ----------
     df_particles : DataFrame
         the particle dataframe with additional columns from read_DAT
     pdgids : list[int] | None
-        The unique pdgids in the dataframe. If none, they are calculated.
+        Not used anymore, the particle properties are looked up
+        in `panama.particle_table`.
+    compact : bool
+        Store the new columns with the dtypes of `COMPACT_DTYPES`,
+        like `read_DAT(..., compact=True)`. (default: False)
     """
-    if pdgids is None:
-        pdgids = df_particles["pdgid"].unique()
+    columns = _mother_columns(
+        particle_description=df_particles["particle_description"].to_numpy(copy=False),
+        is_mother=df_particles["is_mother"].to_numpy(copy=False),
+        hadron_gen=df_particles["hadron_gen"].to_numpy(copy=False),
+        pdgid=df_particles["pdgid"].to_numpy(copy=False),
+        energy=df_particles["energy"].to_numpy(copy=False),
+        mass=df_particles["mass"].to_numpy(copy=False),
+        compact=compact,
+    )
+    df_particles[list(columns)] = pd.DataFrame(
+        columns, index=df_particles.index, copy=False
+    )
 
-    mother_index = np.arange(-2, df_particles.shape[0] - 2)
-    mother_index[0] = df_particles.shape[0] - 2
-    mother_index[1] = df_particles.shape[0] - 1
 
-    grandmother_index = np.arange(-1, df_particles.shape[0] - 1)
-    grandmother_index[0] = df_particles.shape[0] - 1
+def _mother_columns(
+    particle_description: NDArray[Any],
+    is_mother: NDArray[Any],
+    hadron_gen: NDArray[Any],
+    pdgid: NDArray[Any],
+    energy: NDArray[Any],
+    mass: NDArray[Any],
+    compact: bool = False,
+) -> dict[str, NDArray[Any]]:
+    """
+    Calculates the columns added by `add_mother_columns` from the
+    plain arrays of the particle columns with the same names.
 
-    df_particles["has_mother"] = df_particles["is_mother"].iloc[mother_index].to_numpy(
-        copy=False
-    ) & df_particles["is_mother"].iloc[grandmother_index].to_numpy(copy=False)
+    Rows without mother get `PDGID_ERROR_VAL` in the pdgid columns and NaN
+    in the floating point columns, the dtypes are the ones of the inputs.
 
-    df_particles["mother_hadr_gen"] = (
-        np.abs(df_particles["particle_description"].iloc[mother_index]) % 100
-    ).to_numpy(copy=False)
-    df_particles.loc[~df_particles["has_mother"], "mother_hadr_gen"] = pd.NA
+    Returns
+    -------
+    A dict of the new column names to their arrays.
+    """
+    # the mother is two rows, the grandmother one row before the daughter
+    has_mother = np.roll(is_mother, 2) & np.roll(is_mother, 1)
+    no_mother = ~has_mother
+
+    mother_hadr_gen = np.roll(np.abs(particle_description) % 100, 2)
+    mother_hadr_gen[no_mother] = np.nan
 
     # copy mother values to daughter columns so we can drop them later
-    for name, error_val in (
-        ("pdgid", PDGID_ERROR_VAL),
-        ("energy", pd.NA),
-        ("mass", pd.NA),
-    ):
-        df_particles[f"mother_{name}"] = (
-            df_particles[name].iloc[mother_index].to_numpy(copy=False)
-        )
-        df_particles.loc[~df_particles["has_mother"], f"mother_{name}"] = error_val
+    mother_pdgid = np.roll(pdgid, 2)
+    mother_pdgid[no_mother] = PDGID_ERROR_VAL
+    mother_energy = np.roll(energy, 2)
+    mother_energy[no_mother] = np.nan
+    mother_mass = np.roll(mass, 2)
+    mother_mass[no_mother] = np.nan
 
-    # copy grandmother values to daughter columns so we can drop them later
-    for name, error_val in (("pdgid", PDGID_ERROR_VAL),):
-        df_particles[f"grandmother_{name}"] = (
-            df_particles[name].iloc[grandmother_index].to_numpy(copy=False)
-        )
-        df_particles.loc[~df_particles["has_mother"], f"mother_{name}"] = error_val
+    grandmother_pdgid = np.roll(pdgid, 1)
+    grandmother_pdgid[no_mother] = PDGID_ERROR_VAL
 
-    has_charm = {
-        pdgid: (
-            "c" in Particle.from_pdgid(pdgid).quarks.lower()
-            if pdgid != PDGID_ERROR_VAL
-            else False
-        )
-        for pdgid in pdgids
-    }
-    # explicitly force an invalid PDGID to not be charm
-    has_charm[PDGID_ERROR_VAL] = False
+    slots = particle_table.pdgid_to_slot(mother_pdgid)
+    properties = particle_table.properties()
 
     # this follows the MCEq definition
-    lifetimes = {
-        pdgid: Particle.from_pdgid(pdgid).lifetime if pdgid != PDGID_ERROR_VAL else inf
-        for pdgid in pdgids
-    }
-    for pdgid in lifetimes:
-        if lifetimes[pdgid] is None:
-            lifetimes[pdgid] = 0
-    # explicitly force invalid PDGID to have infinite lifetime
-    lifetimes[PDGID_ERROR_VAL] = inf
-
-    is_resonance = {
-        pdgid: (
-            "*" in Particle.from_pdgid(pdgid).name
-            if pdgid != PDGID_ERROR_VAL
-            else False
-        )
-        for pdgid in pdgids
-    }
-    # explicitly force an invalid PDGID to not be a resonance
-    is_resonance[PDGID_ERROR_VAL] = False
-
-    df_particles["mother_lifetimes"] = df_particles["mother_pdgid"].map(
-        lifetimes, na_action=None
-    )
-    df_particles["mother_is_resonance"] = df_particles["mother_pdgid"].map(
-        is_resonance, na_action=None
-    )
-
-    dif = df_particles["hadron_gen"].to_numpy(copy=False) - df_particles[
-        "mother_hadr_gen"
-    ].to_numpy(copy=False)
+    mother_lifetimes = np.take(properties["lifetime"], slots)
+    mother_is_resonance = np.take(properties["is_resonance"], slots)
+    mother_has_charm = np.take(properties["has_charm"], slots)
 
-    df_particles["mother_has_charm"] = df_particles["mother_pdgid"].map(
-        has_charm, na_action=None
-    )
-
-    is_pion_decay = (dif == 51) & (
-        (df_particles["mother_pdgid"].to_numpy(copy=False) == 111)
-        | (df_particles["mother_pdgid"].to_numpy(copy=False) == 211)
-        | (df_particles["mother_pdgid"].to_numpy(copy=False) == -211)
-    )
+    dif = hadron_gen - mother_hadr_gen
 
-    is_charm_decay = df_particles["mother_has_charm"].to_numpy(copy=False) & (dif == 30)
+    is_pion_decay = (dif == 51) & np.isin(mother_pdgid, (111, 211, -211))
+    is_charm_decay = mother_has_charm & (dif == 30)
 
     # this adds a cleaned version of the mother_pdgid
     # where the pdgid is replaced with the pdg error value
     # if we can't tell the motherpdgid for sure
-    df_particles["mother_pdgid_cleaned"] = df_particles["mother_pdgid"]
-    no_true_mother_idxs = ~(
-        (
-            ((dif == 1) | (dif == 0))
-            & ~df_particles["mother_is_resonance"].to_numpy(copy=False)
+    mother_pdgid_cleaned = mother_pdgid.copy()
+    mother_pdgid_cleaned[
+        ~(
+            (((dif == 1) | (dif == 0)) & ~mother_is_resonance)
+            | is_charm_decay
+            | is_pion_decay
         )
-        | is_charm_decay
-        | is_pion_decay
-    )
-    df_particles.loc[
-        no_true_mother_idxs,
-        "mother_pdgid_cleaned",
     ] = PDGID_ERROR_VAL
 
-    df_particles["is_prompt"] = is_prompt_lifetime_limit(df_particles)
+    is_prompt = _is_prompt_lifetime_limit(
+        has_mother=has_mother,
+        hadron_gen=hadron_gen,
+        mother_hadr_gen=mother_hadr_gen,
+        mother_pdgid=mother_pdgid,
+        mother_lifetimes=mother_lifetimes,
+        mother_is_resonance=mother_is_resonance,
+        mother_has_charm=mother_has_charm,
+    )
+
+    columns = {
+        "has_mother": has_mother,
+        "mother_hadr_gen": mother_hadr_gen,
+        "mother_pdgid": mother_pdgid,
+        "mother_energy": mother_energy,
+        "mother_mass": mother_mass,
+        "grandmother_pdgid": grandmother_pdgid,
+        "mother_lifetimes": mother_lifetimes,
+        "mother_is_resonance": mother_is_resonance,
+        "mother_has_charm": mother_has_charm,
+        "mother_pdgid_cleaned": mother_pdgid_cleaned,
+        "is_prompt": is_prompt,
+    }
+
+    if compact:
+        for name, values in columns.items():
+            if name in COMPACT_DTYPES:
+                columns[name] = values.astype(COMPACT_DTYPES[name], copy=False)
+
+    return columns
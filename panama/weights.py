@@ -7,13 +7,23 @@ are given in units of :math:`(\mathrm{m^2}\ \mathrm{s}\ \mathrm{sr}\ \mathrm{GeV
 
 from __future__ import annotations
 
+import hashlib
+import os
+import pickle
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import suppress
+from pathlib import Path
 from typing import Any
 
 import numpy as np
 import pandas as pd
 from fluxcomp import CosmicRayFlux, H3a
-from particle import PDGID, Corsika7ID
+from numpy.typing import ArrayLike, NDArray
+from particle import PDGID
 
+from . import particle_table, ragged
 from .constants import PDGID_PROTON_1
 
 DEFAULT_FLUX = H3a()
@@ -26,20 +36,22 @@ def get_weights(
     model: CosmicRayFlux = DEFAULT_FLUX,
     proton_only: bool = False,
     groups: dict[PDGID, tuple[int, int]] | None = None,
-) -> pd.DataFrame:
+) -> pd.Series:
     r"""
-    Returns a DataFrame with the correct weight for a given primary model
-    The DataFrame will be indexed by the run and event index, so it can be
-    assigned as a column to the particle DataFrame df.
+    Returns a Series with the correct weight of each event for a given primary model.
+    It is indexed and ordered like df_event, which is not modified.
+    To weight the particles, broadcast it to them with `broadcast_to_particles`
+    (or assign it as column to the particle DataFrame df, which aligns the
+    run and event index, but is much slower for many particles).
 
-    The primary energy can have different energy-regions, but they must not overlap,
-    if they do, an error is raised.
+    All runs of df_run are weighted together, their energy ranges can overlap
+    and have different spectral slopes.
 
     Parameters
     ----------
     df_run: The run dataframe (as returned by `panama.read_DAT`)
     df_event: The event dataframe (as returned by `panama.read_DAT`)
-    df: The particle dataframe (as returned by `panama.read_DAT`)
+    df: The particle dataframe (as returned by `panama.read_DAT`), not used anymore
     model: The Cosmic Ray primary flux model (instance of CRFlux from the FluxComp package)
     proton_only: If set to true (default is false), only proton pdgid weights are non-zero and refer to
         all-nucleon flux.
@@ -48,87 +60,583 @@ def get_weights(
 
     Returns
     -------
-    weights: A dataframe with the weights labeled by the run and event index.
+    weights: A Series with the weight of each event of df_event,
+        NaN for events of runs, which are not in df_run.
 
-    Can be used like this: `df['weights'] = panama.get_weights(df_run, df_event, df)`
+    Can be used like this:
+    `df['weights'] = panama.broadcast_to_particles(panama.get_weights(df_run, df_event, df), df_event, df)`
     """
     if groups is not None and proton_only is True:
         raise ValueError("if proton_only is true, groups must be None")
 
-    if not df_event.index.is_monotonic_increasing:
-        df_event.sort_index(inplace=True)
-    if not df.index.is_monotonic_increasing:
-        df.sort_index(inplace=True)
-    primary_pids = df_event["particle_id"].unique()
-    energy_slopes = df_run["energy_spectrum_slope"].unique()
-
-    e_intervals = [
-        pd.Interval(low, high)
-        for low, high in np.unique(
-            df_run.loc[:, ("energy_min", "energy_max")].to_numpy(), axis=0
+    simulated, energy, ext_pdf, primaries = _generation_pdf(df_run, df_event)
+
+    weights = np.full(len(df_event), np.nan)
+    weights[simulated] = _weights(
+        model, energy, ext_pdf, primaries, proton_only, groups
+    )
+    return pd.Series(weights, index=df_event.index, name="weight")
+
+
+def get_weights_models(
+    df_run: pd.DataFrame,
+    df_event: pd.DataFrame,
+    models: list[CosmicRayFlux] | dict[str, CosmicRayFlux],
+    proton_only: bool = False,
+    groups: dict[PDGID, tuple[int, int]] | None = None,
+) -> pd.DataFrame:
+    """
+    Returns the weights of the events for multiple primary models at once,
+    like calling `get_weights` for each of them, but everything not depending
+    on the model (the energy intervals, the primaries and the generation pdf)
+    is only computed once.
+
+    Parameters
+    ----------
+    df_run: The run dataframe (as returned by `panama.read_DAT`)
+    df_event: The event dataframe (as returned by `panama.read_DAT`), it is not modified
+    models: The Cosmic Ray primary flux models, as list or as dict by the name of their column.
+        In a list, the models are named by their class, which must then be unique.
+    proton_only, groups: see `get_weights`
+
+    Returns
+    -------
+    weights: A DataFrame with one column of weights per model, indexed like df_event.
+    Events of runs, which are not in df_run, get NaN, like with `get_weights`.
+
+    Can be used like this: `df_event = df_event.join(panama.get_weights_models(df_run, df_event, [H3a(), H4a()]))`
+    """
+    if groups is not None and proton_only is True:
+        raise ValueError("if proton_only is true, groups must be None")
+
+    if not isinstance(models, dict):
+        names = [type(model).__name__ for model in models]
+        if len(set(names)) != len(names):
+            raise ValueError(
+                f"The models {names} have no unique class names, pass them as dict by name."
+            )
+        models = dict(zip(names, models))
+
+    simulated, energy, ext_pdf, primaries = _generation_pdf(df_run, df_event)
+
+    weights = np.full((len(df_event), len(models)), np.nan)
+    for column, model in enumerate(models.values()):
+        weights[simulated, column] = _weights(
+            model, energy, ext_pdf, primaries, proton_only, groups
         )
-    ]
+    return pd.DataFrame(weights, index=df_event.index, columns=list(models))
+
+
+def spectral_variation(
+    pdgid: PDGID,
+    energy: NDArray[Any],
+    norm: float | NDArray[Any] = 1.0,
+    delta_gamma: float | NDArray[Any] = 0.0,
+    pivot: float | NDArray[Any] = 1e3,
+) -> NDArray[Any]:
+    """
+    The default variation of `get_weights_ensemble`, the factor
+    `norm * (energy / pivot) ** delta_gamma` on the flux of each primary,
+    i.e. a changed normalization and spectral index around the pivot energy (in GeV).
+    """
+    return np.asarray(norm * (energy / pivot) ** delta_gamma)
+
+
+def iter_weights_ensemble(
+    df_run: pd.DataFrame,
+    df_event: pd.DataFrame,
+    parameters: Mapping[str, ArrayLike] | pd.DataFrame,
+    model: CosmicRayFlux = DEFAULT_FLUX,
+    variation: Callable[..., ArrayLike] = spectral_variation,
+    proton_only: bool = False,
+    groups: dict[PDGID, tuple[int, int]] | None = None,
+    chunk_events: int = 100_000,
+) -> Iterator[tuple[slice, NDArray[np.float32]]]:
+    """
+    Yields the weights of `get_weights_ensemble` for `chunk_events` events at a time,
+    so only one chunk of `chunk_events * n_variations` weights is in memory.
 
-    # check if the energy intervals overlap, then this code won't work
-    for idx, int1 in enumerate(e_intervals[:-1]):
-        for int2 in e_intervals[idx + 1 :]:
-            if int1.overlaps(int2):
-                raise ValueError(
-                    f"The energy intervals {int1} and {int2} in the dataframe overlap and thus cannot be reweighted, with this code."
-                )
+    Yields
+    ------
+    rows: The slice of the rows of df_event of the chunk.
+    weights: A float32 array of the shape (rows, n_variations).
+    """
+    if groups is not None and proton_only is True:
+        raise ValueError("if proton_only is true, groups must be None")
+    if chunk_events < 1:
+        raise ValueError(f"chunk_events must be positive, got {chunk_events}.")
+
+    # each parameter as a row, to broadcast with the energy as column
+    values = _variation_parameters(parameters)
+    n_variations = len(next(iter(values.values())))
+    rows = {name: value[np.newaxis, :] for name, value in values.items()}
+
+    # the model and the generation pdf are only evaluated once, the variations
+    # are factors on the weights of the model
+    simulated, energy, ext_pdf, primaries = _generation_pdf(df_run, df_event)
+    weights = np.full(len(df_event), np.nan)
+    weights[simulated] = _weights(
+        model, energy, ext_pdf, primaries, proton_only, groups
+    )
+    primary_codes = np.full(len(df_event), -1)
+    for primary_code, (_, is_primary) in enumerate(primaries):
+        primary_codes[simulated[is_primary]] = primary_code
+    energy = df_event["total_energy"].to_numpy()
+
+    for start in range(0, len(df_event), chunk_events):
+        chunk = slice(start, min(start + chunk_events, len(df_event)))
+        result = np.full((chunk.stop - start, n_variations), np.nan, dtype=np.float32)
+        for primary_code, (pdgid, _) in enumerate(primaries):
+            is_primary = primary_codes[chunk] == primary_code
+            factors = variation(pdgid, energy[chunk][is_primary, np.newaxis], **rows)
+            result[is_primary] = weights[chunk][is_primary, np.newaxis] * factors
+        yield chunk, result
+
+
+def get_weights_ensemble(
+    df_run: pd.DataFrame,
+    df_event: pd.DataFrame,
+    parameters: Mapping[str, ArrayLike] | pd.DataFrame,
+    model: CosmicRayFlux = DEFAULT_FLUX,
+    variation: Callable[..., ArrayLike] = spectral_variation,
+    proton_only: bool = False,
+    groups: dict[PDGID, tuple[int, int]] | None = None,
+    chunk_events: int = 100_000,
+) -> NDArray[np.float32]:
+    """
+    Returns the weights of the events for many variations of a flux model at once,
+    e.g. for uncertainty bands from sampled spectral indices and normalizations.
+    The flux of the variation `i` is `model.flux(pdgid, E) * variation(pdgid, E, **parameters[i])`,
+    the model and everything not depending on it are only computed once.
 
-    if len(energy_slopes) != 1:
+    Parameters
+    ----------
+    df_run: The run dataframe (as returned by `panama.read_DAT`)
+    df_event: The event dataframe (as returned by `panama.read_DAT`), it is not modified
+    parameters: The parameters of the variations, by the keyword of `variation`, with one value
+        for each variation, e.g. `{"delta_gamma": rng.normal(0, 0.05, 500)}` or a DataFrame with one row per variation.
+    model: The Cosmic Ray primary flux model to vary (instance of CRFlux from the FluxComp package)
+    variation: The factor on the flux, called once per primary and chunk with the energy as column
+        of the shape (n_events, 1) and the parameters as rows of the shape (1, n_variations),
+        it must broadcast them. Default: `spectral_variation`.
+    proton_only, groups: see `get_weights`
+    chunk_events: The number of events to vary at once, which limits the memory
+        needed besides the result, see `iter_weights_ensemble` to not keep it as a whole.
+
+    Returns
+    -------
+    weights: A float32 array of the shape (n_events, n_variations), in the order of df_event.
+    Events of runs, which are not in df_run, get NaN, like with `get_weights`.
+    """
+    n_variations = len(next(iter(_variation_parameters(parameters).values())))
+    weights = np.empty((len(df_event), n_variations), dtype=np.float32)
+    for rows, chunk in iter_weights_ensemble(
+        df_run,
+        df_event,
+        parameters,
+        model,
+        variation,
+        proton_only,
+        groups,
+        chunk_events,
+    ):
+        weights[rows] = chunk
+    return weights
+
+
+def _variation_parameters(
+    parameters: Mapping[str, ArrayLike] | pd.DataFrame,
+) -> dict[str, NDArray[Any]]:
+    """
+    The parameters of `get_weights_ensemble` as flat arrays of the same length.
+    """
+    values = {
+        str(name): np.asarray(value).reshape(-1) for name, value in parameters.items()
+    }
+    if len(values) == 0:
+        raise ValueError("At least one parameter of the variations is needed.")
+
+    if len({len(value) for value in values.values()}) != 1:
         raise ValueError(
-            "There are multiple energy slopes in the dataframe and thus they cannot be reweighted with this code."
+            "All parameters need the same number of variations, got "
+            + ", ".join(f"{len(value)} for {name}" for name, value in values.items())
         )
-    energy_slope = energy_slopes[0]
+    return values
+
+
+def particle_event_codes(df_event: pd.DataFrame, df: pd.DataFrame) -> NDArray[Any]:
+    """
+    The row of df_event of each particle in df (-1 if the event is not in df_event).
+    It only depends on the index of both, so it can be computed once and reused
+    for all event-level values, see `broadcast_to_particles`.
+
+    Parameters
+    ----------
+    df_event: The event dataframe (as returned by `panama.read_DAT`)
+    df: The particle dataframe (as returned by `panama.read_DAT`),
+        indexed by run, event and particle number, or in the ragged form
+        (`read_DAT(..., ragged=True)`), then df_event needs its `particle_offset` column.
 
-    weights = []
+    Raises a ValueError, if the index of df or df_event is not the one of `panama.read_DAT`.
+    """
+    if "particle_offset" in df_event:
+        return ragged.event_positions(df_event["particle_offset"].to_numpy(), len(df))
+
+    _check_index(df, _PARTICLE_INDEX, "particle")
+    _check_index(df_event, _PARTICLE_INDEX[:2], "event")
+
+    # the (run, event) pairs are looked up once per shower, not once per particle,
+    # via the integer codes of the index levels
+    run_codes, event_codes = df.index.codes[0], df.index.codes[1]
+    n_event_levels = len(df.index.levels[1])
+    shower_codes, showers = pd.factorize(
+        run_codes.astype(np.int64) * n_event_levels + event_codes
+    )
+    positions = df_event.index.get_indexer(
+        pd.MultiIndex.from_arrays(
+            [
+                df.index.levels[0][showers // n_event_levels],
+                df.index.levels[1][showers % n_event_levels],
+            ]
+        )
+    )
+    return positions[shower_codes]
 
-    for interval in e_intervals:
-        emin, emax = interval.left, interval.right
 
-        N = 1
-        if energy_slope == -1:
-            N = np.log(emax / emin)
-        else:
-            ep = energy_slope + 1
-            N = (emax**ep - emin**ep) / ep
+def broadcast_to_particles(
+    values: pd.Series | pd.DataFrame | ArrayLike,
+    df_event: pd.DataFrame | None = None,
+    df: pd.DataFrame | None = None,
+    codes: NDArray[Any] | None = None,
+) -> NDArray[Any]:
+    """
+    Broadcasts event-level values (e.g. the weights from `get_weights`), one per row
+    of df_event, to the particles of df, without sorting or aligning any index.
 
-        for primary_pid in primary_pids:
-            mask = (
-                (df_event["particle_id"] == primary_pid)
-                & (df_event["energy_min"] == emin)
-                & (df_event["energy_max"] == emax)
+    Parameters
+    ----------
+    values: One value (or row of values) per event, in the order of df_event.
+    df_event, df: The event and particle dataframe, to compute the codes with
+        `particle_event_codes`, if they are not given.
+    codes: The result of `particle_event_codes(df_event, df)`, to reuse it.
+
+    Returns
+    -------
+    An array with the values of the event of each particle,
+    NaN for particles of events not in df_event.
+    """
+    if codes is None:
+        if df_event is None or df is None:
+            raise ValueError("Either codes or df_event and df have to be given.")
+        codes = particle_event_codes(df_event, df)
+
+    values = np.asarray(values)
+    result = np.take(values, codes, axis=0)
+    missing = codes < 0
+    if np.any(missing):
+        # bool and integer values need a float dtype for NaN, float values keep theirs
+        if result.dtype.kind in "biu":
+            result = result.astype(np.float64)
+        result[missing] = np.nan
+    return result
+
+
+# the index of the particle DataFrame, as returned by `read_DAT`
+_PARTICLE_INDEX = ["run_number", "event_number", "particle_number"]
+
+
+def _check_index(df: pd.DataFrame, names: list[str], name: str) -> None:
+    """
+    Raises a ValueError, if `df` is not indexed by the levels `names`, like from `read_DAT`.
+    """
+    if list(df.index.names) != names:
+        raise ValueError(
+            f"The {name} DataFrame needs the index ({', '.join(names)}) as returned by "
+            f"`panama.read_DAT`, got ({', '.join(map(str, df.index.names))})."
+        )
+
+
+def _generation_pdf(
+    df_run: pd.DataFrame, df_event: pd.DataFrame
+) -> tuple[NDArray[Any], NDArray[Any], NDArray[Any], list[tuple[PDGID, NDArray[Any]]]]:
+    """
+    The model independent part of the weights.
+
+    The events of all runs are weighted together, the generation pdf of an event is the
+    sum over the generation components (energy range and slope of the runs) of its
+    primary, of their number of events times their normalized power law at its energy.
+    So the ranges of the runs can overlap and have different slopes.
+
+    Returns
+    -------
+    simulated: The rows of df_event, whose run is in df_run.
+    energy: The primary energy of these events.
+    ext_pdf: The combined generation pdf of these events.
+    primaries: The pdgid of each primary and the mask of its events.
+    """
+    runs = df_run[~df_run.index.duplicated()]
+    run_rows = runs.index.get_indexer(df_event.index.get_level_values("run_number"))
+
+    # events of runs, which are not in df_run, get no weight
+    simulated = np.flatnonzero(run_rows >= 0)
+    energy = df_event["total_energy"].to_numpy()[simulated]
+
+    # integer codes of the generation component and of the primary of each event,
+    # the primaries are numbered in the order they appear, like `unique`
+    generation = runs[["energy_min", "energy_max", "energy_spectrum_slope"]].to_numpy()
+    components, component_codes = np.unique(
+        generation[run_rows[simulated]], axis=0, return_inverse=True
+    )
+    component_codes = component_codes.reshape(-1)
+    primary_codes, primary_pids = pd.factorize(
+        df_event["particle_id"].to_numpy()[simulated]
+    )
+
+    n_events = np.bincount(
+        component_codes * len(primary_pids) + primary_codes,
+        minlength=len(components) * len(primary_pids),
+    ).reshape(len(components), len(primary_pids))
+    norms = np.array(
+        [_energy_norm(emin, emax, slope) for emin, emax, slope in components]
+    )
+
+    # the component of the run of each event, in the dtype of the energy
+    # (float32 when read with noparse), like multiplying with python scalars
+    ext_pdf = np.empty_like(energy)
+    by_component = np.argsort(component_codes, kind="stable")
+    bounds = np.searchsorted(
+        component_codes[by_component], np.arange(len(components) + 1)
+    )
+    for code, (_, _, slope) in enumerate(components):
+        rows = by_component[bounds[code] : bounds[code + 1]]
+        ext_pdf[rows] = (
+            n_events[code, primary_codes[rows]].astype(energy.dtype)
+            * (energy[rows] ** slope)
+            / energy.dtype.type(norms[code])
+        )
+
+    # and all other components, whose energy range contains the event
+    if len(components) > 1:
+        order = np.argsort(energy, kind="stable")
+        sorted_energy = energy[order]
+        for code, (emin, emax, slope) in enumerate(components):
+            start = np.searchsorted(sorted_energy, emin, side="left")
+            stop = np.searchsorted(sorted_energy, emax, side="right")
+            rows = order[start:stop]
+            rows = rows[component_codes[rows] != code]
+            ext_pdf[rows] += (
+                n_events[code, primary_codes[rows]].astype(energy.dtype)
+                * (energy[rows] ** slope)
+                / energy.dtype.type(norms[code])
             )
 
-            pdgid = Corsika7ID(primary_pid).to_pdgid()
+    primaries = [
+        (
+            PDGID(particle_table.from_corsikaid([primary_pid], "pdgid")[0]),
+            primary_codes == primary_code,
+        )
+        for primary_code, primary_pid in enumerate(primary_pids)
+    ]
+    return simulated, energy, ext_pdf, primaries
 
-            if proton_only and pdgid != PDGID_PROTON_1:
-                w = df_event["total_energy"][mask]
-                w[:] = 0
-                weights += [w]
-                continue
 
-            energy = df_event["total_energy"][mask]
-            ext_pdf = energy.shape[0] * (energy**energy_slope) / N
+def _weights(
+    model: CosmicRayFlux,
+    energy: NDArray[Any],
+    ext_pdf: NDArray[Any],
+    primaries: list[tuple[PDGID, NDArray[Any]]],
+    proton_only: bool,
+    groups: dict[PDGID, tuple[int, int]] | None,
+) -> NDArray[Any]:
+    """
+    The weights of the events for `model`, with the flux
+    of each primary evaluated once for the events of all intervals.
+    """
+    flux = np.empty(len(energy))
+    for pdgid, is_primary in primaries:
+        flux[is_primary] = _model_flux(
+            model, pdgid, energy[is_primary], proton_only, groups
+        )
+
+    return flux / ext_pdf
 
-            if proton_only:
-                weights += [sum(model.total_p_and_n_flux(energy)) / ext_pdf]
-            elif groups is None:
-                weights += [
-                    model.flux(pdgid, energy, check_valid_pdgid=False) / ext_pdf
-                ]
-            else:
-                fluxes = []
-                for model_pdgid in model.validPDGIDs:
-                    if groups[pdgid][0] <= model_pdgid.Z <= groups[pdgid][1]:
-                        fluxes += [
-                            model.flux(model_pdgid, energy, check_valid_pdgid=True)
-                        ]
-                weights += [sum(fluxes) / ext_pdf]
 
-    return pd.concat(weights)
+def _energy_norm(emin: float, emax: float, energy_slope: float) -> float:
+    """
+    The integral of the simulated power law `E**energy_slope` from `emin` to `emax`.
+    """
+    if energy_slope == -1:
+        return float(np.log(emax / emin))
+
+    ep = energy_slope + 1
+    return float((emax**ep - emin**ep) / ep)
+
+
+def _model_flux(
+    model: CosmicRayFlux,
+    pdgid: PDGID,
+    energy: Any,
+    proton_only: bool,
+    groups: dict[PDGID, tuple[int, int]] | None,
+) -> Any:
+    """
+    The flux of `model` for the simulated primary `pdgid` at `energy`,
+    see `get_weights` for `proton_only` and `groups`.
+    """
+    if proton_only:
+        if pdgid != PDGID_PROTON_1:
+            return np.zeros(np.shape(energy))
+        return sum(model.total_p_and_n_flux(energy))
+
+    if groups is None:
+        return model.flux(pdgid, energy, check_valid_pdgid=False)
+
+    fluxes = []
+    for model_pdgid in model.validPDGIDs:
+        if groups[pdgid][0] <= model_pdgid.Z <= groups[pdgid][1]:
+            fluxes += [model.flux(model_pdgid, energy, check_valid_pdgid=True)]
+    return sum(fluxes)
+
+
+class CachedFlux(CosmicRayFlux):  # type: ignore[misc]
+    """
+    Wraps a flux model and interpolates its flux from tables in log-log space, for models
+    which are expensive to evaluate, e.g. `CachedFlux(GlobalSplineFit())`.
+    It can be used everywhere instead of the model itself.
+
+    The flux of each pdgid is tabulated on a log-energy grid, which is refined
+    until the interpolation deviates by at most `rtol` from the model between all
+    grid points. The tables are kept in memory for all `CachedFlux` instances
+    of models with the same parameters (the least recently used beyond `MAX_TABLES`
+    are dropped) and, with `disk_cache=True`, saved in the cache directory
+    (see `panama.particle_table.cache_dir`), so other processes don't need to
+    evaluate the model at all. Models which can't be pickled are only cached
+    in memory, for this instance.
+    Energies outside of `energy_range` are evaluated with the model.
+
+    Parameters
+    ----------
+    model: The flux model to wrap.
+    energy_range: The range of energies in GeV of the tables, it should be inside
+        the range in which the model is defined. (default: (10, 1e10))
+    rtol: The maximal relative deviation of the interpolation. (default: 1e-4)
+    disk_cache: Save and load the tables in the cache directory. (default: False)
+    """
+
+    # the maximal number of tables kept in memory
+    MAX_TABLES = 256
+
+    def __init__(
+        self,
+        model: CosmicRayFlux,
+        energy_range: tuple[float, float] = (10, 1e10),
+        rtol: float = 1e-4,
+        disk_cache: bool = False,
+    ) -> None:
+        super().__init__(model.validPDGIDs)
+        self.model = model
+        self.energy_range = energy_range
+        self.rtol = rtol
+        self.disk_cache = disk_cache
+        # the class and parameters of the model identify the tables
+        try:
+            parameters = hashlib.sha1(pickle.dumps(model)).hexdigest()
+        except (pickle.PicklingError, TypeError, AttributeError):
+            parameters = uuid.uuid4().hex
+            self.disk_cache = False
+        self.key = f"{type(model).__name__}_{parameters}"
+
+    def _flux(self, id: PDGID, E: ArrayLike, **kwargs: Any) -> ArrayLike:
+        energy = np.asarray(E, dtype=float)
+        table = None if len(kwargs) > 0 else self._table(id)
+        if table is None:
+            return self.model.flux(id, energy, **kwargs)
+
+        log_energy, log_flux = table
+        # at least 1d, so the energies outside of the table can be assigned also for scalars
+        energies = np.atleast_1d(energy)
+        log_e = np.log10(energies)
+        flux = 10 ** np.interp(log_e, log_energy, log_flux)
+
+        outside = (log_e < log_energy[0]) | (log_e > log_energy[-1])
+        if np.any(outside):
+            flux[outside] = self.model.flux(id, energies[outside])
+        return flux.reshape(energy.shape)
+
+    def _table(self, pdgid: PDGID) -> tuple[NDArray[Any], NDArray[Any]] | None:
+        """
+        The table of `pdgid` from memory, from disk or newly calculated,
+        None if the flux is not positive everywhere and can't be interpolated.
+        """
+        key = (self.key, int(pdgid), *self.energy_range, self.rtol)
+        if key in _flux_tables:
+            _flux_tables.move_to_end(key)
+            return _flux_tables[key]
+
+        path = particle_table.cache_dir() / (
+            "flux_{}_{}_{:g}_{:g}_{:g}.npz".format(*key)
+        )
+        table = None
+        if self.disk_cache:
+            with suppress(OSError, KeyError, ValueError), np.load(path) as data:
+                table = (data["log_energy"], data["log_flux"])
+
+        if table is None:
+            table = self._build_table(pdgid)
+            if self.disk_cache and table is not None:
+                with suppress(OSError):
+                    _save_flux_table(path, *table)
+
+        _flux_tables[key] = table
+        while len(_flux_tables) > self.MAX_TABLES:
+            _flux_tables.popitem(last=False)
+        return table
+
+    def _build_table(self, pdgid: PDGID) -> tuple[NDArray[Any], NDArray[Any]] | None:
+        """
+        Tabulates the flux of `pdgid`, doubling the number of grid points
+        until the interpolation at the middle between them is within `rtol`.
+        """
+        low, high = np.log10(self.energy_range)
+        n_points = int(np.ceil(8 * (high - low))) + 1
+
+        while n_points <= 2**22:
+            log_energy = np.linspace(low, high, n_points)
+            flux = np.asarray(self.model.flux(pdgid, 10**log_energy), dtype=float)
+            middle = np.asarray(
+                self.model.flux(pdgid, 10 ** ((log_energy[1:] + log_energy[:-1]) / 2)),
+                dtype=float,
+            )
+            if np.any(flux <= 0) or np.any(middle <= 0):
+                return None
+
+            log_flux = np.log10(flux)
+            interpolated = 10 ** ((log_flux[1:] + log_flux[:-1]) / 2)
+            if np.all(np.abs(interpolated / middle - 1) <= self.rtol):
+                return log_energy, log_flux
+
+            n_points = 2 * n_points - 1
+
+        raise ValueError(
+            f"The flux of {pdgid} can't be interpolated with a relative tolerance of {self.rtol}."
+        )
+
+
+# the tables of all `CachedFlux` instances, the least recently used first
+_flux_tables: OrderedDict[tuple[Any, ...], tuple[NDArray[Any], NDArray[Any]] | None] = (
+    OrderedDict()
+)
+
+
+def _save_flux_table(
+    path: Path, log_energy: NDArray[Any], log_flux: NDArray[Any]
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, so concurrent processes never see half a table
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, log_energy=log_energy, log_flux=log_flux)
+    os.replace(tmp_path, path)
 
 
 def add_weight_prompt(
@@ -147,9 +655,6 @@ def add_weight_prompt(
     weight_col_name: The column name to give for the prompt weight column (default 'weight_prompt').
     is_prompt_col_name: The name of the column which indicates the promptness of a particle.
     """
-    if not df.index.is_monotonic_increasing:
-        df.sort_index(inplace=True)
-
     df[weight_col_name] = 1.0
     df.loc[df[is_prompt_col_name] == True, weight_col_name] = (  # noqa: E712
         prompt_factor
@@ -158,31 +663,53 @@ def add_weight_prompt(
 
 def add_weight_prompt_per_event(
     df: pd.DataFrame,
-    prompt_factor: float,
+    prompt_factor: float | list[float],
     weight_col_name: str = "weight_prompt_per_event",
-    is_prompt_col_name: str = "is_prompt",
+    is_prompt_col_name: str | list[str] = "is_prompt",
 ) -> None:
     """
     Adds column "weight_prompt_per_event" to df, which will be `prompt_factor` for every particle, which is inside
     a shower, which has at least one prompt muon. For every other particle, it will be 1.
 
+    Multiple factors and prompt definitions can be given as lists, which adds one column for each
+    (combination of) them, named `{weight_col_name}_{factor}`, `{weight_col_name}_{is_prompt_col_name}`
+    or `{weight_col_name}_{is_prompt_col_name}_{factor}`.
+
     Parameters
     ----------
     df: The particle dataframe (as returned by `panama.read_DAT`)
-    prompt_factor: The number to put in the `weight_prompt` column.
+    prompt_factor: The number (or list of numbers) to put in the `weight_prompt` column.
     weight_col_name: The column name to give for the prompt weight column (default 'weight_prompt_per_event').
-    is_prompt_col_name: The name of the column which indicates the promptness of a particle (default: 'is_prompt').
+    is_prompt_col_name: The name (or list of names) of the column which indicates the promptness of a particle (default: 'is_prompt').
+
+    Raises a ValueError, if df is not indexed by run, event and particle number, like from `panama.read_DAT`.
     """
-    # For some weird reason this makes a difference, as the last line of this function does not work otherwise
-    if not df.index.is_monotonic_increasing:  # pragma: no cover
-        df.sort_index(inplace=True)
+    _check_index(df, _PARTICLE_INDEX, "particle")
 
-    df[weight_col_name] = 1.0
+    # one code per shower, from the run and event level of the index
+    run_codes, event_codes = df.index.codes[0], df.index.codes[1]
+    shower_codes, _ = pd.factorize(
+        run_codes.astype(np.int64) * len(df.index.levels[1]) + event_codes
+    )
 
-    indexes = df.query(f"{is_prompt_col_name} == True").index
-    evt_idxs: dict[int, set[Any]] = {i[0]: set() for i in indexes}
-    for i in indexes:
-        evt_idxs[i[0]].add(i[1])
+    factors = prompt_factor if isinstance(prompt_factor, list) else [prompt_factor]
+    definitions = (
+        is_prompt_col_name
+        if isinstance(is_prompt_col_name, list)
+        else [is_prompt_col_name]
+    )
 
-    for i in evt_idxs:
-        df.loc[(i, list(evt_idxs[i])), weight_col_name] = prompt_factor
+    for definition in definitions:
+        is_prompt = df[definition].to_numpy() == True  # noqa: E712
+        # showers with at least one prompt particle, broadcast to their particles
+        in_prompt_shower = (np.bincount(shower_codes, weights=is_prompt) > 0)[
+            shower_codes
+        ]
+
+        for factor in factors:
+            name = weight_col_name
+            if isinstance(is_prompt_col_name, list):
+                name += f"_{definition}"
+            if isinstance(prompt_factor, list):
+                name += f"_{factor}"
+            df[name] = np.where(in_prompt_shower, float(factor), 1.0)
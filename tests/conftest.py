@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+FILES = Path(__file__).parent / "files"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_dir(tmp_path_factory):
+    # the tests never write into the cache of the user's home
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("PANAMA_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+        yield
+
+
+@pytest.fixture
+def single_test_file():
+    return FILES / "DAT000000"
+
+
+@pytest.fixture
+def glob_test_file():
+    return FILES / "DAT*"
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import gzip
+from pathlib import Path
+
+import numpy as np
+import panama
+import pytest
+from corsikaio import CorsikaParticleFile
+from corsikaio.subblocks import particle_data_dtype
+from panama.dat import DATFile
+
+SINGLE_TEST_FILE = Path(__file__).parent / "files" / "DAT000000"
+NOEHIST_TEST_FILE = Path(__file__).parent / "files" / "noEHIST" / "DAT101001"
+
+
+def check_dat_file(path):
+    dat = DATFile(path)
+    evth, evte, particle_blocks, particle_block_event = dat.scan()
+    particles, particle_event, _ = dat.read_particles(
+        particle_blocks, particle_block_event
+    )
+
+    assert len(evth) == len(evte)
+
+    with CorsikaParticleFile(path, parse_blocks=True) as f:
+        assert dat.run_header["run_number"] == f.run_header["run_number"]
+
+        n = 0
+        for idx, event in enumerate(f):
+            assert dat[evth[idx]].tobytes() == event.header.tobytes()
+
+            n_particles = len(event.particles)
+            assert np.all(particle_event[n : n + n_particles] == idx)
+            assert np.array_equal(
+                particles[n : n + n_particles].view(particle_data_dtype)[:, 0],
+                event.particles,
+            )
+            n += n_particles
+
+        assert n == len(particles)
+
+
+@pytest.mark.parametrize("path", [SINGLE_TEST_FILE, NOEHIST_TEST_FILE])
+def test_dat_file(path):
+    check_dat_file(path)
+
+
+def test_dat_file_compressed(tmp_path, single_test_file):
+    path = tmp_path / "DAT000000.gz"
+    with open(single_test_file, "rb") as f, gzip.open(path, "wb") as f_gz:
+        f_gz.write(f.read())
+
+    check_dat_file(path)
+
+
+def test_dat_file_truncated(tmp_path, single_test_file):
+    path = tmp_path / "DAT000000"
+    with open(single_test_file, "rb") as f:
+        path.write_bytes(f.read()[:-100])
+
+    with pytest.raises(OSError, match="truncated"):
+        DATFile(path)
+
+
+def test_read_memmap(glob_test_file):
+    for noparse in (True, False):
+        df_run, df_event, df = panama.read_DAT(
+            glob=glob_test_file,
+            drop_non_particles=False,
+            mother_columns=True,
+            noparse=noparse,
+        )
+        df_run_m, df_event_m, df_m = panama.read_DAT(
+            glob=glob_test_file,
+            drop_non_particles=False,
+            mother_columns=True,
+            noparse=noparse,
+            memmap=True,
+        )
+
+        assert df_run_m.equals(df_run)
+        assert df_event_m.equals(df_event)
+        assert df_m.equals(df)
+
+    chunks = list(panama.read_DAT_iter(glob=glob_test_file, chunk_events=7))
+    chunks_m = list(
+        panama.read_DAT_iter(glob=glob_test_file, chunk_events=7, memmap=True)
+    )
+    assert len(chunks) == len(chunks_m)
+    for chunk, chunk_m in zip(chunks, chunks_m):
+        assert chunk[1].equals(chunk_m[1])
+        assert chunk[2].equals(chunk_m[2])
+
+
+def test_read_memmap_max_events(single_test_file):
+    df_run, df_event, df = panama.read_DAT(single_test_file, max_events=5)
+    df_run_m, df_event_m, df_m = panama.read_DAT(
+        single_test_file, max_events=5, memmap=True
+    )
+
+    assert len(df_event_m) == 5
+    assert df_run_m.equals(df_run)
+    assert df_event_m.equals(df_event)
+    assert df_m.equals(df)
+
+
+def test_read_run_headers(tmp_path, monkeypatch, glob_test_file):
+    files = sorted(glob_test_file.parent.glob(glob_test_file.name))
+    catalog = tmp_path / "catalog.npz"
+
+    run_headers = panama.dat.read_run_headers(files, catalog=catalog)
+    for file, run_header in zip(files, run_headers):
+        with CorsikaParticleFile(file) as f:
+            assert run_header.tobytes() == f.run_header.tobytes()
+
+    assert catalog.exists()
+
+    # the second time, no DAT file has to be opened
+    def fail(path):
+        raise AssertionError(f"{path} was opened")
+
+    monkeypatch.setattr(panama.dat, "read_run_header", fail)
+    run_headers_cached = panama.dat.read_run_headers(files, catalog=catalog)
+    assert [h.tobytes() for h in run_headers_cached] == [
+        h.tobytes() for h in run_headers
+    ]
+
+
+def test_read_catalog(tmp_path, glob_test_file):
+    catalog = tmp_path / "catalog.npz"
+
+    df_run, df_event, df = panama.read_DAT(glob=glob_test_file)
+    for _ in range(2):
+        df_run_c, df_event_c, df_c = panama.read_DAT(
+            glob=glob_test_file, catalog=catalog, memmap=True
+        )
+
+        assert df_run_c.equals(df_run)
+        assert df_event_c.equals(df_event)
+        assert df_c.equals(df)
+
+
+def test_index(tmp_path, glob_test_file):
+    # copy the files, so the index files are not written into the test directory
+    files = []
+    for file in sorted(glob_test_file.parent.glob(glob_test_file.name))[:10]:
+        files.append(tmp_path / file.name)
+        files[-1].write_bytes(file.read_bytes())
+
+    with pytest.raises(FileNotFoundError, match="No"):
+        panama.dat.read_index(files, build=False)
+
+    index = panama.dat.read_index(files)
+    assert all(panama.dat.index_path(file).exists() for file in files)
+    assert index.equals(panama.dat.read_index(files, build=False))
+
+    df_run, df_event, df = panama.read_DAT(
+        files, drop_non_particles=False, mother_columns=True
+    )
+    assert index.index.equals(df_event.index)
+    assert np.all(index["total_energy"] == df_event["total_energy"])
+
+    keys = [df_event.index[-1], df_event.index[3], df_event.index[17]]
+    df_run_e, df_event_e, df_e = panama.read_events(
+        index, keys, drop_non_particles=False, mother_columns=True
+    )
+
+    assert set(df_event_e.index) == set(keys)
+    assert df_event_e.equals(df_event.loc[df_event_e.index])
+    assert df_e.equals(df[df.index.droplevel(2).isin(keys)])
+    assert df_run_e.equals(df_run.loc[df_run_e.index])
+
+    with pytest.raises(KeyError, match="not in the index"):
+        panama.read_events(index, [(1000, 1)])
+
+    _, df_event_f, df_f = panama.read_events(
+        index, event_filter="total_energy > 1e6", drop_non_particles=False
+    )
+    selected = df_event.query("total_energy > 1e6").index
+    assert df_event_f.index.equals(selected)
+    assert len(df_f) == df.index.droplevel(2).isin(selected).sum()
+
+    # selecting nothing gives empty frames
+    for kwargs in [{"event_filter": "total_energy < 0"}, {"keys": []}]:
+        df_run_n, df_event_n, df_n = panama.read_events(index, **kwargs)
+        assert len(df_run_n) == len(df_event_n) == len(df_n) == 0
+        assert df_event_n.dtypes.equals(df_event.dtypes)
+        assert df_event_n.index.names == df_event.index.names
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import numpy as np
+import panama
+import pytest
+from panama.histogram import WeightedHistogram, histogram
+
+
+def test_weighted_histogram():
+    rng = np.random.default_rng(42)
+    x, y, w = rng.uniform(-0.5, 1.5, (3, 1000))
+    bins = {"x": np.linspace(0, 1, 11), "y": [0, 0.5, 1]}
+
+    hist = WeightedHistogram(bins)
+    hist.fill({"x": x[:500], "y": y[:500]}, w[:500])
+    other = WeightedHistogram(bins)
+    other.fill({"x": x[500:], "y": y[500:]}, w[500:])
+    hist += other
+
+    sumw, _ = np.histogramdd(
+        np.column_stack([x, y]), bins=list(bins.values()), weights=w
+    )
+    sumw2, _ = np.histogramdd(
+        np.column_stack([x, y]), bins=list(bins.values()), weights=w**2
+    )
+    assert np.allclose(hist.sumw, sumw)
+    assert np.allclose(hist.sumw2, sumw2)
+    assert np.allclose(hist.scaled(2).errors, 2 * np.sqrt(sumw2))
+
+    with pytest.raises(ValueError, match="same bins"):
+        hist += WeightedHistogram({"x": [0, 1]})
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_histogram_DAT(n_workers, glob_test_file):
+    bins = {"energy": np.geomspace(1e-1, 1e5, 21), "zenith": np.linspace(0, 1.6, 5)}
+    hist = panama.histogram_DAT(
+        glob=glob_test_file,
+        bins=bins,
+        particle_filter="abs(pdgid) == 13",
+        chunk_events=50,
+        n_workers=n_workers,
+    )
+
+    df_run, df_event, df = panama.read_DAT(glob=glob_test_file)
+    df["weight"] = panama.get_weights(df_run, df_event, df)
+    muons = df[df["pdgid"].abs() == 13]
+    sample = muons[list(bins)].to_numpy()
+    sumw, _ = np.histogramdd(sample, bins=list(bins.values()), weights=muons["weight"])
+    sumw2, _ = np.histogramdd(
+        sample, bins=list(bins.values()), weights=muons["weight"] ** 2
+    )
+
+    assert np.allclose(hist.sumw, sumw, rtol=1e-10)
+    assert np.allclose(hist.sumw2, sumw2, rtol=1e-10)
+
+    # chunks indexed by run, event and particle number
+    hist = histogram(panama.read_DAT_iter(glob=glob_test_file, chunk_events=100), bins)
+    sumw, _ = np.histogramdd(
+        df[list(bins)].to_numpy(), bins=list(bins.values()), weights=df["weight"]
+    )
+    assert np.allclose(hist.sumw, sumw, rtol=1e-10)
+
+
+def test_histogram_DAT_no_files(tmp_path):
+    for n_workers in (1, 2):
+        with pytest.raises(ValueError, match="No files"):
+            panama.histogram_DAT(
+                glob=str(tmp_path / "DAT*"),
+                bins={"energy": [1, 10]},
+                n_workers=n_workers,
+            )
+
+
+def test_histogram_generation(glob_test_file):
+    bins = {"energy": np.geomspace(1e-1, 1e5, 21)}
+    df_run, df_event, df = panama.read_DAT(glob=glob_test_file)
+    df_run = df_run.astype({"energy_spectrum_slope": float, "energy_max": float})
+
+    # different slopes of different primaries are weighted like with get_weights
+    is_proton = df_event.groupby(level="run_number")["particle_id"].first() == 14
+    df_run.loc[is_proton[is_proton].index, "energy_spectrum_slope"] = -2
+    hist = histogram([(df_run, df_event, df)], bins)
+    weights = panama.get_weights(df_run, df_event, df)
+    sumw, _ = np.histogramdd(
+        df[list(bins)].to_numpy(),
+        bins=list(bins.values()),
+        weights=panama.broadcast_to_particles(weights, df_event, df),
+    )
+    assert np.allclose(hist.sumw, sumw, rtol=1e-10)
+
+    # overlapping ranges of one primary can't be normalized chunk by chunk
+    df_run.loc[df_run.index[0], "energy_max"] = 1e10
+    with pytest.raises(ValueError, match="overlap"):
+        histogram([(df_run, df_event, df)], bins)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from math import inf
+
+import numpy as np
+import pytest
+from panama import particle_table
+
+
+@pytest.fixture
+def empty_table(tmp_path, monkeypatch):
+    monkeypatch.setenv("PANAMA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(particle_table, "_table", {})
+    return tmp_path
+
+
+def test_lookup(empty_table):
+    # mu+, pi+, p, K*(892)0, D0, invalid, out of range
+    corsikaids = np.array([5, 8, 14, 62, 116, 0, 20000])
+
+    pdgids = particle_table.from_corsikaid(corsikaids, "pdgid")
+    assert list(pdgids) == [-13, 211, 2212, 313, 421, 0, 0]
+
+    mass = particle_table.from_pdgid(pdgids, "mass")
+    has_charm = particle_table.from_pdgid(pdgids, "has_charm")
+    is_resonance = particle_table.from_pdgid(pdgids, "is_resonance")
+    assert mass[0] == pytest.approx(0.10566, rel=1e-4)
+    assert list(has_charm) == [False] * 4 + [True, False, False]
+    assert list(is_resonance) == [False] * 3 + [True] + [False] * 3
+
+    lifetimes = particle_table.from_pdgid(pdgids, "lifetime")
+    assert lifetimes[1] == pytest.approx(26.03, rel=1e-3)
+    assert lifetimes[-1] == inf
+
+    # no CORSIKA particle, None mass and lifetime
+    assert particle_table.from_pdgid([3101, 211], "lifetime")[0] == 0
+    assert particle_table.from_pdgid([3101], "mass")[0] == 0
+
+
+def test_cache(empty_table, monkeypatch):
+    pdgids = particle_table.from_corsikaid(np.arange(200), "pdgid")
+    masses = particle_table.from_corsikaid(np.arange(200), "mass")
+    assert particle_table.cache_path().parent == empty_table
+    assert particle_table.cache_path().exists()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the table should be loaded from the cache")
+
+    monkeypatch.setattr(particle_table, "_table", {})
+    monkeypatch.setattr(particle_table, "_corsikaid_to_pdgid", fail)
+    monkeypatch.setattr(particle_table, "_pdgid_properties", fail)
+
+    assert np.all(particle_table.from_corsikaid(np.arange(200), "pdgid") == pdgids)
+    assert np.all(particle_table.from_corsikaid(np.arange(200), "mass") == masses)
+
+
+def test_cache_default(tmp_path, monkeypatch):
+    # without $PANAMA_CACHE_DIR, the table is only saved when asked to
+    monkeypatch.delenv("PANAMA_CACHE_DIR")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(particle_table, "_table", {})
+
+    particle_table.from_corsikaid([5], "pdgid")
+    particle_table.from_pdgid([3101], "mass")
+    assert particle_table.cache_dir() == tmp_path / ".cache" / "panama"
+    assert not particle_table.cache_dir().exists()
+
+    particle_table.save_table()
+    assert particle_table.cache_path().exists()
+
+    monkeypatch.setattr(particle_table, "_table", {})
+    monkeypatch.setattr(particle_table, "_corsikaid_to_pdgid", None)
+    assert particle_table.from_corsikaid([5], "pdgid")[0] == -13
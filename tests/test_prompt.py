@@ -30,6 +30,27 @@ def test_prompt_definitions_similar(test_file_path=GLOB_TEST_FILE):
     assert np.sum(prompt_baseline != prompt_grandmother)/len(prompt_baseline) < 0.01
 
 
+def test_prompt_mother_table(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, drop_mothers=True
+    )
+    df_run, df_event, df_m, df_mothers = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_table=True, drop_mothers=True
+    )
+
+    for definition in (
+        panama.prompt.is_prompt_lifetime_limit,
+        panama.prompt.is_prompt_lifetime_limit_cleaned,
+        panama.prompt.is_prompt_pion_kaon,
+        panama.prompt.is_prompt_pion_kaon_grandmother,
+        panama.prompt.is_prompt_energy,
+        panama.prompt.is_prompt_energy_wrong_pdgid,
+    ):
+        assert np.array_equal(definition(df_m, df_mothers=df_mothers), definition(df))
+
+    assert "mother_lifetime_cleaned" not in df_m
+
+
 def test_none_lifetime(test_file_path=GLOB_TEST_FILE):
     df_run, df_event, df = panama.read_DAT(
         glob=test_file_path, drop_non_particles=False, mother_columns=True, drop_mothers=True
@@ -70,3 +91,102 @@ def test_weight_prompt(test_file_path=GLOB_TEST_FILE):
 
     assert np.all(df.query("is_prompt == True")["weight_prompt_per_event"] == 137.420)
     assert np.all(df.query("is_prompt == True")["weight_prompt"] == 137.420)
+
+
+def test_weight_prompt_per_event(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, drop_mothers=True
+    )
+    df["is_prompt_energy"] = panama.prompt.is_prompt_energy(df)
+
+    panama.add_weight_prompt_per_event(
+        df, [2.0, 137.420], is_prompt_col_name=["is_prompt", "is_prompt_energy"]
+    )
+
+    for definition in ["is_prompt", "is_prompt_energy"]:
+        prompt_showers = df.index.droplevel("particle_number")[df[definition]].unique()
+        in_prompt_shower = df.index.droplevel("particle_number").isin(prompt_showers)
+        for factor in [2.0, 137.420]:
+            weight = df[f"weight_prompt_per_event_{definition}_{factor}"]
+            assert np.all(weight[in_prompt_shower] == factor)
+            assert np.all(weight[~in_prompt_shower] == 1.0)
+
+    # a particle frame without its index, e.g. after reset_index
+    with pytest.raises(ValueError, match="particle_number"):
+        panama.add_weight_prompt_per_event(df.reset_index(), 2.0)
+
+
+def test_classify_prompt(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, drop_mothers=True
+    )
+    df_run, df_event, df_m, df_mothers = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_table=True, drop_mothers=True
+    )
+    columns = list(df.columns)
+
+    labels = panama.prompt.classify_prompt(df, lifetime_limit_ns=1e-3, s=10)
+    labels_m = panama.prompt.classify_prompt(df_m, lifetime_limit_ns=1e-3, s=10, df_mothers=df_mothers)
+    assert labels.dtype == np.uint8
+    assert np.array_equal(labels, labels_m)
+    # the cleaned columns are not added
+    assert list(df.columns) == columns
+
+    expected = {
+        "lifetime_limit": panama.prompt.is_prompt_lifetime_limit(df, 1e-3),
+        "lifetime_limit_cleaned": panama.prompt.is_prompt_lifetime_limit_cleaned(df, 1e-3),
+        "energy": panama.prompt.is_prompt_energy(df, 10),
+        "energy_wrong_pdgid": panama.prompt.is_prompt_energy_wrong_pdgid(df, 10),
+        "pion_kaon": panama.prompt.is_prompt_pion_kaon(df),
+        "pion_kaon_wrong_pdgid": panama.prompt.is_prompt_pion_kaon_wrong_pdgid(df),
+        "pion_kaon_grandmother": panama.prompt.is_prompt_pion_kaon_grandmother(df),
+    }
+    unpacked = panama.prompt.unpack_prompt_labels(labels)
+    assert list(unpacked) == [f"is_prompt_{name}" for name in panama.prompt.PROMPT_DEFINITIONS]
+    for name, is_prompt in expected.items():
+        assert np.array_equal(unpacked[f"is_prompt_{name}"], is_prompt), name
+        assert np.array_equal(panama.prompt.prompt_label(labels, name), is_prompt), name
+
+    # the cleaned columns are taken from df, if present
+    assert np.array_equal(panama.prompt.classify_prompt(df, lifetime_limit_ns=1e-3, s=10), labels)
+
+    # only the requested definitions are set
+    labels = panama.prompt.classify_prompt(df, ["pion_kaon", "energy"])
+    assert np.all(labels & ~np.uint8(0b10100) == 0)
+    assert np.array_equal(panama.prompt.prompt_label(labels, "pion_kaon"), expected["pion_kaon"])
+
+    with pytest.raises(ValueError, match="Unknown prompt definitions"):
+        panama.prompt.classify_prompt(df, ["lifetime"])
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_label_prompt_hdf(tmp_path, n_workers, test_file_path=GLOB_TEST_FILE):
+    pytest.importorskip("tables")
+
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, drop_mothers=True
+    )
+    path = tmp_path / "particles.hdf5"
+    df.to_hdf(path, key="particles", format="table")
+    labels = panama.prompt.classify_prompt(df.copy())
+
+    panama.prompt.label_prompt_hdf(path, chunk_particles=50_000, n_workers=n_workers)
+    df_labels = pd.read_hdf(path, "prompt_labels")
+    assert df_labels.index.equals(df.index)
+    expected = panama.prompt.unpack_prompt_labels(labels)
+    assert list(df_labels.columns) == list(expected)
+    for name, is_prompt in expected.items():
+        assert np.array_equal(df_labels[name], is_prompt), name
+
+    # packed into another file, replacing an existing table
+    output = tmp_path / "labels.hdf5"
+    for _ in range(2):
+        panama.prompt.label_prompt_hdf(
+            path, output=output, packed=True, chunk_particles=100_000, n_workers=n_workers
+        )
+    df_labels = pd.read_hdf(output, "prompt_labels")
+    assert np.array_equal(df_labels["prompt_labels"], labels)
+
+    df.to_hdf(path, key="fixed")
+    with pytest.raises(ValueError, match="fixed format"):
+        panama.prompt.label_prompt_hdf(path, key="fixed")
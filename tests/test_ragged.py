@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import numpy as np
+import panama
+import pytest
+from panama import ragged
+
+
+def test_segments():
+    # events with 2, 0, 3 and 0 particles
+    offsets = np.array([0, 2, 2, 5])
+    values = np.array([1, 4, 2, 7, 3])
+
+    assert list(ragged.counts(offsets, 5)) == [2, 0, 3, 0]
+    assert list(ragged.event_positions(offsets, 5)) == [0, 0, 2, 2, 2]
+    assert list(ragged.broadcast([10, 20, 30, 40], offsets, 5)) == [10, 10, 30, 30, 30]
+    assert list(ragged.segment_sum(values, offsets)) == [5, 0, 12, 0]
+    assert list(ragged.segment_count(values > 2, offsets)) == [1, 0, 2, 0]
+    np.testing.assert_array_equal(
+        ragged.segment_max(values, offsets), [4, np.nan, 7, np.nan]
+    )
+    np.testing.assert_array_equal(
+        ragged.segment_min(values, offsets), [1, np.nan, 2, np.nan]
+    )
+
+    # no empty events keep the dtype
+    assert ragged.segment_max(values[:2], [0, 1]).dtype == values.dtype
+
+    with pytest.raises(ValueError, match="one per event"):
+        ragged.broadcast([1, 2], offsets, 5)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_read_ragged(n_workers, glob_test_file):
+    _, df_event, df, df_mothers = panama.read_DAT(
+        glob=glob_test_file, mother_table=True
+    )
+    _, df_event_r, df_r, df_mothers_r = panama.read_DAT(
+        glob=glob_test_file, mother_table=True, ragged=True, n_workers=n_workers
+    )
+
+    assert df_event_r.drop(columns="particle_offset").equals(df_event)
+    for column in df.columns:
+        assert np.array_equal(df[column].to_numpy(), df_r[column].to_numpy()), column
+
+    offsets = df_event_r["particle_offset"].to_numpy()
+    n_particles = df.groupby(level=[0, 1]).size().reindex(df_event.index, fill_value=0)
+    assert np.array_equal(ragged.counts(offsets, len(df_r)), n_particles)
+
+    max_energy = df.groupby(level=[0, 1])["energy"].max().reindex(df_event.index)
+    np.testing.assert_array_equal(
+        ragged.segment_max(df_r["energy"], offsets), max_energy
+    )
+
+    event_numbers = df_event.index.get_level_values("event_number")
+    assert np.array_equal(
+        ragged.broadcast(event_numbers, offsets, len(df_r)),
+        df.index.get_level_values("event_number"),
+    )
+
+    # the mother table is indexed by the rows of the particles
+    mothers = panama.ancestry.get_mother_columns(df, df_mothers)
+    mothers_r = panama.ancestry.get_mother_columns(df_r, df_mothers_r)
+    for column in mothers.columns:
+        assert np.array_equal(
+            mothers[column].to_numpy(), mothers_r[column].to_numpy(), equal_nan=True
+        ), column
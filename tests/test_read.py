@@ -9,6 +9,7 @@ import pandas as pd
 import pytest
 from click.testing import CliRunner
 from corsikaio import CorsikaParticleFile
+from corsikaio.subblocks import particle_data_dtype
 from panama.cli import cli
 
 import matplotlib.pyplot as plt
@@ -50,6 +51,166 @@ def test_max_events(test_file_path=SINGLE_TEST_FILE):
     assert len(df_event) == 2
 
 
+def test_read_iter(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    )
+
+    chunks = list(
+        panama.read_DAT_iter(
+            glob=test_file_path,
+            chunk_events=7,
+            drop_non_particles=False,
+            mother_columns=True,
+        )
+    )
+
+    assert len(chunks) > 1
+    for df_run_chunk, df_event_chunk, df_chunk in chunks:
+        assert len(df_event_chunk) <= 7
+        assert set(df_event_chunk.index.get_level_values("run_number")) == set(
+            df_run_chunk.index
+        )
+
+    assert pd.concat([c[1] for c in chunks]).equals(df_event)
+
+    assert pd.concat([c[2] for c in chunks]).equals(df)
+
+
+def test_read_iter_particles(test_file_path=SINGLE_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(test_file_path)
+
+    chunks = list(
+        panama.read_DAT_iter(test_file_path, chunk_events=None, chunk_particles=5000)
+    )
+
+    assert len(chunks) > 1
+    # a chunk is only finished after a complete event
+    assert all(len(c[1]) >= 1 for c in chunks)
+    assert pd.concat([c[2] for c in chunks]).equals(df)
+
+    with pytest.raises(ValueError, match="can't both be None"):
+        next(
+            panama.read_DAT_iter(
+                test_file_path, chunk_events=None, chunk_particles=None
+            )
+        )
+
+
+@pytest.mark.parametrize("chunk_events, chunk_particles", [(5, None), (None, 5000)])
+def test_read_iter_max_events(
+    chunk_events, chunk_particles, test_file_path=GLOB_TEST_FILE
+):
+    # both readers chunk the same way, also after max_events is reached
+    chunks = {
+        memmap: list(
+            panama.read_DAT_iter(
+                glob=test_file_path,
+                chunk_events=chunk_events,
+                chunk_particles=chunk_particles,
+                max_events=40,
+                memmap=memmap,
+            )
+        )
+        for memmap in (False, True)
+    }
+
+    sizes = [len(c[1]) for c in chunks[False]]
+    assert sizes == [len(c[1]) for c in chunks[True]]
+    if chunk_events is not None:
+        assert max(sizes) <= chunk_events
+    for chunk, chunk_memmap in zip(chunks[False], chunks[True]):
+        assert chunk[1].index.equals(chunk_memmap[1].index)
+        assert len(chunk[2]) == len(chunk_memmap[2])
+
+
+def test_read_parallel(tmp_path, test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    )
+    df_run_p, df_event_p, df_p = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, n_workers=2
+    )
+
+    assert df_run_p.equals(df_run)
+    assert df_event_p.equals(df_event)
+    assert df_p.equals(df)
+
+    with pytest.raises(ValueError, match="max_events"):
+        panama.read_DAT(glob=test_file_path, max_events=10, n_workers=2)
+    with pytest.raises(ValueError, match="catalog"):
+        panama.read_DAT(
+            glob=test_file_path, catalog=tmp_path / "catalog.npz", n_workers=2
+        )
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+def test_read_event_filter(memmap, test_file_path=GLOB_TEST_FILE):
+    event_filter = "particle_id == 14 & total_energy > 1e6"
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    )
+    df_run_f, df_event_f, df_f = panama.read_DAT(
+        glob=test_file_path,
+        drop_non_particles=False,
+        mother_columns=True,
+        memmap=memmap,
+        event_filter=event_filter,
+    )
+
+    selected = df_event.query(event_filter)
+    assert 0 < len(selected) < len(df_event)
+    assert df_event_f.equals(selected)
+    assert df_f.equals(df[df.index.droplevel(2).isin(selected.index)])
+    assert df_run_f.equals(df_run)
+
+
+@pytest.mark.parametrize("memmap", [False, True])
+@pytest.mark.parametrize("noparse", [False, True])
+def test_read_event_filter_none(memmap, noparse, test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, memmap=memmap, noparse=noparse
+    )
+    df_run_f, df_event_f, df_f = panama.read_DAT(
+        glob=test_file_path,
+        memmap=memmap,
+        noparse=noparse,
+        event_filter="total_energy < 0",
+    )
+
+    # nothing selected still gives the columns, dtypes and index of the events
+    assert len(df_event_f) == 0
+    assert df_event_f.dtypes.equals(df_event.dtypes)
+    assert df_event_f.index.names == df_event.index.names
+    assert df_event_f.index.dtypes.equals(df_event.index.dtypes)
+    assert len(df_f) == 0
+    assert df_run_f.equals(df_run)
+
+
+@pytest.mark.parametrize("noparse", [True, False])
+def test_read_particle_filter(noparse, test_file_path=GLOB_TEST_FILE):
+    particle_filter = "abs(pdgid) == 13 & energy > 10"
+    columns = ["pdgid", "energy", "mother_pdgid"]
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, mother_columns=True, noparse=noparse
+    )
+    df_run_f, df_event_f, df_f = panama.read_DAT(
+        glob=test_file_path,
+        mother_columns=True,
+        noparse=noparse,
+        columns=columns,
+        particle_filter=particle_filter,
+    )
+
+    selected = df.query(particle_filter)[columns]
+    assert 0 < len(selected) < len(df)
+    assert df_f.equals(selected)
+    assert df_event_f.equals(df_event)
+
+    with pytest.raises(ValueError, match="Unknown particle columns"):
+        panama.read_DAT(glob=test_file_path, columns=["mother_pdgid"])
+
+
 def check_eq(file, df_run, df_event, particles, skip_mother=False):
     with CorsikaParticleFile(file, parse_blocks=True) as cf:
         num = 0
@@ -122,6 +283,8 @@ def test_cli(pytestconfig, tmp_path, caplog, test_file_path=SINGLE_TEST_FILE):
         [
             "hdf5",
             "--debug",
+            "--jobs",
+            "2",
             f"{test_file_path}",
             f"{tmp_path}/output.hdf5",
         ],
@@ -294,3 +457,143 @@ def test_spectral_index_proton_only(
     # Prompt muons follow primary spectrum
     assert p[0] + 3*np.sqrt(V[0, 0]) > -3.0 
     assert p[0] - 3*np.sqrt(V[0, 0]) < -2.7
+
+
+def test_particle_buffer():
+    buffer = panama.read._ParticleBuffer(capacity=2)
+    rows = np.arange(5 * 7, dtype=np.float32).reshape(5, 7)
+
+    buffer.append(rows[:3], 1, 2, np.arange(3))
+    buffer.append(
+        rows[3:].copy().view(particle_data_dtype)[:, 0],
+        1,
+        np.array([3, 4]),
+        np.arange(2),
+    )
+
+    assert len(buffer) == 5
+    assert np.all(buffer.particles[:5] == rows)
+    assert list(buffer.event_number[:5]) == [2, 2, 2, 3, 4]
+    assert list(buffer.particle_number[:5]) == [0, 1, 2, 0, 1]
+
+
+def test_read_compact(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    )
+    df_run_c, df_event_c, df_c = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True, compact=True
+    )
+
+    assert df_c["hadron_gen"].dtype == np.int8
+    assert df_c["mother_pdgid"].dtype == np.int32
+    assert df_c["energy"].dtype == np.float32
+    assert df_c.memory_usage().sum() < 0.7 * df.memory_usage().sum()
+
+    assert np.all(df_c.index.to_frame().to_numpy() == df.index.to_frame().to_numpy())
+    for column in df.columns:
+        assert df_c[column].equals(df[column].astype(df_c[column].dtype)), column
+
+
+def test_read_mother_table(test_file_path=GLOB_TEST_FILE):
+    df_run, df_event, df = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    )
+    df_run_m, df_event_m, df_m, df_mothers = panama.read_DAT(
+        glob=test_file_path, drop_non_particles=False, mother_table=True, n_workers=2
+    )
+
+    assert list(df_mothers.columns) == panama.ancestry.MOTHER_TABLE_COLUMNS
+    assert len(df_mothers) == df["has_mother"].sum()
+    assert df_m.equals(df[df_m.columns])
+
+    df_joined = panama.ancestry.get_mother_columns(df_m, df_mothers)
+    for column in df_joined.columns:
+        if column in df:
+            assert df_joined[column].equals(df[column]), column
+
+    with pytest.raises(ValueError, match="Unknown mother columns"):
+        panama.ancestry.get_mother_columns(df_m, df_mothers, ["pdgid"])
+
+
+def test_accessor(test_file_path=GLOB_TEST_FILE):
+    _, _, df = panama.read_DAT(glob=test_file_path, drop_non_particles=False)
+    _, _, df_lazy = panama.read_DAT(
+        glob=test_file_path, additional_columns=False, drop_non_particles=False
+    )
+
+    assert "energy" not in df_lazy
+    for column in panama.accessor.DERIVED_COLUMNS:
+        assert df_lazy.panama.get(column).equals(df[column]), column
+    # existing columns are passed through
+    assert df.panama.energy.equals(df["energy"])
+
+    # cached on the same rows
+    assert np.shares_memory(df_lazy.panama.energy, df_lazy.panama.energy)
+
+    # filtered copies and in-place filtering get new values
+    df_muons = df_lazy[df_lazy.panama.pdgid.abs() == 13]
+    assert df_muons.panama.energy.equals(df["energy"][df["pdgid"].abs() == 13])
+
+    df_lazy.drop(df_lazy.index[df_lazy.panama.is_mother], inplace=True)
+    assert df_lazy.panama.zenith.equals(df["zenith"][~df["is_mother"]])
+
+    with pytest.raises(ValueError):
+        df_lazy.panama.get("not_a_column")
+
+
+def test_summarize(test_file_path=GLOB_TEST_FILE):
+    aggregations = {
+        "n_muons": ("energy", "count", "abs(pdgid) == 13 & energy > 1"),
+        "muon_energy": ("energy", "sum", "abs(pdgid) == 13"),
+        "leading_muon_zenith": ("zenith", "leading", "abs(pdgid) == 13"),
+        "mean_energy": ("energy", "mean"),
+    }
+    df_run, df_event = panama.summarize_DAT(
+        glob=test_file_path, aggregations=aggregations, chunk_events=37
+    )
+    df_run_full, df_event_full, df = panama.read_DAT(glob=test_file_path)
+
+    assert df_run.equals(df_run_full)
+    assert df_event.drop(columns=list(aggregations)).equals(df_event_full)
+
+    def per_event(series):
+        return series.reindex(df_event.index).to_numpy()
+
+    muons = df[df["pdgid"].abs() == 13]
+    n_muons = per_event(muons[muons["energy"] > 1].groupby(level=[0, 1]).size())
+    assert np.array_equal(df_event["n_muons"], np.nan_to_num(n_muons))
+    muon_energy = per_event(muons.groupby(level=[0, 1])["energy"].sum())
+    assert np.allclose(df_event["muon_energy"], np.nan_to_num(muon_energy))
+    mean_energy = per_event(df.groupby(level=[0, 1])["energy"].mean())
+    assert np.allclose(df_event["mean_energy"], mean_energy, equal_nan=True)
+
+    leading = muons.loc[muons.groupby(level=[0, 1])["energy"].idxmax()]
+    leading_zenith = per_event(leading["zenith"].droplevel("particle_number"))
+    assert np.array_equal(
+        df_event["leading_muon_zenith"], leading_zenith, equal_nan=True
+    )
+
+    # every event rejected
+    df_run_n, df_event_n = panama.summarize_DAT(
+        glob=test_file_path, aggregations=aggregations, event_filter="total_energy < 0"
+    )
+    assert len(df_run_n) == len(df_event_n) == 0
+    assert list(df_run_n.columns) == list(df_run.columns)
+    assert df_run_n.index.name == df_run.index.name
+    assert df_event_n.dtypes.equals(df_event.dtypes)
+    assert df_event_n.index.names == df_event.index.names
+
+    with pytest.raises(ValueError, match="median"):
+        panama.summarize_DAT(
+            glob=test_file_path, aggregations={"x": ("energy", "median")}
+        )
+
+    # unknown columns are found before reading, also if no particle is read
+    for spec in [("muon_energy", "max"), ("energy", "max", "abs(pdg) == 13")]:
+        with pytest.raises(ValueError, match="Unknown particle columns"):
+            panama.summarize_DAT(
+                glob=test_file_path,
+                aggregations={"x": spec},
+                event_filter="total_energy < 0",
+            )
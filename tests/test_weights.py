@@ -1,5 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
+import threading
 
 import numpy as np
 import panama
@@ -8,6 +9,7 @@ import pytest
 from click.testing import CliRunner
 from corsikaio import CorsikaParticleFile
 from panama.cli import cli
+from particle import PDGID
 from particle.pdgid import literals
 import fluxcomp
 from fluxcomp import muon_fluxes
@@ -37,20 +39,60 @@ def test_weight_wrong_arg(
         )
 
 
-def test_weight_overlapping_energy(
-    tmp_path,
+def _reference_weights(df_run, df_event, model):
+    """The weights with the combined generation pdf, one event at a time."""
+    generation = df_run.loc[
+        df_event.index.get_level_values("run_number"),
+        ["energy_min", "energy_max", "energy_spectrum_slope"],
+    ].to_numpy(dtype=float)
+    components = pd.DataFrame(generation, columns=["emin", "emax", "slope"])
+    components["particle_id"] = df_event["particle_id"].to_numpy()
+    n_events = components.groupby(list(components.columns)).size()
+
+    weights = []
+    for energy, particle_id in zip(df_event["total_energy"], df_event["particle_id"]):
+        pdf = 0
+        for (emin, emax, slope, pid), n in n_events.items():
+            if pid == particle_id and emin <= energy <= emax:
+                ep = slope + 1
+                norm = np.log(emax / emin) if ep == 0 else (emax**ep - emin**ep) / ep
+                pdf += n * energy**slope / norm
+        pdgid = PDGID(panama.particle_table.from_corsikaid([particle_id], "pdgid")[0])
+        weights.append(model.flux(pdgid, np.array([energy]))[0] / pdf)
+    return np.array(weights)
+
+
+@pytest.mark.parametrize(
+    "energy_min, energy_max, slope",
+    [
+        # overlapping ranges
+        ([1e4, 1e3, 1e4], [1e9, 1e9, 1e10], [-1, -1, -1]),
+        # the same range with different slopes
+        ([1e4, 1e4, 1e4], [1e9, 1e9, 1e9], [-1, -2, -2.7]),
+        # overlapping ranges with different slopes
+        ([1e3, 1e4, 1e2], [1e10, 1e9, 1e10], [-2, -1, -1.5]),
+    ],
+)
+def test_weight_combined_generation(
+    energy_min,
+    energy_max,
+    slope,
     test_file_path=GLOB_TEST_FILE,
 ):
-    df_run, df_event, df = panama.read_DAT(
-        glob=test_file_path, drop_non_particles=False, mother_columns=True
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+    df_run = df_run.astype(
+        {"energy_min": float, "energy_max": float, "energy_spectrum_slope": float}
     )
+    # every third run gets the same settings
+    settings = np.arange(len(df_run)) % 3
+    df_run["energy_min"] = np.array(energy_min)[settings]
+    df_run["energy_max"] = np.array(energy_max)[settings]
+    df_run["energy_spectrum_slope"] = np.array(slope)[settings]
 
-    df_run.loc[:1, "energy_max"] = 1e20
-
-    with pytest.raises(ValueError, match="overlap and thus cannot be reweighted"):
-        ws = panama.get_weights(
-            df_run, df_event, df, model=fluxcomp.H3a(), proton_only=True
-        )
+    model = fluxcomp.H3a()
+    ws = panama.get_weights(df_run, df_event, df, model=model)
+    assert not np.any(np.isnan(ws))
+    assert np.allclose(ws, _reference_weights(df_run, df_event, model), rtol=1e-5)
 
 
 def test_weight_groups(
@@ -86,26 +128,6 @@ def test_weight_groups(
     assert p[0] + np.sqrt(V[0, 0]) > -3.0 
     assert p[0] - np.sqrt(V[0, 0]) < -2.7
 
-def test_weight_multiple_slopes(
-    tmp_path,
-    test_file_path=GLOB_TEST_FILE,
-):
-    df_run, df_event, df = panama.read_DAT(
-        glob=test_file_path, drop_non_particles=False, mother_columns=True
-    )
-
-    df_run.loc[:1, "energy_spectrum_slope"] = 7
-
-    with pytest.raises(
-        ValueError,
-        match=
-        'There are multiple energy slopes in the dataframe and thus they cannot be reweighted with this code.'
-    ):
-        ws = panama.get_weights(
-            df_run, df_event, df, model=fluxcomp.H3a(), proton_only=True
-        )
-
-
 def test_weight_slope_2(
     tmp_path,
     test_file_path=GLOB_TEST_FILE,
@@ -139,3 +161,225 @@ def test_weight_slope_2(
     # test if fittet spectral index is between 2.7 and 3
     assert p[0] + np.sqrt(V[0, 0]) < -3.0 or p[0] - np.sqrt(V[0, 0]) > -2.7
 
+
+
+def test_weight_many_intervals(
+    tmp_path,
+    test_file_path=GLOB_TEST_FILE,
+):
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+
+    # a separate energy range for every run, in decades
+    energy_min = 10.0 ** (4 + np.arange(len(df_run)) % 5)
+    df_run["energy_min"] = energy_min
+    df_run["energy_max"] = 10 * energy_min
+    run_numbers = df_event.index.get_level_values("run_number")
+    df_event["energy_min"] = df_run.loc[run_numbers, "energy_min"].to_numpy()
+    df_event["energy_max"] = df_run.loc[run_numbers, "energy_max"].to_numpy()
+    # only the events, which are inside the new range of their run
+    df_event = df_event[
+        df_event["total_energy"].between(df_event["energy_min"], df_event["energy_max"])
+    ]
+    run_numbers = df_event.index.get_level_values("run_number")
+
+    ws = panama.get_weights(df_run, df_event, df)
+    assert ws.index.equals(df_event.index)
+
+    # each range on its own gives the same weights
+    for emin in np.unique(energy_min):
+        runs = df_run.index[df_run["energy_min"] == emin]
+        events = df_event[run_numbers.isin(runs)]
+        ws_range = panama.get_weights(df_run.loc[runs], events, df.iloc[:0])
+        assert np.array_equal(ws[ws_range.index], ws_range)
+
+    # events of runs, which are not in df_run, get no weight
+    ws = panama.get_weights(df_run.iloc[1:], df_event, df)
+    assert np.all(np.isnan(ws[run_numbers == df_run.index[0]]))
+    assert not np.any(np.isnan(ws[run_numbers != df_run.index[0]]))
+
+
+def test_weights_models(
+    tmp_path,
+    test_file_path=GLOB_TEST_FILE,
+):
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+    df_event_orig = df_event.copy()
+
+    models = [fluxcomp.H3a(), fluxcomp.H4a(), fluxcomp.GlobalFitGST()]
+    ws = panama.get_weights_models(df_run, df_event, models)
+    assert df_event.equals(df_event_orig)
+    assert list(ws.columns) == ["H3a", "H4a", "GlobalFitGST"]
+    assert ws.index.equals(df_event.index)
+
+    for name, model in zip(ws.columns, models):
+        w = panama.get_weights(df_run, df_event, df, model=model)
+        assert np.array_equal(ws[name], w)
+
+    ws = panama.get_weights_models(df_run, df_event, {"p": fluxcomp.H3a()}, proton_only=True)
+    w = panama.get_weights(df_run, df_event, df, proton_only=True)
+    assert np.array_equal(ws["p"], w)
+
+    with pytest.raises(ValueError, match="unique"):
+        panama.get_weights_models(df_run, df_event, [fluxcomp.H3a(), fluxcomp.H3a()])
+
+
+def test_weights_ensemble(
+    tmp_path,
+    test_file_path=GLOB_TEST_FILE,
+):
+    from panama.weights import iter_weights_ensemble
+
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+    df_event_orig = df_event.copy()
+
+    rng = np.random.default_rng(1)
+    parameters = {"norm": rng.normal(1, 0.1, 50), "delta_gamma": rng.normal(0, 0.05, 50)}
+    ws = panama.get_weights_ensemble(df_run, df_event, parameters, chunk_events=64)
+    assert ws.shape == (len(df_event), 50)
+    assert ws.dtype == np.float32
+    assert df_event.equals(df_event_orig)
+
+    w = panama.get_weights(df_run, df_event, df).to_numpy()
+    energy = df_event["total_energy"].to_numpy()
+    for i in [0, 17, 49]:
+        expected = w * parameters["norm"][i] * (energy / 1e3) ** parameters["delta_gamma"][i]
+        assert np.allclose(ws[:, i], expected, rtol=1e-6)
+
+    # the chunks give the same weights, events of missing runs get NaN
+    chunks = list(
+        iter_weights_ensemble(df_run, df_event, pd.DataFrame(parameters), chunk_events=100)
+    )
+    assert [rows.start for rows, _ in chunks] == list(range(0, 900, 100))
+    assert np.array_equal(np.concatenate([chunk for _, chunk in chunks]), ws)
+
+    ws_runs = panama.get_weights_ensemble(df_run.iloc[1:], df_event, parameters)
+    missing = df_event.index.get_level_values("run_number") == df_run.index[0]
+    assert np.all(np.isnan(ws_runs[missing]))
+    assert not np.any(np.isnan(ws_runs[~missing]))
+
+    # a custom variation per primary
+    def proton_variation(pdgid, energy, scale):
+        return np.where(pdgid == literals.proton, scale, 1.0) * np.ones_like(energy)
+
+    ws = panama.get_weights_ensemble(
+        df_run, df_event, {"scale": [1, 2]}, variation=proton_variation
+    )
+    is_proton = df_event["particle_id"].to_numpy() == 14
+    assert np.allclose(ws[:, 0], w, rtol=1e-6)
+    assert np.allclose(ws[is_proton, 1], 2 * w[is_proton], rtol=1e-6)
+    assert np.allclose(ws[~is_proton, 1], w[~is_proton], rtol=1e-6)
+
+    with pytest.raises(ValueError, match="same number"):
+        panama.get_weights_ensemble(df_run, df_event, {"norm": [1, 2], "delta_gamma": [0]})
+
+
+def test_broadcast_to_particles(
+    tmp_path,
+    test_file_path=GLOB_TEST_FILE,
+):
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+    # shuffled events, the weights keep their order and nothing is sorted
+    df_event = df_event.sample(frac=1, random_state=1)
+    df_event_orig = df_event.copy()
+    df_orig = df.copy()
+
+    ws = panama.get_weights(df_run, df_event, df)
+    assert ws.index.equals(df_event.index)
+    assert df_event.equals(df_event_orig)
+    assert df.equals(df_orig)
+
+    expected = ws.reindex(df.index.droplevel(2)).to_numpy()
+    codes = panama.particle_event_codes(df_event, df)
+    assert np.array_equal(panama.broadcast_to_particles(ws, codes=codes), expected)
+    assert np.array_equal(panama.broadcast_to_particles(ws, df_event, df), expected)
+
+    # particles of missing events get NaN
+    w = panama.broadcast_to_particles(ws.iloc[1:], df_event.iloc[1:], df)
+    missing = df.index.droplevel(2).isin(df_event.index[:1])
+    assert np.all(np.isnan(w[missing]))
+    assert np.array_equal(w[~missing], expected[~missing])
+
+    # integer values are not rounded when NaN is added
+    counts = np.arange(len(df_event)) + 4097
+    w = panama.broadcast_to_particles(counts[1:], df_event.iloc[1:], df)
+    assert w.dtype == np.float64
+    assert np.all(np.isnan(w[missing]))
+    assert np.array_equal(w[~missing], np.take(counts, codes)[~missing])
+
+    # the ragged form
+    _, df_event_r, df_r = panama.read_DAT(glob=test_file_path, ragged=True)
+    ws_r = panama.get_weights(df_run, df_event_r, df_r)
+    w = panama.broadcast_to_particles(ws_r, df_event_r, df_r)
+    assert np.array_equal(w, ws_r.reindex(df.index.droplevel(2)).to_numpy())
+
+    with pytest.raises(ValueError, match="codes"):
+        panama.broadcast_to_particles(ws)
+
+    # a particle frame without its index, e.g. after reset_index
+    with pytest.raises(ValueError, match="particle_number"):
+        panama.particle_event_codes(df_event, df.reset_index())
+    with pytest.raises(ValueError, match="particle_number"):
+        panama.broadcast_to_particles(ws, df_event, df.reset_index())
+    with pytest.raises(ValueError, match="event_number"):
+        panama.broadcast_to_particles(ws, df_event.reset_index(), df)
+
+
+def test_cached_flux(
+    tmp_path,
+    monkeypatch,
+    test_file_path=GLOB_TEST_FILE,
+):
+    from panama import weights
+
+    monkeypatch.setenv("PANAMA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(weights, "_flux_tables", weights.OrderedDict())
+
+    model = fluxcomp.H3a()
+    cached = weights.CachedFlux(model, rtol=1e-5, disk_cache=True)
+
+    energy = np.geomspace(1, 1e12, 10000)
+    for pdgid in model.validPDGIDs:
+        assert np.allclose(
+            cached.flux(pdgid, energy), model.flux(pdgid, energy), rtol=1e-5, atol=0
+        )
+    assert len(list(tmp_path.glob("flux_H3a_*.npz"))) == len(model.validPDGIDs)
+
+    df_run, df_event, df = panama.read_DAT(glob=test_file_path)
+    ws = panama.get_weights(df_run, df_event, df, model=model)
+    ws_cached = panama.get_weights(df_run, df_event, df, model=cached)
+    assert np.allclose(ws, ws_cached, rtol=1e-5, atol=0)
+
+    # the tables are loaded from disk, without evaluating the model
+    def fail(*args, **kwargs):
+        raise AssertionError("the flux should be interpolated")
+
+    monkeypatch.setattr(weights, "_flux_tables", weights.OrderedDict())
+    cached = weights.CachedFlux(fluxcomp.H3a(), rtol=1e-5, disk_cache=True)
+    energy = np.geomspace(10, 1e10, 1000)
+    expected = model.flux(model.validPDGIDs[0], energy)
+    monkeypatch.setattr(fluxcomp.H3a, "_flux", fail)
+    assert np.allclose(
+        cached.flux(model.validPDGIDs[0], energy), expected, rtol=1e-5, atol=0
+    )
+
+
+def test_cached_flux_scalar(tmp_path, monkeypatch):
+    from panama import weights
+
+    monkeypatch.setenv("PANAMA_CACHE_DIR", str(tmp_path))
+    model = fluxcomp.H3a()
+    pdgid = model.validPDGIDs[0]
+
+    # scalars inside and outside of the tabulated energy range
+    cached = weights.CachedFlux(model, rtol=1e-5)
+    for energy in [np.array(1.0), np.array(1e5), np.array(1e12)]:
+        flux = cached.flux(pdgid, energy)
+        assert np.shape(flux) == ()
+        assert np.isclose(flux, model.flux(pdgid, energy), rtol=1e-5, atol=0)
+
+    # models which can't be pickled are only cached in memory
+    model.lock = threading.Lock()
+    cached = weights.CachedFlux(model, rtol=1e-5, disk_cache=True)
+    energy = np.array(1e5)
+    assert np.isclose(cached.flux(pdgid, energy), model.flux(pdgid, energy), rtol=1e-5, atol=0)
+    assert len(list(tmp_path.glob("flux_*.npz"))) == 0